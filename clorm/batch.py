@@ -0,0 +1,158 @@
+#--------------------------------------------------------------------------------
+# Solve many small independent problem instances (each a FactBase combined with
+# a shared ASP encoding) in a pool of worker processes.
+#
+# The instances and the results are passed between processes as JSON (using
+# FactBaseCoder) so the calling process never needs to pass clingo.Symbol
+# objects to or from the workers. Combined with noclingo (see
+# clorm.monkey.noclingo_patch()) the calling process need not create any real
+# clingo symbols, avoiding clingo's inability to release symbol objects. The
+# workers are started with the "spawn" method so they import the real clingo
+# even if the calling process has been patched.
+#
+# Each worker parses the encoding once, when it is started, and re-uses the
+# parsed statements for every instance it solves. A worker is replaced after a
+# fixed number of solves to bound the memory used by the leaked clingo symbols.
+# --------------------------------------------------------------------------------
+
+import multiprocessing
+
+from .json import FactBaseCoder
+
+__all__ = [
+    'BatchSolver'
+    ]
+
+#------------------------------------------------------------------------------
+# Worker process functions. The parsed encoding and the coder are kept in a
+# global for the life of the worker.
+#
+# Note: a multiprocessing.Pool replaces a worker whose initializer raises an
+# exception, so a bad encoding would respawn workers forever. Instead the
+# error is recorded and raised by each task so that it reaches the caller.
+#------------------------------------------------------------------------------
+
+_g_batch_worker = None
+
+def _batch_worker_init(encoding, predicates, args):
+    global _g_batch_worker
+    try:
+        from .clingo import parse_program
+        statements = []
+        parse_program(encoding, lambda stm: statements.append(stm))
+        _g_batch_worker = (statements, FactBaseCoder(predicates), predicates, args)
+    except Exception as e:
+        _g_batch_worker = RuntimeError(("Failed to initialise the batch solver "
+                                        "worker: {}").format(e))
+
+def _batch_worker_solve(instance):
+    if isinstance(_g_batch_worker, Exception): raise _g_batch_worker
+    from .clingo import Control
+    (statements, coder, predicates, args) = _g_batch_worker
+
+    ctrl = Control(args, unifier=predicates)
+    with ctrl.builder() as bldr:
+        for stm in statements: bldr.add(stm)
+    ctrl.add_facts(coder.loads(instance))
+    ctrl.ground([("base",[])])
+
+    # Only the last model is unified (for an optimisation problem this is the
+    # optimal model)
+    last = []
+    def on_model(model):
+        last[:] = [model.facts(atoms=True)]
+    ctrl.solve(on_model=on_model)
+    if not last: return None
+    return coder.dumps(last[0])
+
+#------------------------------------------------------------------------------
+# BatchSolver
+#------------------------------------------------------------------------------
+
+class BatchSolver(object):
+    '''Solve many independent problem instances in a pool of worker processes.
+
+    Each instance is a ``FactBase`` (or a collection of facts) that is combined
+    with a shared ASP encoding and solved by a worker process. The result for
+    an instance is a ``FactBase`` of the atoms of the last model found (the
+    optimal model for an optimisation problem) or ``None`` if the instance is
+    unsatisfiable.
+
+    The workers are re-used across instances (and across ``solve()`` calls)
+    and each worker only parses the encoding once. A worker is replaced after
+    ``max_solves`` instances to bound the memory that is leaked by clingo
+    symbols.
+
+    The predicates (and therefore the modules that define them) must be
+    importable by the worker processes.
+
+    Args:
+      encoding(str): the ASP encoding that is shared by all the instances
+      predicates([Predicate]): the predicates of the instance and result facts
+      args([str]): the clingo command line arguments (Default: [])
+      workers(int): the number of worker processes (Default: the number of CPUs)
+      max_solves(int): the number of instances that a worker solves before it
+         is replaced (Default: 100)
+      chunksize(int): the number of instances sent to a worker at a time
+         (Default: 1)
+
+    '''
+
+    def __init__(self, encoding, predicates, args=[], workers=None,
+                 max_solves=100, chunksize=1):
+        if max_solves is not None and max_solves <= 0:
+            raise ValueError(("The maximum number of solves per worker must be "
+                              "positive but '{}' found").format(max_solves))
+        self._encoding = encoding
+        self._predicates = tuple(predicates)
+        self._args = list(args)
+        self._workers = workers
+        self._max_solves = max_solves
+        self._chunksize = chunksize
+        self._coder = FactBaseCoder(self._predicates)
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            ctx = multiprocessing.get_context("spawn")
+            self._pool = ctx.Pool(
+                processes=self._workers, initializer=_batch_worker_init,
+                initargs=(self._encoding, self._predicates, self._args),
+                maxtasksperchild=self._max_solves)
+        return self._pool
+
+    def solve(self, instances):
+        '''Solve the instances and return an iterator of the results.
+
+        The results are returned in the same order as the instances but are
+        generated as soon as they are available.
+
+        Args:
+          instances: an iterable of ``FactBase`` objects (or collections of facts)
+
+        '''
+        coder = self._coder
+        pool = self._get_pool()
+        # Only the facts are sent since any indexes are of no use to the worker
+        encoded = (coder.dumps(list(inst)) for inst in instances)
+        for result in pool.imap(_batch_worker_solve, encoded, self._chunksize):
+            yield None if result is None else coder.loads(result)
+
+    def close(self):
+        '''Shut down the worker processes.'''
+        if self._pool is None: return
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+#------------------------------------------------------------------------------
+# main
+#------------------------------------------------------------------------------
+if __name__ == "__main__":
+    raise RuntimeError('Cannot run modules')
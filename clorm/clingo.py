@@ -10,9 +10,11 @@ for more details.
 
 import io
 import sys
+import asyncio
 import functools
 import itertools
-from collections.abc import Iterable
+import collections
+from collections.abc import Iterable, Mapping
 from .orm import *
 from .util.wrapper import WrapperMetaClass, init_wrapper
 
@@ -55,6 +57,14 @@ def _check_is_func(obj,name):
                                   "a function '{}()'").format(type(obj),name))
 
 
+# ------------------------------------------------------------------------------
+# The changes between successive models (see Model.facts_delta()). The symbols
+# are the selected symbols of the model and are passed as the previous value to
+# the next facts_delta() call.
+# ------------------------------------------------------------------------------
+
+ModelDelta = collections.namedtuple('ModelDelta', 'added removed symbols')
+
 # ------------------------------------------------------------------------------
 # Wrap clingo.Model and override some functions
 # ------------------------------------------------------------------------------
@@ -75,6 +85,12 @@ class Model(OModel, metaclass=WrapperMetaClass):
         _check_is_func(model,"symbols")
         init_wrapper(self,wrapped_=model)
 
+        # Memoised results of facts() and the unified symbols shared between
+        # them. The model is only valid within the solve callback so the
+        # memoised results can never go stale.
+        self._facts_cache = {}
+        self._facts_memos = {}
+
     #------------------------------------------------------------------------------
     # Return the underlying model object
     #------------------------------------------------------------------------------
@@ -105,6 +121,18 @@ class Model(OModel, metaclass=WrapperMetaClass):
            shown: select all atoms and terms (Default: False)
            raise_on_empty: raise a ValueError if the resulting FactBase is empty
                            (Default: False)
+           lazy: only check the structure of each symbol when unifying and
+                 decode the field values of a fact on first access
+                 (Default: False)
+           workers: if greater than 1 then unify the symbols in parallel using a
+                    pool of this many processes. Only faster for large models
+                    with at least 3 free cores (Default: None)
+
+        The result is memoised for the lifetime of the model, so repeated calls
+        with the same unifier and symbol selection do not re-unify the symbols.
+        Each call returns a new (copy-on-write) FactBase. The symbols are only
+        unified when the FactBase is first used, which is also when any
+        ``raise_on_empty`` error is raised.
 
         '''
         nargs = list(args)
@@ -113,12 +141,81 @@ class Model(OModel, metaclass=WrapperMetaClass):
             raise TypeError("facts() got multiple values for argument 'unifier'")
         if len(nargs) >= 5 and "raise_on_empty" in nkwargs:
             raise TypeError("facts() got multiple values for argument 'raise_on_empty'")
+        if len(nargs) >= 6 and "lazy" in nkwargs:
+            raise TypeError("facts() got multiple values for argument 'lazy'")
 
+        workers = nkwargs.pop("workers",None)
+        lazy = nkwargs.pop("lazy",False)
+        if len(nargs) >= 6: lazy = nargs.pop(5)
         raise_on_empty = nkwargs.pop("raise_on_empty",False)
         if len(nargs) >= 5: raise_on_empty = nargs.pop(4)
         unifier = nkwargs.pop("unifier",None)
         if len(nargs) >= 1: unifier = nargs.pop(0)
 
+        for name, value in zip(("atoms","terms","shown"), nargs):
+            if name in nkwargs:
+                raise TypeError(("facts() got multiple values for argument "
+                                 "'{}'").format(name))
+            nkwargs[name] = value
+
+        if unifier is None: unifier=self._unifier
+        if unifier is None:
+            msg = "Missing a predicate unifier specification in function call " + \
+                "(no default was given at model instantiation)"
+            raise ValueError(msg)
+        ukey = unifier if isinstance(unifier, SymbolPredicateUnifier) else tuple(unifier)
+
+        # The result is memoised for each unifier and symbol selection. The
+        # unified symbols are also shared between the different selections
+        # (eg. "shown" and "atoms") of the same unifier.
+        key = (ukey, lazy, tuple(sorted(k for k,v in nkwargs.items() if v)))
+        fb = self._facts_cache.get(key)
+        if fb is None:
+            unifier=_build_unifier(ukey)
+            memo = self._facts_memos.setdefault((ukey, lazy), {})
+            fb = unifier.unify(
+                symbols=self._wrapped.symbols(**nkwargs),
+                delayed_init=True,
+                lazy=lazy,
+                workers=workers,
+                memo=memo)
+            self._facts_cache[key] = fb
+
+        # Return a delayed (copy-on-write) copy so the caller can modify it
+        # and the symbols are only unified when the FactBase is first used
+        def delayed_copy():
+            if not fb and raise_on_empty:
+                raise ValueError("FactBase creation: failed to unify any symbols")
+            return fb
+        return FactBase(delayed_copy)
+
+    #------------------------------------------------------------------------------
+    # A streaming version of facts()
+    #------------------------------------------------------------------------------
+
+    def facts_iter(self, unifier=None, lazy=False, batch_size=None, **kwargs):
+        '''Returns an iterator of the facts in the model that unify with the
+        SymbolPredicateUnifier.
+
+        Unlike ``facts()`` the facts are generated one at a time (or in per
+        predicate batches) rather than being collected into a FactBase, so a
+        consumer that only aggregates or forwards the facts never has to hold
+        them all in memory.
+
+        Args:
+           unifier(list | SymbolPredicateUnifier): used to unify the symbols
+              (Default: passed via the constructor if specified in the
+              `clorm.clingo.Control` object)
+           lazy: only check the structure of each symbol when unifying and
+                 decode the field values of a fact on first access
+                 (Default: False)
+           batch_size: if specified then generate ``(predicate, facts)`` pairs
+                 where ``facts`` is a list of at most ``batch_size`` facts
+                 (Default: None)
+           kwargs: the symbol selection arguments of ``clingo.Model.symbols``
+                 (``atoms``, ``terms``, ``shown``, ...)
+
+        '''
         if unifier is not None: unifier=_build_unifier(unifier)
         else: unifier=self._unifier
         if unifier is None:
@@ -126,10 +223,61 @@ class Model(OModel, metaclass=WrapperMetaClass):
                 "(no default was given at model instantiation)"
             raise ValueError(msg)
 
-        return unifier.unify(
-            symbols=self._wrapped.symbols(*nargs,**nkwargs),
-            raise_on_empty=raise_on_empty,
-            delayed_init=True)
+        return unifier.unify_iter(self._wrapped.symbols(**kwargs),
+                                  lazy=lazy, batch_size=batch_size)
+
+    #------------------------------------------------------------------------------
+    # The facts that have changed since a previous model
+    #------------------------------------------------------------------------------
+
+    def facts_delta(self, previous=None, unifier=None, lazy=False, **kwargs):
+        '''Returns the changes in the facts of the model relative to a previous
+        model.
+
+        The comparison is made on the symbols of the models and only the
+        symbols that have changed are unified into facts. This is much cheaper
+        than building a FactBase for each model when successive models differ in
+        only a few facts (eg. the models of an optimisation).
+
+        Returns a ``ModelDelta`` named tuple ``(added, removed, symbols)`` where
+        ``added`` and ``removed`` are FactBases of the facts that are new in
+        this model and that are no longer in this model. ``symbols`` is the set
+        of selected symbols of this model and should be passed as ``previous``
+        for the next model (alternatively the ``ModelDelta`` itself can be
+        passed).
+
+        Args:
+           previous: the ``ModelDelta`` (or set of symbols) of the previous model.
+              If None then all the facts of the model are added (Default: None)
+           unifier(list | SymbolPredicateUnifier): used to unify the symbols
+              (Default: passed via the constructor if specified in the
+              `clorm.clingo.Control` object)
+           lazy: only check the structure of each symbol when unifying and
+                 decode the field values of a fact on first access
+                 (Default: False)
+           kwargs: the symbol selection arguments of ``clingo.Model.symbols``
+                 (``atoms``, ``terms``, ``shown``, ...)
+
+        '''
+        if unifier is not None: unifier=_build_unifier(unifier)
+        else: unifier=self._unifier
+        if unifier is None:
+            msg = "Missing a predicate unifier specification in function call " + \
+                "(no default was given at model instantiation)"
+            raise ValueError(msg)
+
+        if isinstance(previous, ModelDelta): previous = previous.symbols
+        current = self._wrapped.symbols(**kwargs)
+        symbols = frozenset(current)
+        if previous is None: previous = frozenset()
+        elif not isinstance(previous, (set, frozenset)): previous = frozenset(previous)
+
+        # Keep the model ordering of the added symbols and sort the removed
+        # symbols so that the output is deterministic
+        added = [ s for s in current if s not in previous ]
+        removed = sorted(previous - symbols)
+        return ModelDelta(unifier.unify(symbols=added, lazy=lazy),
+                          unifier.unify(symbols=removed, lazy=lazy), symbols)
 
     #------------------------------------------------------------------------------
     # Overide contains
@@ -192,6 +340,102 @@ class SolveHandle(OSolveHandle, metaclass=WrapperMetaClass):
     def __exit__(self, exception_type, exception_value, traceback):
         self._wrapped.__exit__(exception_type,exception_value,traceback)
 
+# ------------------------------------------------------------------------------
+# An asyncio interface to an asynchronous (yielding) solve call. Waiting for
+# the next model is run in an executor thread (clingo releases the GIL while
+# waiting) so the event loop is never blocked. Note: a model is only valid until
+# the next model is requested.
+# ------------------------------------------------------------------------------
+
+class AsyncSolveHandle(object):
+    '''Handle for ``clorm.clingo.Control.solve_async`` calls.
+
+    Objects mustn't be created manually. Supports ``async for`` to iterate
+    over the ``clorm.clingo.Model`` objects of the solve call (without
+    blocking the event loop) and ``async with`` to make sure that the solve call
+    is cancelled and the handle closed on leaving the block.
+
+    If the task that is waiting for a model is cancelled then the solve call is
+    also cancelled.
+
+    '''
+
+    def __init__(self, handle, unifier=None):
+        self._handle = handle
+        self._unifier = unifier
+        self._closed = False
+        self._result = None
+
+    @property
+    def solvehandle_(self):
+        '''Access the underlying clingo.SolveHandle object.'''
+        return self._handle
+
+    # Wait (without blocking the event loop) for the solve handle in an executor
+    # thread. The handle can only be closed once the executor thread is no
+    # longer waiting on it. So if the waiting task is cancelled then the solve
+    # call is cancelled and the (shielded) wait is awaited to completion before
+    # the handle is closed and the cancellation re-raised.
+    async def _wait(self):
+        loop = asyncio.get_running_loop()
+        waiting = loop.run_in_executor(None, self._handle.wait)
+        cancelled = None
+        while True:
+            try:
+                await asyncio.shield(waiting)
+                break
+            except asyncio.CancelledError as e:
+                if waiting.cancelled(): raise
+                cancelled = e
+                self._handle.cancel()
+        if cancelled is None: return
+        self._finish()
+        raise cancelled
+
+    # Wait for the next model or the end of the search
+    async def _resume(self):
+        self._handle.resume()
+        if not self._handle.wait(0): await self._wait()
+
+    # The search has finished so keep the result and close the handle
+    def _finish(self):
+        self._result = self._handle.get()
+        self._closed = True
+        self._handle.__exit__(None, None, None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed: raise StopAsyncIteration
+        await self._resume()
+        model = self._handle.model()
+        if model is None:
+            self._finish()
+            raise StopAsyncIteration
+        return Model(model, unifier=self._unifier)
+
+    async def get(self):
+        '''Wait for the solve call to finish (skipping any remaining models) and
+        return the ``clingo.SolveResult``.'''
+        while not self._closed:
+            await self._resume()
+            if self._handle.model() is None: self._finish()
+        return self._result
+
+    def cancel(self):
+        '''Cancel the running solve call.'''
+        if not self._closed: self._handle.cancel()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, traceback):
+        if self._closed: return
+        self._handle.cancel()
+        if not self._handle.wait(0): await self._wait()
+        self._finish()
+
 # ------------------------------------------------------------------------------
 # Wrap clingo.Control and override some functions
 # ------------------------------------------------------------------------------
@@ -232,6 +476,74 @@ def _expand_assumptions(assumptions):
     neg = [ (raw,False) for raw in neg_assump ]
     return list(itertools.chain(pos,neg))
 
+# ------------------------------------------------------------------------------
+# Strategies for adding facts to a clingo.Control object (see
+# Control.add_facts()):
+#
+# - "ast": build an AST rule for each fact (all sharing the same location) and
+#   add it with a program builder. Low overhead for a small number of facts.
+# - "text": generate the ASP text of the facts (in chunks) and add it with
+#   clingo.Control.add(). Parsing the text in clingo is much faster than
+#   building the AST in Python for a large number of facts.
+# - "backend": add the facts directly as rules using the clingo backend. This is
+#   the fastest method but the facts are added immediately rather than being
+#   part of the "base" program part so it is never chosen automatically.
+#
+# If no method is given then "ast" is used for fewer than
+# ADD_FACTS_TEXT_THRESHOLD facts and "text" otherwise (or if the number of facts
+# is unknown).
+# ------------------------------------------------------------------------------
+
+ADD_FACTS_TEXT_THRESHOLD = 1000
+_ADD_FACTS_TEXT_CHUNK = 100000
+
+def _raw(fact):
+    return fact.raw if isinstance(fact,Predicate) else fact
+
+def _add_facts_ast(ctrl, facts):
+    floc = { "filename" : "<input>", "line" : 1 , "column" : 1 }
+    location = { "begin" : floc, "end" : floc }
+    nosign = ast.Sign.NoSign
+    with ctrl.builder() as bldr:
+        for f in facts:
+            atom = ast.SymbolicAtom(ast.Symbol(location,_raw(f)))
+            bldr.add(ast.Rule(location, ast.Literal(location, nosign, atom), []))
+
+def _add_facts_text(ctrl, facts):
+    if isinstance(facts, FactBase):
+        ctrl.add("base", [], facts.asp_str())
+        return
+    it = iter(facts)
+    while True:
+        chunk = [ "{}.\n".format(_raw(f))
+                  for f in itertools.islice(it, _ADD_FACTS_TEXT_CHUNK) ]
+        if not chunk: return
+        ctrl.add("base", [], "".join(chunk))
+
+def _add_facts_backend(ctrl, facts):
+    with ctrl.backend() as bknd:
+        for f in facts: bknd.add_rule([bknd.add_atom(_raw(f))])
+
+_add_facts_methods = {
+    "ast" : _add_facts_ast,
+    "text" : _add_facts_text,
+    "backend" : _add_facts_backend }
+
+def _choose_add_facts_method(facts):
+    try:
+        if len(facts) < ADD_FACTS_TEXT_THRESHOLD: return "ast"
+    except TypeError:
+        pass
+    return "text"
+
+# ------------------------------------------------------------------------------
+# The name of the solve() parameter for an asynchronous solve call
+# ------------------------------------------------------------------------------
+
+def _async_keyword():
+    if oclingo.__version__ > '5.3.1': return "async_"
+    return "async"
+
 # ------------------------------------------------------------------------------
 # Control class
 # ------------------------------------------------------------------------------
@@ -253,6 +565,7 @@ class Control(OControl, metaclass=WrapperMetaClass):
 
     def __init__(self, *args, **kwargs):
         self._unifier = None
+        self._external_literals = {}
         if "unifier" in kwargs: self._unifier = _build_unifier(kwargs["unifier"])
 
         # Do we need to build a clingo.Control object or use an existing one. If
@@ -296,7 +609,7 @@ class Control(OControl, metaclass=WrapperMetaClass):
     #------------------------------------------------------------------------------
     # A new function to add facts from a factbase or a list of facts
     #------------------------------------------------------------------------------
-    def add_facts(self, facts):
+    def add_facts(self, facts, method=None):
         '''Add facts to the control object. Note: facts must be added before grounding.
 
            This function can take an arbitrary collection containing a mixture
@@ -304,37 +617,27 @@ class Control(OControl, metaclass=WrapperMetaClass):
            ``clorm.FactBase`` is also a valid collection but it can only contain
            ``clorm.Predicate`` instances.
 
+           The facts can be added by generating an Abstract Syntax Tree (AST)
+           for each fact (``"ast"``), by generating the ASP text for the facts
+           (``"text"``), or directly through the clingo backend
+           (``"backend"``). Generating the text is much faster than the AST for
+           a large number of facts. The backend is faster still but the facts
+           are added immediately rather than as part of the ``"base"`` program
+           part, so they are not affected by which program parts are grounded.
+
         Args:
           facts: a collection of ``clorm.Predicate`` or ``clingo.Symbol`` objects
+          method: one of ``"ast"``, ``"text"``, or ``"backend"``. If not specified
+                  then ``"ast"`` is used for a small number of facts and
+                  ``"text"`` otherwise (Default: None)
 
         '''
-
-        # Facts are added by manually generating Abstract Syntax Tree (AST)
-        # elements for each fact and calling Control.add().
-        line = 1
-        with self._wrapped.builder() as bldr:
-            for f in facts:
-                raw=f.raw if isinstance(f,Predicate) else f
-                floc = { "filename" : "<input>", "line" : line , "column" : 1 }
-                location = { "begin" : floc, "end" : floc }
-                r = ast.Rule(location,
-                             ast.Literal(location, ast.Sign.NoSign,
-                                         ast.SymbolicAtom(ast.Symbol(location,raw))),
-                             [])
-                bldr.add(r)
-                line += 1
-        return
-
-#        # I THINK THE FOLLOWING IS ACTUALLY OK NOW - MAYBE THERE WERE SUBTLE ISSUES WITH
-#        # PREVIOUS VERSIONS OF CLINGO BUT THESE HAVE BEEN RESOLVED.
-#
-#        # DON'T USE BACKEND - COULD CAUSE UNEXPECTED INTERACTION BETWEEN GROUNDER AND SOLVER
-#        with self._wrapped.backend() as bknd:
-#            for f in facts:
-#                raw=f.raw if isinstance(f,Predicate) else f
-#                atm = bknd.add_atom(raw)
-#                bknd.add_rule([atm])
-#        return
+        if method is None: method = _choose_add_facts_method(facts)
+        add = _add_facts_methods.get(method)
+        if add is None:
+            raise ValueError(("Unknown add_facts() method '{}': expecting one of "
+                              "{}").format(method, sorted(_add_facts_methods)))
+        add(self._wrapped, facts)
 
     #------------------------------------------------------------------------------
     # Overide assign_external to deal with Predicate object and a Clingo Symbol
@@ -349,16 +652,48 @@ class Control(OControl, metaclass=WrapperMetaClass):
         This function extends ``clingo.Control.release_external``.
 
         '''
-        def _assign_fact(fact):
-            if isinstance(fact, Predicate):
-                self._wrapped.assign_external(fact.raw, truth)
-            else:
-                self._wrapped.assign_external(fact, truth)
-
+        assign = self._wrapped.assign_external
+        literal = self._external_literal
         if isinstance(external, Iterable):
-            for f in external: _assign_fact(f)
+            for f in external: assign(literal(f), truth)
         else:
-            _assign_fact(external)
+            assign(literal(external), truth)
+
+    #------------------------------------------------------------------------------
+    # Assign the truth values of many externals in one call
+    #------------------------------------------------------------------------------
+    def assign_externals(self, assignments):
+        '''Assign truth values to a collection of external facts.
+
+        The assignments are either a mapping from facts to truth values or an
+        iterable of (fact, truth value) pairs. A fact can be a raw clingo.Symbol
+        object, a clorm.Predicate instance, or a program literal (an int).
+
+        Like ``assign_external()`` the program literal of each external fact is
+        looked up once and cached so toggling the same externals in each step of
+        a multi-shot solve doesn't repeatedly resolve the symbols.
+
+        '''
+        if isinstance(assignments, Mapping): assignments = assignments.items()
+        assign = self._wrapped.assign_external
+        literal = self._external_literal
+        for f, truth in assignments: assign(literal(f), truth)
+
+    #------------------------------------------------------------------------------
+    # Internal function to map an external fact to its program literal. The
+    # literal is looked up (through symbolic_atoms) once and then cached. The
+    # symbol is returned if there is no corresponding external atom (eg. it has
+    # not been grounded yet).
+    #------------------------------------------------------------------------------
+    def _external_literal(self, fact):
+        if isinstance(fact, int): return fact
+        raw = fact.raw if isinstance(fact, Predicate) else fact
+        lit = self._external_literals.get(raw)
+        if lit is not None: return lit
+        atom = self._wrapped.symbolic_atoms[raw]
+        if atom is None or not atom.is_external: return raw
+        self._external_literals[raw] = lit = atom.literal
+        return lit
 
     #------------------------------------------------------------------------------
     # Overide release_external to deal with Predicate object and a Clingo Symbol
@@ -374,10 +709,10 @@ class Control(OControl, metaclass=WrapperMetaClass):
 
         '''
         def _release_fact(fact):
-            if isinstance(fact, Predicate):
-                self._wrapped.release_external(fact.raw)
-            else:
-                self._wrapped.release_external(fact)
+            self._wrapped.release_external(self._external_literal(fact))
+            if isinstance(fact, int): return
+            raw = fact.raw if isinstance(fact, Predicate) else fact
+            self._external_literals.pop(raw, None)
 
         if isinstance(external, Iterable):
             for f in external: _release_fact(f)
@@ -411,8 +746,7 @@ class Control(OControl, metaclass=WrapperMetaClass):
         # Build the list of valid arguments; using the correct "async" or
         # "async_" parameter based on the clingo version.  Note: "async" is a
         # keyword for Python 3.7+.
-        async_keyword="async"
-        if oclingo.__version__ > '5.3.1': async_keyword="async_"
+        async_keyword=_async_keyword()
 
         posnargs = ["assumptions","on_model","on_statistics",
                     "on_finish","yield_",async_keyword]
@@ -457,6 +791,39 @@ class Control(OControl, metaclass=WrapperMetaClass):
         else:
             return result
 
+    #---------------------------------------------------------------------------
+    # An asyncio version of a yielding solve call
+    # ---------------------------------------------------------------------------
+    def solve_async(self, assumptions=[], on_statistics=None, on_finish=None):
+        '''Run the clingo solver in the background for use with ``asyncio``.
+
+        Returns a ``clorm.clingo.AsyncSolveHandle`` that asynchronously
+        iterates over the ``clorm.clingo.Model`` objects of the solve call
+        without blocking the event loop. For example:
+
+        .. code-block:: python
+
+           async with ctrl.solve_async() as handle:
+               async for model in handle:
+                   ...
+               result = await handle.get()
+
+        Leaving the ``async with`` block (or cancelling the task that is waiting
+        for a model) cancels the solve call.
+
+        Args:
+           assumptions: a list of assumptions (see ``solve()``)
+           on_statistics: optional callback to update the statistics
+           on_finish: optional callback called with the ``clingo.SolveResult``
+              once the search has finished
+
+        '''
+        nkwargs = { "assumptions" : _expand_assumptions(assumptions),
+                    "yield_" : True, _async_keyword() : True }
+        if on_statistics is not None: nkwargs["on_statistics"] = on_statistics
+        if on_finish is not None: nkwargs["on_finish"] = on_finish
+        return AsyncSolveHandle(self._wrapped.solve(**nkwargs), self._unifier)
+
 
 #------------------------------------------------------------------------------
 # This is probably bad practice... Modify the original clingo docstrings so that
@@ -83,6 +83,17 @@ def symbol_decoder(obj):
     # A bad encoding?
     return obj
 
+#------------------------------------------------------------------------------
+# A FactBase index is encoded as its list of paths (a single path for a simple
+# index or multiple paths for a composite index), where each path is a list of
+# the predicate name and field names, together with the index kind.
+#------------------------------------------------------------------------------
+
+def _index_encoder(spec):
+    (pth, kind) = spec
+    paths = pth if isinstance(pth, tuple) else (pth,)
+    return { "paths" : [ str(p).split('.') for p in paths ], "kind" : kind }
+
 #------------------------------------------------------------------------------
 #
 #------------------------------------------------------------------------------
@@ -137,8 +148,10 @@ class FactBaseCoder(object):
         '''
         if isinstance(obj, clingo.Symbol): return symbol_encoder(obj)
         if isinstance(obj, FactBase):
+            obj._check_init() # Check for delayed init
+            indexes = [ _index_encoder(spec) for spec in obj._indexspecs ]
             return {
-                "clorm.FactBase" : [ str(fp) for fp in obj.indexes ],
+                "clorm.FactBase" : indexes,
                 "facts" : [ self.encoder(fct) for fct in obj] }
         for p in self._preds:
             if isinstance(obj, p):
@@ -166,18 +179,7 @@ class FactBaseCoder(object):
         if not isinstance(obj, Mapping): return obj
         if "clingo.SymbolType" in obj: return symbol_decoder(obj)
         if "clorm.FactBase" in obj and "facts" in obj:
-            indexes = []
-            for fname in obj["clorm.FactBase"]:
-                fs = fname.split('.')
-                if len(fs) < 2:
-                    raise ValueError(("Expecting a field '.' split for index "
-                                      "{}").format(fs))
-                if fs[0] not in self._name2pred:
-                    raise ValueError(("Unrecognised predicate name {} not one "
-                                      "of {}").format(fs, self._name2pred.keys()))
-                ppath = path(self._name2pred[fs[0]])
-                for key in fs[1:]: ppath = ppath[key]
-                indexes.append(ppath)
+            indexes = [ self._index_decoder(idx) for idx in obj["clorm.FactBase"] ]
             facts = [ self.decoder(f) for f in obj["facts"] ]
             return FactBase(facts=facts, indexes=indexes)
         if not "clorm.Predicate" in obj: return obj
@@ -185,6 +187,27 @@ class FactBaseCoder(object):
         if pname not in self._name2pred: return obj
         return self._name2pred[pname](raw=symbol_decoder(obj["raw"]))
 
+    # An index is either a list of paths and an index kind (see
+    # _index_encoder()) or a path string (the older format).
+    def _index_decoder(self, idx):
+        def decode_path(names):
+            if names[0] not in self._name2pred:
+                raise ValueError(("Unrecognised predicate name {} not one "
+                                  "of {}").format(names, self._name2pred.keys()))
+            ppath = path(self._name2pred[names[0]])
+            for key in names[1:]: ppath = ppath[key]
+            return ppath
+
+        if isinstance(idx, str):
+            fs = idx.split('.')
+            if len(fs) < 2:
+                raise ValueError(("Expecting a field '.' split for index "
+                                  "{}").format(fs))
+            return decode_path(fs)
+        paths = [ decode_path(names) for names in idx["paths"] ]
+        pth = paths[0] if len(paths) == 1 else tuple(paths)
+        return (pth, idx["kind"])
+
     #-------------------------------------------------------------------------
     # Convenience functions to call the JSON encoder and decoder
     #-------------------------------------------------------------------------
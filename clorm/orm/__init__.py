@@ -27,6 +27,7 @@ __all__ = [
     'define_nested_list_field',
     'simple_predicate',
     'unify',
+    'unify_iter',
     'path',
     'hashable_path',
     'alias',
@@ -44,6 +45,7 @@ __all__ = [
     'joinall_',
     'basic_join_order',
     'oppref_join_order',
+    'cost_join_order',
     'make_function_asp_callable',
     'make_method_asp_callable'
     ]
@@ -437,6 +437,13 @@ class PredicatePath(object, metaclass=_PredicatePathMeta):
         def attrgetter(self):
             return self._parent._attrgetter
 
+        # --------------------------------------------------------------------------
+        # The sequence of attribute names that resolve the path from a fact
+        # --------------------------------------------------------------------------
+        @property
+        def attrnames(self):
+            return self._parent._pathseq[1:]
+
         # --------------------------------------------------------------------------
         # Is this a root path (ie. the path corresponds to a predicate definition)
         # --------------------------------------------------------------------------
@@ -796,6 +803,10 @@ def _rfm_constructor(self, *args, **kwargs):
     if "index" in kwargs: self._index = kwargs["index"]
     elif len(args) > 1: self._index = args[1]
     else: self._index=False
+    if isinstance(self._index, str) and self._index not in ("sorted", "hash"):
+        raise TypeError(("Invalid index type \"{}\" for {}: expecting a bool, "
+                         "\"sorted\" or \"hash\"").format(self._index,
+                                                        type(self).__name__))
 
     if not self._default[0]: return
     dval = self._default[1]
@@ -927,8 +938,11 @@ class RawField(object, metaclass=_RawFieldMeta):
        specified (i.e., a function or functor) then it will be called (with no
        arguments) when the predicate/complex-term object is instantiated.
 
-      index (bool): Determine if this field should be indexed by default in a
-        ``FactBase```. Defaults to ``False``.
+      index (bool | str): Determine if this field should be indexed by default
+        in a ``FactBase```. ``True`` (or ``"sorted"``) creates an index that
+        supports all comparison operators, while ``"hash"`` creates a cheaper
+        index that is only used for equality (``==``) lookups. Defaults to
+        ``False``.
 
     """
 
@@ -1387,14 +1401,20 @@ class FieldAccessor(object):
         self._parent_cls = pc
 
     def __get__(self, instance, owner=None):
-        if not instance:
+        if instance is None:
             # Return the PredicatePath object corresponding to this field
             return self.parent.meta.path[self._index]
 
         if not isinstance(instance, self._parent_cls):
             raise TypeError(("field {} doesn't match type "
                              "{}").format(self, type(instance).__name__))
-        return instance._field_values[self._index]
+        v = instance._field_values[self._index]
+        if v is not _undecoded: return v
+
+        # A lazily unified fact so decode the field on first access
+        v = self._defn.cltopy(instance._raw.arguments[self._index])
+        instance._field_values[self._index] = v
+        return v
 
     def __set__(self, instance, value):
         raise AttributeError(("Cannot modify {}.{}: field values are "
@@ -1795,6 +1815,263 @@ def _predicate_constructor(self, *args, **kwargs):
 def _predicate_base_constructor(self, *args, **kwargs):
     raise TypeError(("Predicate/ComplexTerm must be sub-classed"))
 
+# ------------------------------------------------------------------------------
+# Generate a specialised constructor and raw unification function for a
+# Predicate sub-class. The generic constructor above has to deal with every
+# combination of arguments and loops over the fields calling
+# _preprocess_field_value() and the chained pytocl()/cltopy() functions for
+# each one. But the fields are fixed when the class is created, so (similar to
+# the way collections.namedtuple works) we generate Python code that unrolls the
+# per-field conversions for the two common cases: creating a fact from
+# positional arguments and unifying a fact with a raw clingo.Symbol. Any other
+# combination of arguments falls back to the generic constructor.
+#
+# Only the exact StringField and IntegerField classes have their conversion
+# inlined. Sub-classes (and all other fields) go through the field's own
+# pytocl()/cltopy() functions so that user defined conversions are respected.
+# ------------------------------------------------------------------------------
+
+def _generate_predicate_functions(cls):
+    md = cls.meta
+    arity = len(md)
+    fields = [ f.defn for f in md ]
+
+    gbls = {
+        "_Function": clingo.Function,
+        "_FunctionType": clingo.SymbolType.Function,
+        "_NumberType": clingo.SymbolType.Number,
+        "_StringType": clingo.SymbolType.String,
+        "_generic_init": _predicate_constructor,
+        "_preprocess": _preprocess_field_value,
+        "_new": object.__new__,
+        "_name": md.name,
+        "_sign": md.sign,
+        "_cls": cls,
+    }
+
+    # Setup the per-field conversion functions
+    for idx, fd in enumerate(fields):
+        gbls["_fd{}".format(idx)] = fd
+        if type(fd) is IntegerField: gbls["_pytocl{}".format(idx)] = clingo.Number
+        elif type(fd) is StringField: gbls["_pytocl{}".format(idx)] = clingo.String
+        else: gbls["_pytocl{}".format(idx)] = fd.pytocl
+
+        ct = fd.complex
+        if ct is not None and type(fd) is ct.Field:
+            gbls["_cltopy{}".format(idx)] = ct._from_raw
+        else:
+            gbls["_cltopy{}".format(idx)] = fd.cltopy
+
+    hashexp = "hash(fvs)" if md.is_tuple else "hash(raw)"
+    vs = ", ".join(["v{}".format(i) for i in range(arity)])
+    fvs = "(" + "".join(["v{}, ".format(i) for i in range(arity)]) + ")"
+    pytocls = "(" + "".join(["_pytocl{0}(v{0}), ".format(i) for i in range(arity)]) + ")"
+
+    # The constructor fast path for positional arguments
+    lines = []
+    lines.append("def __init__(self, *args, **kwargs):")
+    lines.append("    if len(args) == {} and (not kwargs or (len(kwargs) == 1 "
+                 "and 'sign' in kwargs)):".format(arity))
+    if arity: lines.append("        {}, = args".format(vs))
+    for idx, fd in enumerate(fields):
+        if fd.complex is not None:
+            lines.append("        v{0} = _preprocess(_fd{0}, v{0})".format(idx))
+    lines.append("        sign = bool(kwargs['sign']) if kwargs else True")
+    if md.sign is not None:
+        lines.append("        if sign != _sign:")
+        lines.append("            raise ValueError(('Predicate {} is defined to only "
+                     "allow {} instances').format(_cls.__name__, _sign))")
+    lines.append("        self._field_values = fvs = {}".format(fvs))
+    lines.append("        self._raw = raw = _Function(_name, {}, sign)".format(pytocls))
+    lines.append("        self._hash = {}".format(hashexp))
+    lines.append("    elif not args and len(kwargs) == 1 and 'raw' in kwargs:")
+    lines.append("        _init_by_raw(self, kwargs['raw'])")
+    lines.append("    else:")
+    lines.append("        _generic_init(self, *args, **kwargs)")
+    lines.append("")
+
+    # Unifying against a raw symbol
+    lines.append("def _init_by_raw(self, raw):")
+    lines.append("    self._raw = raw")
+    lines.append("    try:")
+    lines.append("        if raw.type != _FunctionType: raise ValueError()")
+    lines.append("        if raw.name != _name: raise ValueError()")
+    lines.append("        rargs = raw.arguments")
+    lines.append("        if len(rargs) != {}: raise ValueError()".format(arity))
+    if md.sign is not None:
+        lines.append("        if raw.positive != _sign: raise ValueError()")
+    for idx, fd in enumerate(fields):
+        if type(fd) is IntegerField:
+            lines.append("        a = rargs[{}]".format(idx))
+            lines.append("        if a.type != _NumberType: raise TypeError()")
+            lines.append("        v{} = a.number".format(idx))
+        elif type(fd) is StringField:
+            lines.append("        a = rargs[{}]".format(idx))
+            lines.append("        if a.type != _StringType: raise TypeError()")
+            lines.append("        v{} = a.string".format(idx))
+        else:
+            lines.append("        v{0} = _cltopy{0}(rargs[{0}])".format(idx))
+    lines.append("        self._field_values = fvs = {}".format(fvs))
+    lines.append("    except (TypeError, ValueError):")
+    lines.append("        raise ValueError(('Failed to unify clingo.Symbol object {} "
+                 "with Predicate class {}').format(raw, _cls.__name__))")
+    lines.append("    self._hash = {}".format(hashexp))
+    lines.append("")
+    lines.append("def _from_raw(cls, raw):")
+    lines.append("    self = _new(cls)")
+    lines.append("    _init_by_raw(self, raw)")
+    lines.append("    return self")
+    lines.append("")
+
+    # Build from the arguments of a raw symbol that has already passed the
+    # structural checks of the class (see _predicate_argument_checks())
+    lines.append("def _from_checked_args(cls, raw, rargs):")
+    lines.append("    self = _new(cls)")
+    lines.append("    self._raw = raw")
+    for idx, fd in enumerate(fields):
+        if type(fd) is IntegerField:
+            lines.append("    v{0} = rargs[{0}].number".format(idx))
+        elif type(fd) is StringField:
+            lines.append("    v{0} = rargs[{0}].string".format(idx))
+        else:
+            lines.append("    v{0} = _cltopy{0}(rargs[{0}])".format(idx))
+    lines.append("    self._field_values = fvs = {}".format(fvs))
+    lines.append("    self._hash = {}".format(hashexp))
+    lines.append("    return self")
+
+    exec("\n".join(lines), gbls)
+    return (gbls["__init__"], gbls["_from_raw"], gbls["_from_checked_args"])
+
+#------------------------------------------------------------------------------
+# Lazy unification support. A fact unified lazily only checks the structure of
+# the raw symbol (the name, arity, sign and the symbol type of each argument)
+# and leaves its field values undecoded until they are accessed through the
+# FieldAccessor. This is only possible for fields where a structural check can
+# decide whether the conversion will succeed; the remaining fields (eg. fields
+# with user defined cltopy() functions) are decoded eagerly so that lazy and
+# non-lazy unification always accept the same symbols.
+# ------------------------------------------------------------------------------
+
+_undecoded = object()
+
+# Return a function that tests whether a raw symbol will unify with the field
+# or None if the field has no cheap structural test.
+def _field_symbol_check(fd):
+    ftype = type(fd)
+    if ftype is RawField: return lambda raw: True
+    if ftype is IntegerField:
+        return lambda raw: raw.type == clingo.SymbolType.Number
+    if ftype is StringField:
+        return lambda raw: raw.type == clingo.SymbolType.String
+    if ftype is ConstantField:
+        return lambda raw: (raw.type == clingo.SymbolType.Function and
+                            bool(raw.name) and not raw.arguments)
+    if ftype is SimpleField:
+        def _check(raw):
+            rtype = raw.type
+            if rtype == clingo.SymbolType.Function:
+                return raw.positive and not raw.arguments
+            return (rtype == clingo.SymbolType.Number or
+                    rtype == clingo.SymbolType.String)
+        return _check
+    ct = fd.complex
+    if ct is not None and ftype is ct.Field: return ct._symbol_check
+    return None
+
+# Return a tuple of the structural tests for each argument of the Predicate
+# sub-class or None if one of the fields has no structural test.
+def _predicate_argument_checks(cls):
+    checks = tuple(_field_symbol_check(f.defn) for f in cls.meta)
+    if any(c is None for c in checks): return None
+    return checks
+
+# Return a function that tests whether a raw symbol will unify with the
+# Predicate sub-class or None if one of the fields has no structural test.
+def _predicate_symbol_check(cls):
+    md = cls.meta
+    name = md.name
+    sign = md.sign
+    arity = len(md)
+    checks = cls._argument_checks
+    if checks is None: return None
+    checks = tuple(enumerate(checks))
+
+    def _check(raw):
+        if raw.type != clingo.SymbolType.Function: return False
+        if raw.name != name: return False
+        rargs = raw.arguments
+        if len(rargs) != arity: return False
+        if sign is not None and raw.positive != sign: return False
+        for idx, check in checks:
+            if not check(rargs[idx]): return False
+        return True
+    return _check
+
+def _from_checked_args_lazy(cls, raw, rargs):
+    self = object.__new__(cls)
+    self._raw = raw
+    self._field_values = [_undecoded]*len(rargs)
+    self._hash = hash(raw)
+    return self
+
+def _generate_predicate_lazy_from_raw(cls):
+    md = cls.meta
+    if md.is_tuple: return cls._from_raw.__func__
+
+    gbls = {
+        "_FunctionType": clingo.SymbolType.Function,
+        "_NumberType": clingo.SymbolType.Number,
+        "_StringType": clingo.SymbolType.String,
+        "_undecoded": _undecoded,
+        "_new": object.__new__,
+        "_name": md.name,
+        "_sign": md.sign,
+        "_cls": cls,
+    }
+
+    lines = []
+    lines.append("def _from_raw_lazy(cls, raw):")
+    lines.append("    self = _new(cls)")
+    lines.append("    self._raw = raw")
+    lines.append("    try:")
+    lines.append("        if raw.type != _FunctionType: raise ValueError()")
+    lines.append("        if raw.name != _name: raise ValueError()")
+    lines.append("        rargs = raw.arguments")
+    lines.append("        if len(rargs) != {}: raise ValueError()".format(len(md)))
+    if md.sign is not None:
+        lines.append("        if raw.positive != _sign: raise ValueError()")
+    fvs = []
+    for f in md:
+        idx = f.index
+        if type(f.defn) is IntegerField:
+            lines.append("        if rargs[{}].type != _NumberType: "
+                         "raise TypeError()".format(idx))
+            fvs.append("_undecoded")
+        elif type(f.defn) is StringField:
+            lines.append("        if rargs[{}].type != _StringType: "
+                         "raise TypeError()".format(idx))
+            fvs.append("_undecoded")
+        else:
+            check = _field_symbol_check(f.defn)
+            if check is None:
+                gbls["_cltopy{}".format(idx)] = f.defn.cltopy
+                lines.append("        v{0} = _cltopy{0}(rargs[{0}])".format(idx))
+                fvs.append("v{}".format(idx))
+            else:
+                gbls["_check{}".format(idx)] = check
+                lines.append("        if not _check{0}(rargs[{0}]): "
+                             "raise TypeError()".format(idx))
+                fvs.append("_undecoded")
+    lines.append("        self._field_values = [{}]".format(", ".join(fvs)))
+    lines.append("    except (TypeError, ValueError):")
+    lines.append("        raise ValueError(('Failed to unify clingo.Symbol object {} "
+                 "with Predicate class {}').format(raw, _cls.__name__))")
+    lines.append("    self._hash = hash(raw)")
+    lines.append("    return self")
+
+    exec("\n".join(lines), gbls)
+    return gbls["_from_raw_lazy"]
+
 #------------------------------------------------------------------------------
 # Metaclass constructor support functions to create the fields
 #------------------------------------------------------------------------------
@@ -1955,7 +2232,7 @@ def _define_field_for_predicate(cls):
         raise TypeError("Value {} ({}) is not an instance of {}".format(v,type(v),cls))
 
     def _cltopy(v):
-        return cls(raw=v)
+        return cls._from_raw(v)
 
     field = type(field_name, (RawField,),
                  { "pytocl": _pytocl, "cltopy": _cltopy,
@@ -2011,6 +2288,18 @@ class _PredicateMeta(type):
         # Assign the parent for the SignAccessor
         dct["sign"].parent = cls
 
+        # Replace the generic constructor with a specialised version
+        (init, from_raw, from_args) = _generate_predicate_functions(cls)
+        cls.__init__ = init
+        cls._from_raw = classmethod(from_raw)
+        cls._from_checked_args = classmethod(from_args)
+        cls._from_raw_lazy = classmethod(_generate_predicate_lazy_from_raw(cls))
+        cls._from_checked_args_lazy = cls._from_checked_args if md.is_tuple \
+            else classmethod(_from_checked_args_lazy)
+        cls._argument_checks = _predicate_argument_checks(cls)
+        check = _predicate_symbol_check(cls)
+        cls._symbol_check = staticmethod(check) if check else None
+
         return super(_PredicateMeta, cls).__init__(name, bases, dct)
 
     # A Predicate subclass is an instance of this meta class. So to
@@ -2121,8 +2410,8 @@ class Predicate(object, metaclass=_PredicateMeta):
             if field.name in kwargs:
                 cloneargs[field.name] = kwargs[field.name]
             else:
-                cloneargs[field.name] = self._field_values[field.index]
-                kwargs[field.name] = self._field_values[field.index]
+                cloneargs[field.name] = field.__get__(self)
+                kwargs[field.name] = cloneargs[field.name]
 
         # Create the new object
         return type(self)(**cloneargs)
@@ -2156,7 +2445,7 @@ class Predicate(object, metaclass=_PredicateMeta):
     # Factory that returns a unified Predicate object
     @classmethod
     def _unify(cls, raw):
-        return cls(raw=raw)
+        return cls._from_raw(raw)
 
     #--------------------------------------------------------------------------
     # Overloaded index operator to access the values and len operator
@@ -2171,6 +2460,14 @@ class Predicate(object, metaclass=_PredicateMeta):
         """Allows for index based access to field elements."""
         return self.meta[idx].__get__(self)
 
+    # Pickling and copying. A lazily unified fact has undecoded fields that are
+    # marked by a module level sentinel that doesn't survive pickling, so all
+    # the fields are decoded.
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_field_values"] = tuple(self)
+        return state
+
     def __bool__(self):
         '''Behaves like a tuple: returns False if the predicate/complex-term has no elements'''
         return len(self.meta) > 0
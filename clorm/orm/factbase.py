@@ -11,6 +11,7 @@ import inspect
 import abc
 import functools
 import itertools
+import copy
 
 from .core import *
 from .core import get_field_definition, PredicatePath, kwargs_check_keys, \
@@ -21,9 +22,11 @@ from .query import *
 from .query import Placeholder, OrderBy, desc, asc
 
 from .query import process_where, process_join, process_orderby, \
-    make_query_plan, QuerySpec, QueryExecutor
+    make_query_plan, make_cached_query_plan, factset_size_signature, \
+    make_query, placeholder_value, QuerySpec, QueryExecutor, QueryResultCache
 
-from .factcontainers import FactSet, FactIndex, FactMap, factset_equality
+from .factcontainers import FactSet, FactIndex, FactMap, FactSetDifference, \
+    factset_equality, index_spec, index_paths
 
 __all__ = [
     'FactBase',
@@ -80,7 +83,19 @@ class FactBase(object):
          facts. If a functor is passed then the fact base performs a delayed
          initialisation. If a fact base is passed and no index is specified then
          an index will be created matching in input fact base.
-      indexes(Field): a list of fields that are to be indexed.
+      indexes(Field): a list of fields that are to be indexed. A field can also
+         be specified as a ``(field, kind)`` pair where ``kind`` is ``"sorted"``
+         (the default) or ``"hash"``. A hash index is cheaper to maintain but
+         is only used for equality (``==``) lookups. A tuple of fields (of the
+         same predicate) creates a composite index, which is used for queries
+         with equality tests on a prefix of the fields (optionally followed by
+         a range test on the next field).
+      columnar([Predicate]): a list of predicate types to store in columnar
+         form. The fields of these predicates must all be ``IntegerField``,
+         ``StringField``, or ``ConstantField``. Columnar storage uses much less
+         memory than storing the fact objects, and where clauses that compare
+         fields are evaluated directly on the columns, but the fact objects are
+         re-created each time they are retrieved.
 
     """
 
@@ -89,28 +104,45 @@ class FactBase(object):
     #--------------------------------------------------------------------------
 
     # A special purpose initialiser so that we can delayed initialisation
-    def _init(self, facts=None, indexes=None):
+    def _init(self, facts=None, indexes=None, columnar=None):
 
         # flag that initialisation has taken place
         self._delayed_init = None
 
-        # If it is delayed initialisation then get the facts
+        # If it is delayed initialisation then get the facts. A FactBase with
+        # the same indexes and columnar storage (ie. none were specified) can
+        # share its facts (copy-on-write) rather than adding each fact.
         if facts and callable(facts):
             facts = facts()
-        elif facts and isinstance(facts, FactBase) and indexes is None:
-            indexes = facts.indexes
+        share = False
+        if isinstance(facts, FactBase):
+            facts._check_init()
+            share = indexes is None and columnar is None
+            if indexes is None: indexes = facts._indexspecs
+            if columnar is None: columnar = facts._columnar
         if indexes is None: indexes=[]
+        if columnar is None: columnar=[]
 
-        # Create FactMaps for the predicate types with indexed fields
+        # Create FactMaps for the predicate types with indexed fields. An index
+        # is specified as a path or a (path, kind) pair (see index_spec()).
         grouped = {}
 
-        self._indexes = tuple(indexes)
-        for path in self._indexes:
-            if path.meta.predicate not in grouped: grouped[path.meta.predicate] = []
-            grouped[path.meta.predicate].append(path)
-        self._factmaps = { pt : FactMap(pt, idxs) for pt, idxs in grouped.items() }
+        self._indexspecs = tuple([index_spec(idx) for idx in indexes])
+        self._indexes = tuple([p for p, _ in self._indexspecs])
+        for spec in self._indexspecs:
+            pt = index_paths(spec[0])[0].meta.predicate
+            if pt not in grouped: grouped[pt] = []
+            grouped[pt].append(spec)
+        self._columnar = frozenset(columnar)
+        self._factmaps = { pt : FactMap(pt, idxs, pt in self._columnar) \
+                           for pt, idxs in grouped.items() }
+        for pt in self._columnar:
+            if pt not in self._factmaps: self._factmaps[pt] = FactMap(pt, [], True)
 
         if facts is None: return
+        if share:
+            for p,fm in facts._factmaps.items(): self._factmaps[p] = fm.copy()
+            return
         self._add(facts)
 
     # Make sure the FactBase has been initialised
@@ -123,9 +155,17 @@ class FactBase(object):
 
     def _add(self, arg):
         if isinstance(arg, Predicate): return self._add_fact(type(arg),arg)
-        facts = sorted(arg, key=lambda x : type(x).__name__)
-        for ptype, g in itertools.groupby(facts, lambda x: type(x)):
-            self._add_facts(ptype, g)
+
+        # Group the facts by type in a single pass and then bulk load each
+        # group (in predicate name order so the FactMap ordering is stable).
+        grouped = {}
+        for f in arg:
+            ptype = type(f)
+            group = grouped.get(ptype)
+            if group is None: grouped[ptype] = [f]
+            else: group.append(f)
+        for ptype in sorted(grouped, key=lambda x : x.__name__):
+            self._add_facts(ptype, grouped[ptype])
 
     def _add_fact(self, ptype, fact):
         if not issubclass(ptype,Predicate):
@@ -151,14 +191,15 @@ class FactBase(object):
     #--------------------------------------------------------------------------
     # Initiliser
     #--------------------------------------------------------------------------
-    def __init__(self, facts=None, indexes=None):
+    def __init__(self, facts=None, indexes=None, columnar=None):
         self._delayed_init=None
+        self._query_cache=None
         if callable(facts):
             def delayed_init():
-                self._init(facts, indexes)
+                self._init(facts, indexes, columnar)
             self._delayed_init=delayed_init
         else:
-            self._init(facts, indexes)
+            self._init(facts, indexes, columnar)
 
 
     #--------------------------------------------------------------------------
@@ -231,7 +272,29 @@ class FactBase(object):
         for ptype in ptypes: self._factmaps.setdefault(ptype, FactMap(ptype))
 
         qspec = QuerySpec(roots=roots)
-        return QueryImpl(self._factmaps, qspec)
+        return QueryImpl(self._factmaps, qspec, self._query_cache)
+
+    def enable_query_cache(self, maxentries=128, maxsize=100000):
+        """Cache the results of queries (created with ``query()``).
+
+        A cached result is re-used when the same query is re-run, as long as
+        none of the facts of the query's predicate types have been added or
+        removed in the meantime. This is useful when the same queries are run
+        repeatedly against a fact base that rarely changes. Note: a cached query
+        is always run to completion (even if only the ``first()`` element is
+        required) and queries with a ``group_by`` are not cached.
+
+        Args:
+          maxentries(int): the maximum number of cached queries.
+          maxsize(int): the maximum number of cached results (summed over all
+             the cached queries).
+
+        """
+        self._query_cache = QueryResultCache(maxentries, maxsize)
+
+    def disable_query_cache(self):
+        """Disable (and clear) the query result cache."""
+        self._query_cache = None
 
     @property
     def predicates(self):
@@ -547,10 +610,59 @@ class FactBase(object):
                 if p in other._factmaps: self._factmaps[p] = other._factmaps[p].copy()
 
 
+    def diff(self, other):
+        """Return the changes between another fact base and this one.
+
+        Unlike ``symmetric_difference()`` nothing is copied. The changes are
+        returned as a dictionary that maps each predicate type to an ``(added,
+        removed)`` pair, where ``added`` is a view of the facts in this fact
+        base that are not in ``other`` and ``removed`` is a view of the facts in
+        ``other`` that are not in this fact base. Only the predicate types that
+        have changed when ``diff()`` is called are included.
+
+        The views are live: they are evaluated when they are iterated over and
+        so reflect any later changes to either fact base. However, predicate
+        types that only change after the call are not added to the dictionary.
+
+        Args:
+          other(FactBase): the fact base to compare against (eg. the facts of a
+             previous model).
+
+        """
+        if not isinstance(other, self.__class__): other=FactBase(other)
+        self._check_init() # Check for delayed init
+        other._check_init()
+
+        empty = FactSet()
+        delta = {}
+        predicates = list(self._factmaps.keys())
+        predicates.extend([p for p in other._factmaps if p not in self._factmaps])
+        for p in predicates:
+            fm1 = self._factmaps.get(p)
+            fm2 = other._factmaps.get(p)
+            fs1 = fm1.factset if fm1 else empty
+            fs2 = fm2.factset if fm2 else empty
+            if fs1 is fs2 or (not fs1 and not fs2): continue
+            src1 = fm1 if fm1 is not None else empty
+            src2 = fm2 if fm2 is not None else empty
+            added = FactSetDifference(src1, src2)
+            removed = FactSetDifference(src2, src1)
+            if len(fs1) == len(fs2) and not added: continue
+            delta[p] = (added, removed)
+        return delta
+
     def copy(self):
-        """Implements the set copy() function"""
+        """Implements the set copy() function.
+
+        The copy shares the underlying facts and indexes with the original
+        (copy-on-write) so copying is cheap. The facts of a predicate type are
+        only copied when they are first modified in either fact base.
+        """
         self._check_init() # Check for delayed init
         fb=FactBase()
+        fb._indexspecs = self._indexspecs
+        fb._indexes = self._indexes
+        fb._columnar = self._columnar
         for p,fm in self._factmaps.items():
             fb._factmaps[p] = self._factmaps[p].copy()
         return fb
@@ -619,6 +731,34 @@ class Select(abc.ABC):
         """
         pass
 
+    # Note: limit() and offset() are not abstract so that existing sub-classes
+    # of Select can still be instantiated
+    def limit(self, n):
+        """Restrict the number of results.
+
+        For an ordered query only the first ``n`` results of the ordering are
+        generated (so the complete result set is not sorted). Note: the order
+        of results that are equal on the ``order_by`` criteria is unspecified
+        when a limit is used, so the results can differ (in the facts with
+        tied sort keys) from slicing the output of the unlimited query.
+
+        Args:
+          n: the maximum number of results to return
+        Returns:
+          Returns a reference to itself.
+        """
+        raise NotImplementedError("limit() is not supported by this Select")
+
+    def offset(self, m):
+        """Skip the first ``m`` results.
+
+        Args:
+          m: the number of results to skip
+        Returns:
+          Returns a reference to itself.
+        """
+        raise NotImplementedError("offset() is not supported by this Select")
+
     @abc.abstractmethod
     def get(self, *args, **kwargs):
         """Return all matching entries."""
@@ -698,6 +838,17 @@ class SelectImpl(Select):
 
         return SelectImpl(self._factbase,nqspec)
 
+    #--------------------------------------------------------------------------
+    # Restrict the results
+    #--------------------------------------------------------------------------
+    def limit(self, n):
+        nqspec = self._qspec.newp(limit=check_slice_value("limit", n))
+        return SelectImpl(self._factbase,nqspec)
+
+    def offset(self, m):
+        nqspec = self._qspec.newp(offset=check_slice_value("offset", m))
+        return SelectImpl(self._factbase,nqspec)
+
     #--------------------------------------------------------------------------
     #
     #--------------------------------------------------------------------------
@@ -706,7 +857,7 @@ class SelectImpl(Select):
 
         (factsets,factindexes) = \
             QueryExecutor.get_factmap_data(self._factbase.factmaps, qspec)
-        qplan = make_query_plan(factindexes.keys(), qspec)
+        qplan = make_query_plan(factindexes, qspec, factsets)
 
         return qplan.ground(*args,**kwargs)
 
@@ -746,9 +897,7 @@ class SelectImpl(Select):
             qspec = self._qspec.bindp(*args, **kwargs)
 
         qe = QueryExecutor(self._factbase.factmaps, qspec)
-        count = 0
-        for _ in qe.all(): count += 1
-        return count
+        return qe.aggregate("count")
 
 #------------------------------------------------------------------------------
 # The Delete class
@@ -777,11 +926,24 @@ class _Delete(Delete):
             return num_deleted
 
         # Gather all the facts to delete and remove them
-        to_delete = [ f for f in self._select.get(*args, **kwargs) ]
-        for fact in to_delete: factmap.remove(fact)
+        to_delete = set(self._select.get(*args, **kwargs))
+        factmap.remove_facts(to_delete)
         return len(to_delete)
 
 
+#------------------------------------------------------------------------------
+# Check a limit/offset value and return a query spec with limit=1 for first()
+#------------------------------------------------------------------------------
+def check_slice_value(name, value):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(("The '{}' value must be a non-negative integer but "
+                          "'{}' found").format(name, value))
+    return value
+
+def first_qspec(qspec):
+    limit = qspec.limit
+    return qspec.modp(limit=1 if limit is None else min(limit,1))
+
 #------------------------------------------------------------------------------
 # New Clorm Query API
 #
@@ -791,9 +953,10 @@ class _Delete(Delete):
 #------------------------------------------------------------------------------
 class QueryImpl(object):
 
-    def __init__(self, factmaps, qspec):
+    def __init__(self, factmaps, qspec, cache=None):
         self._factmaps = factmaps
         self._qspec = qspec
+        self._cache = cache
 
     #--------------------------------------------------------------------------
     # Internal function to test whether a function has been called and add it
@@ -807,14 +970,14 @@ class QueryImpl(object):
     #--------------------------------------------------------------------------
     def heuristic(self, join_order):
         nqspec = self._qspec.newp(heuristic=True, joh=join_order)
-        return QueryImpl(self._factmaps, nqspec)
+        return QueryImpl(self._factmaps, nqspec, self._cache)
 
     #--------------------------------------------------------------------------
     # Add a join expression
     #--------------------------------------------------------------------------
     def join(self, *expressions):
         join=process_join(expressions, self._qspec.roots)
-        return QueryImpl(self._factmaps, self._qspec.newp(join=join))
+        return QueryImpl(self._factmaps, self._qspec.newp(join=join), self._cache)
 
     #--------------------------------------------------------------------------
     # Add an order_by expression
@@ -831,7 +994,7 @@ class QueryImpl(object):
             where = process_where(and_(*expressions), self._qspec.roots)
 
         nqspec = self._qspec.newp(where=where)
-        return QueryImpl(self._factmaps, nqspec)
+        return QueryImpl(self._factmaps, nqspec, self._cache)
 
     #--------------------------------------------------------------------------
     # Add an order_by expression
@@ -843,7 +1006,7 @@ class QueryImpl(object):
         else:
             nqspec = self._qspec.newp(
                 order_by=process_orderby(expressions,self._qspec.roots))
-        return QueryImpl(self._factmaps, nqspec)
+        return QueryImpl(self._factmaps, nqspec, self._cache)
 
     #--------------------------------------------------------------------------
     # Add a group_by expression
@@ -862,7 +1025,7 @@ class QueryImpl(object):
 
         nqspec = self._qspec.newp(
             group_by=[ob.path for ob in order_by[:grouping]])
-        return QueryImpl(self._factmaps, nqspec)
+        return QueryImpl(self._factmaps, nqspec, self._cache)
 
     #--------------------------------------------------------------------------
     # The tuple flag
@@ -870,7 +1033,7 @@ class QueryImpl(object):
     def tuple(self):
         self._check_join_called_first("tuple")
         nqspec = self._qspec.newp(tuple=True)
-        return QueryImpl(self._factmaps, nqspec)
+        return QueryImpl(self._factmaps, nqspec, self._cache)
 
     #--------------------------------------------------------------------------
     # The unique flag
@@ -878,7 +1041,7 @@ class QueryImpl(object):
     def unique(self):
         self._check_join_called_first("unique")
         nqspec = self._qspec.newp(unique=True)
-        return QueryImpl(self._factmaps, nqspec)
+        return QueryImpl(self._factmaps, nqspec, self._cache)
 
     #--------------------------------------------------------------------------
     # Ground - bind
@@ -886,7 +1049,7 @@ class QueryImpl(object):
     def bind(self,*args,**kwargs):
         self._check_join_called_first("bind")
         nqspec = self._qspec.bindp(*args, **kwargs)
-        return QueryImpl(self._factmaps, nqspec)
+        return QueryImpl(self._factmaps, nqspec, self._cache)
 
     #--------------------------------------------------------------------------
     # Explicitly select the elements to output or delete
@@ -896,7 +1059,31 @@ class QueryImpl(object):
         if not outsig:
             raise ValueError("An empty 'select' signature is invalid")
         nqspec = self._qspec.newp(select=outsig)
-        return QueryImpl(self._factmaps, nqspec)
+        return QueryImpl(self._factmaps, nqspec, self._cache)
+
+    #--------------------------------------------------------------------------
+    # Restrict the output to a slice of the results. For an ordered query only
+    # the first offset+limit results are generated. The order of results with
+    # tied sort keys is unspecified (eg. walking an ordered FactIndex orders
+    # the facts with the same key differently to sorting the fact set).
+    #--------------------------------------------------------------------------
+    def limit(self, n):
+        self._check_join_called_first("limit")
+        nqspec = self._qspec.newp(limit=check_slice_value("limit", n))
+        return QueryImpl(self._factmaps, nqspec, self._cache)
+
+    def offset(self, m):
+        self._check_join_called_first("offset")
+        nqspec = self._qspec.newp(offset=check_slice_value("offset", m))
+        return QueryImpl(self._factmaps, nqspec, self._cache)
+
+    #--------------------------------------------------------------------------
+    # Prepare the query so that it can be re-run (with different bindings for
+    # the placeholders) without re-planning
+    #--------------------------------------------------------------------------
+    def prepare(self):
+        self._check_join_called_first("prepare")
+        return PreparedQuery(self._factmaps, self._qspec, self._cache)
 
     #--------------------------------------------------------------------------
     # End points that do something useful
@@ -911,7 +1098,7 @@ class QueryImpl(object):
 
         (factsets,factindexes) = \
             QueryExecutor.get_factmap_data(self._factmaps, qspec)
-        return make_query_plan(factindexes.keys(), qspec)
+        return make_query_plan(factindexes, qspec, factsets)
 
     #--------------------------------------------------------------------------
     # Select to display all the output of the query
@@ -919,7 +1106,7 @@ class QueryImpl(object):
     def all(self):
         self._check_join_called_first("all")
 
-        qe = QueryExecutor(self._factmaps, self._qspec)
+        qe = QueryExecutor(self._factmaps, self._qspec, cache=self._cache)
         return qe.all()
 
     #--------------------------------------------------------------------------
@@ -928,7 +1115,7 @@ class QueryImpl(object):
     def singleton(self):
         self._check_join_called_first("singleton")
 
-        qe = QueryExecutor(self._factmaps, self._qspec)
+        qe = QueryExecutor(self._factmaps, self._qspec, cache=self._cache)
         found = None
         for out in qe.all():
             if found: raise ValueError("Query returned more than a single element")
@@ -943,18 +1130,38 @@ class QueryImpl(object):
     def count(self):
         self._check_join_called_first("count")
 
-        qe = QueryExecutor(self._factmaps, self._qspec)
-        count = 0
-        for _ in qe.all(): count += 1
-        return count
+        qe = QueryExecutor(self._factmaps, self._qspec, cache=self._cache)
+        return qe.aggregate("count")
 
     #--------------------------------------------------------------------------
-    # Show the single element and throw an exception if there is more than one
+    # Aggregates over the values of a field path. With a group_by these return
+    # a generator of (group key, value) pairs.
+    # --------------------------------------------------------------------------
+    def sum(self, pth):
+        self._check_join_called_first("sum")
+        return QueryExecutor(self._factmaps, self._qspec).aggregate("sum", pth)
+
+    def min(self, pth):
+        self._check_join_called_first("min")
+        return QueryExecutor(self._factmaps, self._qspec).aggregate("min", pth)
+
+    def max(self, pth):
+        self._check_join_called_first("max")
+        return QueryExecutor(self._factmaps, self._qspec).aggregate("max", pth)
+
+    def avg(self, pth):
+        self._check_join_called_first("avg")
+        return QueryExecutor(self._factmaps, self._qspec).aggregate("avg", pth)
+
+    #--------------------------------------------------------------------------
+    # Return the first element (only the first element of an ordered query is
+    # generated)
     # --------------------------------------------------------------------------
     def first(self):
         self._check_join_called_first("first")
 
-        qe = QueryExecutor(self._factmaps, self._qspec)
+        qe = QueryExecutor(self._factmaps, first_qspec(self._qspec),
+                           cache=self._cache)
         return next(iter(qe.all()))
 
     #--------------------------------------------------------------------------
@@ -967,6 +1174,125 @@ class QueryImpl(object):
         qe = QueryExecutor(self._factmaps, nqspec)
         return qe.delete()
 
+#------------------------------------------------------------------------------
+# PreparedQuery is created by QueryImpl.prepare(). The query plan is generated
+# (with any placeholders unbound) when the query is prepared and the query is
+# built (once) from the plan with the placeholders as parameters. The bound
+# placeholder values are passed to the query each time it is run, so binding new
+# values doesn't re-build the query (see make_query()).
+#
+# Since the cost based join order heuristic depends on the number of facts the
+# query is re-planned if the fact set sizes change significantly (see
+# factset_size_signature()).
+#------------------------------------------------------------------------------
+class PreparedQuery(object):
+
+    def __init__(self, factmaps, qspec, cache=None):
+        self._factmaps = factmaps
+        self._cache = cache
+        self._qspec = qspec.fill_defaults()
+        self._placeholders = self._qspec.where.placeholders \
+            if self._qspec.where else set()
+        self._factsets = None
+        self._factindexes = None
+        self._refresh()
+        self._sizesig = None
+        self._qplan = None
+        self._args = ()
+        self._kwargs = {}
+        self._built = {}        # topk -> (qplan, query, factsets)
+        self._plan()
+
+    # A copy-on-write FactMap replaces its fact set and indexes when it is
+    # first modified after a FactBase.copy(), so the query must be rebuilt if
+    # they have changed.
+    def _refresh(self):
+        (factsets, factindexes) = \
+            QueryExecutor.get_factmap_data(self._factmaps, self._qspec)
+        if self._factsets is not None and \
+           all(fs is self._factsets[p] for p, fs in factsets.items()) and \
+           all(fi is self._factindexes[p] for p, fi in factindexes.items()):
+            return
+        self._factsets = factsets
+        self._factindexes = factindexes
+        self._qplan = None
+
+    def _plan(self):
+        sizesig = factset_size_signature(self._qspec, self._factsets)
+        if self._qplan is None or sizesig != self._sizesig:
+            self._sizesig = sizesig
+            self._qplan = make_cached_query_plan(self._factindexes, self._qspec,
+                                                 self._factsets)
+        return self._qplan
+
+    def _executor(self, qspec=None):
+        if qspec is None: qspec = self._qspec
+        self._refresh()
+        # Raises an exception if a placeholder has no value
+        for ph in self._placeholders:
+            placeholder_value(ph, self._args, self._kwargs, qspec.where)
+        topk = QueryExecutor.topk(qspec)
+        qplan = self._plan()
+        built = self._built.get(topk)
+        if built is None or built[0] is not qplan or built[2] is not self._factsets:
+            query = make_query(qplan, self._factsets, self._factindexes, topk,
+                               parameterised=True)
+            built = (qplan, query, self._factsets)
+            self._built[topk] = built
+        return QueryExecutor(self._factmaps, qspec, built[:2], self._cache,
+                             (self._args, self._kwargs))
+
+    #--------------------------------------------------------------------------
+    # Bind values to the placeholders. Returns a new PreparedQuery that shares
+    # the query plan and the built queries.
+    #--------------------------------------------------------------------------
+    def bind(self,*args,**kwargs):
+        self._qspec.validate_bindings(*args, **kwargs)
+        nq = copy.copy(self)
+        nq._args = args
+        nq._kwargs = kwargs
+        return nq
+
+    #--------------------------------------------------------------------------
+    # The (ungrounded) query plan
+    #--------------------------------------------------------------------------
+    def query_plan(self,*args,**kwargs):
+        return self._plan().ground(*args,**kwargs)
+
+    #--------------------------------------------------------------------------
+    # End points mirroring QueryImpl
+    #--------------------------------------------------------------------------
+    def all(self):
+        return self._executor().all()
+
+    def singleton(self):
+        found = None
+        for out in self._executor().all():
+            if found: raise ValueError("Query returned more than a single element")
+            found = out
+        return found
+
+    def count(self):
+        return self._executor().aggregate("count")
+
+    def sum(self, pth):
+        return self._executor().aggregate("sum", pth)
+
+    def min(self, pth):
+        return self._executor().aggregate("min", pth)
+
+    def max(self, pth):
+        return self._executor().aggregate("max", pth)
+
+    def avg(self, pth):
+        return self._executor().aggregate("avg", pth)
+
+    def first(self):
+        return next(iter(self._executor(first_qspec(self._qspec)).all()))
+
+    def delete(self,*subroots):
+        return self._executor(self._qspec.newp(delete=subroots)).delete()
+
 #------------------------------------------------------------------------------
 # main
 #------------------------------------------------------------------------------
@@ -4,6 +4,7 @@
 # ------------------------------------------------------------------------------
 
 import io
+import copy
 import operator
 import collections
 import bisect
@@ -11,6 +12,8 @@ import inspect
 import abc
 import functools
 import itertools
+import sys
+from array import array
 
 from .core import *
 from .core import get_field_definition, PredicatePath, kwargs_check_keys
@@ -46,8 +49,13 @@ from ..util import OrderedSet as FactSet
 
 __all__ = [
     'FactSet',
+    'SortedKeyList',
+    'BlockedSortedKeyList',
     'FactIndex',
+    'HashFactIndex',
+    'ColumnarFactSet',
     'FactMap',
+    'FactSetDifference',
     'factset_equality',
     ]
 
@@ -56,37 +64,304 @@ __all__ = [
 #------------------------------------------------------------------------------
 
 #------------------------------------------------------------------------------
-# FactIndex indexes facts by a given field
+# Ordered key storage for FactIndex. A key store holds a sorted collection of
+# unique keys and provides range iteration (without copying the keys). The
+# FactIndex checks for key membership itself (using its key to values map) so
+# the key store is only told to add keys that are new and to remove keys that
+# exist.
+#
+# SortedKeyList is a plain sorted Python list. It is compact and fast to
+# iterate and bulk load but inserting or removing a key is O(n) because of the
+# list shifting. BlockedSortedKeyList splits the keys into a list of sorted
+# blocks of bounded size (similar to the sortedcontainers library) so a single
+# insert or remove only shifts one block. This is the default since it handles
+# facts being incrementally added and removed between solver calls.
+#
+# Both key stores also support removing a collection of keys in one go. When
+# many keys are removed the stored keys are filtered and rebuilt in a single
+# pass rather than removing each key individually.
+#
+# Any class with the same interface can be passed to a FactIndex.
+# ------------------------------------------------------------------------------
+
+_unbounded = object()
+
+class SortedKeyList(object):
+    def __init__(self):
+        self._keys = []
+
+    def add(self, key):
+        bisect.insort_left(self._keys, key)
+
+    def remove(self, key):
+        posn = bisect.bisect_left(self._keys, key)
+        if posn == len(self._keys) or self._keys[posn] != key:
+            raise KeyError(key)
+        del self._keys[posn]
+
+    # Remove a collection of existing keys
+    def remove_keys(self, keys):
+        if not keys: return
+        dead = set(keys)
+        self._keys = [k for k in self._keys if k not in dead]
+
+    # Add a sorted list of new keys
+    def update(self, keys):
+        if not keys: return
+        if self._keys:
+            self._keys.extend(keys)
+            self._keys.sort()
+        else:
+            self._keys = list(keys)
+
+    def clear(self):
+        self._keys = []
+
+    def irange(self, minimum=_unbounded, maximum=_unbounded,
+               inclusive=(True,True), reverse=False):
+        keys = self._keys
+        if minimum is _unbounded: start = 0
+        elif inclusive[0]: start = bisect.bisect_left(keys, minimum)
+        else: start = bisect.bisect_right(keys, minimum)
+        if maximum is _unbounded: stop = len(keys)
+        elif inclusive[1]: stop = bisect.bisect_right(keys, maximum)
+        else: stop = bisect.bisect_left(keys, maximum)
+        if reverse: return (keys[i] for i in range(stop-1, start-1, -1))
+        return itertools.islice(keys, start, stop)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __reversed__(self):
+        return reversed(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class BlockedSortedKeyList(object):
+    def __init__(self, load=512):
+        self._load = load
+        self._blocks = []      # The sorted blocks of keys
+        self._maxes = []       # The largest key of each block
+        self._len = 0
+
+    def _build(self, keys):
+        load = self._load
+        self._blocks = [ keys[i:i+load] for i in range(0, len(keys), load) ]
+        self._maxes = [ b[-1] for b in self._blocks ]
+        self._len = len(keys)
+
+    def add(self, key):
+        blocks = self._blocks
+        maxes = self._maxes
+        self._len += 1
+        if not blocks:
+            blocks.append([key])
+            maxes.append(key)
+            return
+        bidx = bisect.bisect_left(maxes, key)
+        if bidx == len(maxes):
+            bidx -= 1
+            block = blocks[bidx]
+            block.append(key)
+            maxes[bidx] = key
+        else:
+            block = blocks[bidx]
+            bisect.insort_left(block, key)
+
+        # Split a block that has grown too large
+        if len(block) > 2*self._load:
+            half = block[self._load:]
+            del block[self._load:]
+            blocks.insert(bidx+1, half)
+            maxes[bidx] = block[-1]
+            maxes.insert(bidx+1, half[-1])
+
+    def remove(self, key):
+        blocks = self._blocks
+        maxes = self._maxes
+        bidx = bisect.bisect_left(maxes, key)
+        if bidx == len(maxes): raise KeyError(key)
+        block = blocks[bidx]
+        posn = bisect.bisect_left(block, key)
+        if posn == len(block) or block[posn] != key: raise KeyError(key)
+        del block[posn]
+        self._len -= 1
+
+        if not block:
+            del blocks[bidx]
+            del maxes[bidx]
+            return
+        maxes[bidx] = block[-1]
+
+        # Merge a block that has shrunk too small with its neighbour
+        if len(block) < self._load//2 and len(blocks) > 1:
+            if bidx == len(blocks) - 1: bidx -= 1
+            blocks[bidx].extend(blocks[bidx+1])
+            maxes[bidx] = maxes[bidx+1]
+            del blocks[bidx+1]
+            del maxes[bidx+1]
+
+    # Add a sorted list of new keys. A large number of new keys is merged with
+    # the existing keys and the blocks rebuilt, otherwise they are added
+    # one-by-one.
+    def update(self, keys):
+        if not keys: return
+        if not self._blocks:
+            self._build(list(keys))
+        elif len(keys) > self._len // 8:
+            merged = list(itertools.chain.from_iterable(self._blocks))
+            merged.extend(keys)
+            merged.sort()
+            self._build(merged)
+        else:
+            for key in keys: self.add(key)
+
+    # Remove a collection of existing keys. Similar to update() a large number
+    # of keys are removed by filtering the keys and rebuilding the blocks.
+    def remove_keys(self, keys):
+        if not keys: return
+        if len(keys) > self._len // 8:
+            dead = set(keys)
+            self._build([k for k in itertools.chain.from_iterable(self._blocks)
+                         if k not in dead])
+        else:
+            for key in keys: self.remove(key)
+
+    def clear(self):
+        self._blocks = []
+        self._maxes = []
+        self._len = 0
+
+    # The (block, position) of the first key that is >= (or > if not
+    # inclusive) the given key.
+    def _locate(self, key, inclusive):
+        bsect = bisect.bisect_left if inclusive else bisect.bisect_right
+        bidx = bsect(self._maxes, key)
+        if bidx == len(self._maxes): return (bidx, 0)
+        return (bidx, bsect(self._blocks[bidx], key))
+
+    def irange(self, minimum=_unbounded, maximum=_unbounded,
+               inclusive=(True,True), reverse=False):
+        if minimum is _unbounded: start = (0, 0)
+        else: start = self._locate(minimum, inclusive[0])
+        if maximum is _unbounded: stop = (len(self._blocks), 0)
+        else: stop = self._locate(maximum, not inclusive[1])
+        if start >= stop: return iter(())
+        return self._iter_range(start, stop, reverse)
+
+    def _iter_range(self, start, stop, reverse):
+        blocks = self._blocks
+        (sbidx, sposn) = start
+        (ebidx, eposn) = stop
+        if eposn == 0: (ebidx, eposn) = (ebidx-1, len(blocks[ebidx-1]))
+        if not reverse:
+            for bidx in range(sbidx, ebidx+1):
+                block = blocks[bidx]
+                lo = sposn if bidx == sbidx else 0
+                hi = eposn if bidx == ebidx else len(block)
+                yield from itertools.islice(block, lo, hi)
+        else:
+            for bidx in range(ebidx, sbidx-1, -1):
+                block = blocks[bidx]
+                lo = sposn if bidx == sbidx else 0
+                hi = eposn if bidx == ebidx else len(block)
+                for posn in range(hi-1, lo-1, -1): yield block[posn]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._blocks)
+
+    def __reversed__(self):
+        for block in reversed(self._blocks):
+            yield from reversed(block)
+
+    def __len__(self):
+        return self._len
+
 #------------------------------------------------------------------------------
+# FactIndex indexes facts by a given field. A composite index is created by
+# passing a tuple of paths (of the same predicate); the key is then the tuple of
+# field values so the keys are in lexicographic order. As well as the standard
+# find() a composite index supports find_prefix() to search for the keys that
+# match a prefix of the key tuple.
+#------------------------------------------------------------------------------
+
+def _composite_attrgetter(paths):
+    getters = tuple([p.meta.attrgetter for p in paths])
+    return lambda f, getters=getters: tuple([g(f) for g in getters])
 
 class FactIndex(object):
-    def __init__(self, path):
+    ordered = True
+
+    def __init__(self, path, keystore=None):
         try:
             self._path = path
-            self._attrgetter = self._path.meta.attrgetter
-            self._predicate = self._path.meta.predicate
-            self._keylist = []
+            if isinstance(path, tuple):
+                self._width = len(path)
+                self._attrgetter = _composite_attrgetter(path)
+                self._predicate = path[0].meta.predicate
+                for p in path:
+                    if p.meta.predicate != self._predicate: raise ValueError()
+            else:
+                self._width = None
+                self._attrgetter = self._path.meta.attrgetter
+                self._predicate = self._path.meta.predicate
+            self._keystore = keystore if keystore else BlockedSortedKeyList
+            self._keys = self._keystore()
             self._key2values = {}
         except:
-            raise TypeError("{} is not a valid PredicatePath object".format(path))
+            raise TypeError(("{} is not a valid PredicatePath object (or tuple "
+                             "of PredicatePaths)").format(path))
 
     @property
     def path(self):
         return self._path
 
+    @property
+    def composite(self):
+        return self._width is not None
+
+    @property
+    def keystore(self):
+        return self._keystore
+
     def add(self, fact):
         if not isinstance(fact, self._predicate):
             raise TypeError("{} is not a {}".format(fact, self._predicate))
         key = self._attrgetter(fact)
 
-        # Index the fact by the key
-        if key not in self._key2values: self._key2values[key] = set()
-        self._key2values[key].add(fact)
-
-        # Maintain the sorted list of keys
-        posn = bisect.bisect_left(self._keylist, key)
-        if len(self._keylist) > posn and self._keylist[posn] == key: return
-        bisect.insort_left(self._keylist, key)
+        # Index the fact by the key and maintain the sorted keys
+        values = self._key2values.get(key)
+        if values is None:
+            self._key2values[key] = values = set()
+            self._keys.add(key)
+        values.add(fact)
+
+    # Bulk load facts into the index. Rather than inserting each new key into
+    # the sorted keys the new keys are gathered while building the key to
+    # values map and then sorted and added to the key store in one go. If a
+    # fact is invalid then the keys of the facts added before it are still
+    # added to the key store so that the index remains consistent.
+    def add_facts(self, facts):
+        predicate = self._predicate
+        attrgetter = self._attrgetter
+        key2values = self._key2values
+        newkeys = []
+        try:
+            for fact in facts:
+                if not isinstance(fact, predicate):
+                    raise TypeError("{} is not a {}".format(fact, predicate))
+                key = attrgetter(fact)
+                values = key2values.get(key)
+                if values is None:
+                    key2values[key] = values = set()
+                    newkeys.append(key)
+                values.add(fact)
+        finally:
+            if newkeys:
+                newkeys.sort()
+                self._keys.update(newkeys)
 
     def discard(self, fact):
         self.remove(fact, False)
@@ -110,79 +385,156 @@ class FactIndex(object):
 
         # remove the key
         del self._key2values[key]
-        posn = bisect.bisect_left(self._keylist, key)
-        del self._keylist[posn]
+        self._keys.remove(key)
+
+    # Bulk remove facts from the index. The keys that no longer have any
+    # values are gathered and removed from the key store in one go.
+    def remove_facts(self, facts, raise_on_missing=True):
+        predicate = self._predicate
+        attrgetter = self._attrgetter
+        key2values = self._key2values
+        deadkeys = []
+        try:
+            for fact in facts:
+                if not isinstance(fact, predicate):
+                    raise TypeError("{} is not a {}".format(fact, predicate))
+                key = attrgetter(fact)
+                values = key2values.get(key)
+                if values is None:
+                    if raise_on_missing:
+                        raise KeyError("{} is not in the FactIndex".format(fact))
+                    continue
+                if raise_on_missing: values.remove(fact)
+                else: values.discard(fact)
+                if not values:
+                    del key2values[key]
+                    deadkeys.append(key)
+        finally:
+            self._keys.remove_keys(deadkeys)
 
     def clear(self):
-        self._keylist = []
+        self._keys.clear()
         self._key2values = {}
 
+    # A copy of the index that shares the facts (and keys) but not the key to
+    # values map or the key store
+    def copy(self):
+        nfi = copy.copy(self)
+        nfi._key2values = { k : set(v) for k,v in self._key2values.items() }
+        if self._keys is not None:
+            nfi._keys = self._keystore()
+            nfi._keys.update(list(self._keys))
+        return nfi
+
+    @property
+    def keys(self): return list(self._keys)
+
     @property
-    def keys(self): return self._keylist
+    def num_keys(self): return len(self._key2values)
 
     #--------------------------------------------------------------------------
-    # Internal functions to get keys matching some boolean operator
+    # Internal functions to iterate over the keys matching some boolean
+    # operator
     #--------------------------------------------------------------------------
 
-    def _keys_eq(self, key):
+    def _keys_eq(self, key, reverse):
         if key in self._key2values: return [key]
         return []
 
-    def _keys_ne(self, key):
-        posn1 = bisect.bisect_left(self._keylist, key)
-        if posn1: left =  self._keylist[:posn1]
-        else: left = []
-        posn2 = bisect.bisect_right(self._keylist, key)
-        if posn2: right = self._keylist[posn2:]
-        else: right = []
-        return left + right
-
-    def _keys_lt(self, key):
-        posn = bisect.bisect_left(self._keylist, key)
-        if posn: return self._keylist[:posn]
-        return []
+    def _keys_ne(self, key, reverse):
+        left = self._keys.irange(maximum=key, inclusive=(True,False),
+                                 reverse=reverse)
+        right = self._keys.irange(minimum=key, inclusive=(False,True),
+                                  reverse=reverse)
+        if reverse: return itertools.chain(right, left)
+        return itertools.chain(left, right)
 
-    def _keys_le(self, key):
-        posn = bisect.bisect_right(self._keylist, key)
-        if posn: return self._keylist[:posn]
-        return []
+    def _keys_lt(self, key, reverse):
+        return self._keys.irange(maximum=key, inclusive=(True,False),
+                                 reverse=reverse)
 
-    def _keys_gt(self, key):
-        posn = bisect.bisect_right(self._keylist, key)
-        if posn: return self._keylist[posn:]
-        return []
+    def _keys_le(self, key, reverse):
+        return self._keys.irange(maximum=key, reverse=reverse)
 
-    def _keys_ge(self, key):
-        posn = bisect.bisect_left(self._keylist, key)
-        if posn: return self._keylist[posn:]
-        return []
+    def _keys_gt(self, key, reverse):
+        return self._keys.irange(minimum=key, inclusive=(False,True),
+                                 reverse=reverse)
+
+    def _keys_ge(self, key, reverse):
+        return self._keys.irange(minimum=key, reverse=reverse)
 
     #--------------------------------------------------------------------------
     # Find elements based on boolean match to a key
     #--------------------------------------------------------------------------
+    def _keys_op(self, op, key, reverse):
+        if op == operator.eq: return self._keys_eq(key, reverse)
+        elif op == operator.ne: return self._keys_ne(key, reverse)
+        elif op == operator.lt: return self._keys_lt(key, reverse)
+        elif op == operator.le: return self._keys_le(key, reverse)
+        elif op == operator.gt: return self._keys_gt(key, reverse)
+        elif op == operator.ge: return self._keys_ge(key, reverse)
+        else: raise ValueError("unsupported operator {}".format(op))
+
     def find(self, op, key,reverse=False):
-        keys = []
-        if op == operator.eq: keys = self._keys_eq(key)
-        elif op == operator.ne: keys = self._keys_ne(key)
-        elif op == operator.lt: keys = self._keys_lt(key)
-        elif op == operator.le: keys = self._keys_le(key)
-        elif op == operator.gt: keys = self._keys_gt(key)
-        elif op == operator.ge: keys = self._keys_ge(key)
+        for k in self._keys_op(op, key, reverse):
+            for fact in self._key2values[k]: yield fact
+
+    #--------------------------------------------------------------------------
+    # Count the facts matching a boolean match to a key and find the smallest
+    # (or largest) key of the matching facts (or of all the facts if there is
+    # no operator). These only iterate over the keys and not the facts.
+    #--------------------------------------------------------------------------
+    def count(self, op, key):
+        k2v = self._key2values
+        return sum([len(k2v[k]) for k in self._keys_op(op, key, False)])
+
+    def first_key(self, op=None, key=None, reverse=False):
+        if op is None: keys = self._keys.irange(reverse=reverse)
+        else: keys = self._keys_op(op, key, reverse)
+        for k in keys: return k
+        return None
+
+    #--------------------------------------------------------------------------
+    # For a composite index find the facts whose key starts with the prefix
+    # tuple and (optionally) where the next element of the key matches some
+    # boolean operator. Since the keys are in lexicographic order the matching
+    # keys are contiguous so the scan starts at the prefix and stops as soon as
+    # it is passed.
+    #--------------------------------------------------------------------------
+    def find_prefix(self, prefix, op=None, key=None):
+        if not self._width:
+            raise TypeError("find_prefix() requires a composite FactIndex")
+        prefix = tuple(prefix)
+        size = len(prefix)
+        if size + (0 if op is None else 1) > self._width:
+            raise ValueError(("Prefix {} is too long for the composite index "
+                              "{}").format(prefix, self._path))
+
+        if op is None or op in (operator.ne, operator.lt, operator.le):
+            start = prefix
+        elif op in (operator.eq, operator.ge, operator.gt):
+            start = prefix + (key,)
         else: raise ValueError("unsupported operator {}".format(op))
 
-        if reverse:
-            for k in reversed(keys):
-                for fact in self._key2values[k]: yield fact
-        else:
-            for k in keys:
-                for fact in self._key2values[k]: yield fact
+        if len(start) == self._width:
+            if op is None or op == operator.eq:
+                for fact in self._key2values.get(start, ()): yield fact
+                return
+
+        stop_on_fail = op in (operator.eq, operator.lt, operator.le)
+        for k in self._keys.irange(minimum=start):
+            if k[:size] != prefix: return
+            if op is not None and not op(k[size], key):
+                if stop_on_fail: return
+                continue
+            for fact in self._key2values[k]: yield fact
 
     #--------------------------------------------------------------------------
     # Iterate in descending key order
     #--------------------------------------------------------------------------
 
     def __reversed__(self):
-        for key in reversed(self._keylist):
+        for key in reversed(self._keys):
             for f in self._key2values[key]: yield f
 
     #--------------------------------------------------------------------------
@@ -190,7 +542,7 @@ class FactIndex(object):
     #--------------------------------------------------------------------------
 
     def __iter__(self):
-        for key in self._keylist:
+        for key in self._keys:
             for f in self._key2values[key]: yield f
 
     def __bool__(self):
@@ -203,7 +555,7 @@ class FactIndex(object):
 
     def __eq__(self, other):
         if not isinstance(other, self.__class__): return NotImplemented
-        if hashable_path(self._path) != hashable_path(other._path): return False
+        if index_hashable(self._path) != index_hashable(other._path): return False
         return self._key2values == other._key2values
 
     def __ne__(self, other):
@@ -221,6 +573,338 @@ class FactIndex(object):
     def __repr__(self):
         return self.__str__()
 
+#------------------------------------------------------------------------------
+# HashFactIndex is an index that only supports equality lookups. It only keeps
+# the key to values map so is cheaper to maintain than a FactIndex for fields
+# with many distinct values that are only ever queried with ==. Iterating over
+# a HashFactIndex is unordered. The query planner only uses it for ==
+# comparisons.
+# ------------------------------------------------------------------------------
+
+class HashFactIndex(FactIndex):
+    ordered = False
+
+    def __init__(self, path):
+        super(HashFactIndex, self).__init__(path)
+        self._keystore = None
+        self._keys = None
+
+    def add(self, fact):
+        if not isinstance(fact, self._predicate):
+            raise TypeError("{} is not a {}".format(fact, self._predicate))
+        key = self._attrgetter(fact)
+        values = self._key2values.get(key)
+        if values is None: self._key2values[key] = values = set()
+        values.add(fact)
+
+    def add_facts(self, facts):
+        for fact in facts: self.add(fact)
+
+    def remove(self, fact, raise_on_missing=True):
+        if not isinstance(fact, self._predicate):
+            raise TypeError("{} is not a {}".format(fact, self._predicate))
+        key = self._attrgetter(fact)
+        values = self._key2values.get(key)
+        if values is None:
+            if raise_on_missing:
+                raise KeyError("{} is not in the FactIndex".format(fact))
+            return
+        if raise_on_missing: values.remove(fact)
+        else: values.discard(fact)
+        if not values: del self._key2values[key]
+
+    def remove_facts(self, facts, raise_on_missing=True):
+        for fact in facts: self.remove(fact, raise_on_missing)
+
+    def clear(self):
+        self._key2values = {}
+
+    @property
+    def keys(self): return list(self._key2values.keys())
+
+    def find(self, op, key, reverse=False):
+        if op != operator.eq:
+            raise ValueError(("unsupported operator {} for a hash "
+                              "index").format(op))
+        return iter(self._key2values.get(key, ()))
+
+    def count(self, op, key):
+        if op != operator.eq:
+            raise ValueError(("unsupported operator {} for a hash "
+                              "index").format(op))
+        return len(self._key2values.get(key, ()))
+
+    def first_key(self, op=None, key=None, reverse=False):
+        raise TypeError("A HashFactIndex has no ordering")
+
+    def find_prefix(self, prefix, op=None, key=None):
+        if op is not None: prefix = tuple(prefix) + (key,)
+        if not self._width or len(prefix) != self._width or \
+           (op is not None and op != operator.eq):
+            raise ValueError(("A hash index only supports equality lookups on "
+                              "the complete key"))
+        return iter(self._key2values.get(tuple(prefix), ()))
+
+    def __reversed__(self):
+        raise TypeError("A HashFactIndex has no ordering")
+
+    def __iter__(self):
+        for facts in self._key2values.values():
+            for f in facts: yield f
+
+#------------------------------------------------------------------------------
+# An index specification is either a path or a (path, kind) pair where kind is
+# "sorted" or "hash". If no kind is specified then it is taken from the field
+# definition (eg. IntegerField(index="hash")) and otherwise defaults to
+# "sorted". A composite index is specified by a tuple of paths in place of the
+# path (and defaults to "sorted"). Returns a (path, kind) pair, where the path
+# is a tuple of paths for a composite index.
+# ------------------------------------------------------------------------------
+
+def index_paths(pth):
+    if isinstance(pth, tuple): return tuple([path(p) for p in pth])
+    return (path(pth),)
+
+def index_hashable(pth):
+    if isinstance(pth, tuple): return tuple([hashable_path(p) for p in pth])
+    return hashable_path(pth)
+
+def index_spec(idx):
+    kind = None
+    if isinstance(idx, tuple) and len(idx) == 2 and isinstance(idx[1], str):
+        (idx, kind) = idx
+        if kind not in ("sorted", "hash"):
+            raise ValueError(("Invalid index type '{}' for '{}': expecting "
+                              "'sorted' or 'hash'").format(kind, idx))
+    if isinstance(idx, tuple):
+        pth = index_paths(idx)
+        if len(pth) < 2:
+            raise ValueError(("A composite index '{}' must consist of at "
+                              "least two paths").format(pth))
+        if len(set([p.meta.predicate for p in pth])) != 1:
+            raise ValueError(("The paths of a composite index '{}' must refer "
+                              "to the same predicate").format(pth))
+        return (pth, kind if kind else "sorted")
+    pth = path(idx)
+    if kind: return (pth, kind)
+    field = pth.meta.field
+    if field is not None and field.index == "hash": return (pth, "hash")
+    return (pth, "sorted")
+
+def make_factindex(pth, kind="sorted"):
+    if kind == "hash": return HashFactIndex(pth)
+    return FactIndex(pth)
+
+#------------------------------------------------------------------------------
+# ColumnarFactSet is an alternative to FactSet that stores the facts of a
+# predicate column-wise rather than as Predicate instances. It is only possible
+# for predicates whose fields are all IntegerField (stored in an array('q')
+# column), or StringField/ConstantField (stored as a list of interned
+# strings). The fact signs are stored in a bytearray column.
+#
+# Predicate instances are materialised when the facts are iterated over, so the
+# instances are not persistent (ie. a fact retrieved twice will be equal but
+# not identical). To test for membership the rows are kept in an open
+# addressing (linear probing) hash table, stored in an array, that is keyed on
+# the hash of the field values and sign. A slot holds the row + 1, with 0 for
+# an empty slot and -1 for a deleted slot. Removing a fact only marks its row
+# as dead and the columns are compacted when there are more dead rows than
+# live ones. The ordering of the facts is the insertion ordering (like
+# FactSet).
+#
+# The columns are exposed (column() and alive) so that the query engine can
+# evaluate where clauses directly on the columns and only materialise the
+# matching facts (see make_factset_scan()).
+# ------------------------------------------------------------------------------
+
+class ColumnarFactSet(object):
+
+    @classmethod
+    def supported(cls, ptype):
+        for fa in ptype.meta:
+            if type(fa.defn) not in (IntegerField, StringField, ConstantField):
+                return False
+        return True
+
+    def __init__(self, ptype, facts=[]):
+        if not ColumnarFactSet.supported(ptype):
+            raise ValueError(("Columnar storage requires the fields of predicate "
+                              "'{}' to all be IntegerField, StringField, or "
+                              "ConstantField").format(ptype.__name__))
+        self._ptype = ptype
+        self._intcols = tuple([type(fa.defn) is IntegerField for fa in ptype.meta])
+        self._name2idx = { fa.name : fa.index for fa in ptype.meta }
+        if ptype.meta.is_tuple:
+            self._make = lambda vs, sign: ptype(*vs)
+        else:
+            self._make = lambda vs, sign: ptype(*vs, sign=sign)
+        self._getter = lambda f: tuple(f[i] for i in range(len(self._intcols)))
+        self._init_columns()
+        self.update(facts)
+
+    def _init_columns(self):
+        self._columns = tuple([array('q') if ic else [] for ic in self._intcols])
+        self._signs = bytearray()
+        self._alive = bytearray()
+        self._hashes = array('q')
+        self._table = array('q', [0]*8)
+        self._used = 0
+        self._dead = 0
+
+    def _key(self, fact):
+        return (self._getter(fact), fact.sign)
+
+    def _row_key(self, row):
+        return (tuple([c[row] for c in self._columns]), bool(self._signs[row]))
+
+    # Returns the row and slot for the key, or None and the slot to insert into
+    def _probe(self, key, h):
+        table = self._table
+        mask = len(table) - 1
+        i = h & mask
+        free = None
+        while True:
+            e = table[i]
+            if e == 0: return (None, i if free is None else free)
+            if e < 0:
+                if free is None: free = i
+            elif self._hashes[e-1] == h and self._row_key(e-1) == key:
+                return (e-1, i)
+            i = (i + 1) & mask
+
+    def _rebuild_table(self, capacity):
+        table = array('q', [0]*capacity)
+        mask = capacity - 1
+        for row, (a, h) in enumerate(zip(self._alive, self._hashes)):
+            if not a: continue
+            i = h & mask
+            while table[i]: i = (i + 1) & mask
+            table[i] = row + 1
+        self._table = table
+        self._used = len(self)
+
+    def _append(self, key, h, slot):
+        (values, sign) = key
+        row = len(self._alive)
+        for c, ic, v in zip(self._columns, self._intcols, values):
+            c.append(v if ic else sys.intern(v))
+        self._signs.append(sign)
+        self._alive.append(1)
+        self._hashes.append(h)
+        if self._table[slot] == 0: self._used += 1
+        self._table[slot] = row + 1
+        if self._used * 3 > len(self._table) * 2:
+            capacity = len(self._table)
+            while len(self) * 3 > capacity: capacity *= 2
+            self._rebuild_table(capacity)
+
+    def _compact(self):
+        live = [r for r,a in enumerate(self._alive) if a]
+        columns = [ c for c in self._columns ]
+        (signs, hashes) = (self._signs, self._hashes)
+        self._columns = tuple([array('q', [c[r] for r in live]) if ic else \
+                               [c[r] for r in live] \
+                               for c, ic in zip(columns, self._intcols)])
+        self._signs = bytearray([signs[r] for r in live])
+        self._hashes = array('q', [hashes[r] for r in live])
+        self._alive = bytearray([1]*len(live))
+        self._dead = 0
+        self._rebuild_table(len(self._table))
+
+    def fact(self, row):
+        return self._make([c[row] for c in self._columns], bool(self._signs[row]))
+
+    def facts(self, rows):
+        for row in rows: yield self.fact(row)
+
+    def column(self, name):
+        if name == "sign": return self._signs
+        return self._columns[self._name2idx[name]]
+
+    @property
+    def alive(self):
+        return self._alive
+
+    @property
+    def predicate(self):
+        return self._ptype
+
+    #--------------------------------------------------------------------------
+    # Set functions
+    #--------------------------------------------------------------------------
+    def add(self, fact):
+        if type(fact) != self._ptype:
+            raise TypeError("{} is not of type {}".format(fact, self._ptype))
+        key = self._key(fact)
+        h = hash(key)
+        (row, slot) = self._probe(key, h)
+        if row is None: self._append(key, h, slot)
+
+    def update(self, *others):
+        for other in others:
+            for fact in other: self.add(fact)
+
+    def remove(self, fact):
+        row = None
+        if type(fact) == self._ptype:
+            key = self._key(fact)
+            (row, slot) = self._probe(key, hash(key))
+        if row is None: raise KeyError(fact)
+        self._table[slot] = -1
+        self._alive[row] = 0
+        self._dead += 1
+        if self._dead > 1024 and self._dead > len(self): self._compact()
+
+    def discard(self, fact):
+        try:
+            self.remove(fact)
+        except KeyError:
+            pass
+
+    def clear(self):
+        self._init_columns()
+
+    # Copy the columns directly (rather than materialising the facts)
+    def copy(self):
+        ncs = copy.copy(self)
+        ncs._columns = tuple([c[:] for c in self._columns])
+        ncs._signs = bytearray(self._signs)
+        ncs._alive = bytearray(self._alive)
+        ncs._hashes = array('q', self._hashes)
+        ncs._table = array('q', self._table)
+        return ncs
+
+    def union(self,*others):
+        return FactSet(self).union(*others)
+
+    def intersection(self,*others):
+        return FactSet(self).intersection(*others)
+
+    def difference(self,*others):
+        return FactSet(self).difference(*others)
+
+    def symmetric_difference(self,other):
+        return FactSet(self).symmetric_difference(other)
+
+    #--------------------------------------------------------------------------
+    # Special functions to support set and container operations
+    #--------------------------------------------------------------------------
+    def __contains__(self, fact):
+        if type(fact) != self._ptype: return False
+        key = self._key(fact)
+        return self._probe(key, hash(key))[0] is not None
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __len__(self):
+        return len(self._alive) - self._dead
+
+    def __iter__(self):
+        make = self._make
+        for a, s, *vs in zip(self._alive, self._signs, *self._columns):
+            if a: yield make(vs, bool(s))
+
 #------------------------------------------------------------------------------
 # A helper function to determine if two collections have the same elements
 # (irrespective of ordering). This is useful if the underlying objects are two
@@ -249,16 +933,23 @@ def factset_equality(s1,s2):
 # engine is passed the FactMap and then choses the appropriate way of accessing
 # the data.
 #
+# Every modification of a FactMap assigns it a new version number. The version
+# numbers are drawn from a single global counter so a version also identifies
+# the FactMap (ie. a new FactMap never re-uses the version of an old one). This
+# allows query results to be cached and invalidated (see QueryResultCache).
 # ------------------------------------------------------------------------------
 
+_fm_versions = itertools.count()
+
 def _fm_iterable(other):
     if isinstance(other, FactMap): return other.factset
     else: return other
 
 class FactMap(object):
-    def __init__(self, ptype, indexes=[]):
+    def __init__(self, ptype, indexes=[], columnar=False):
         def clean_path(p):
-            p = path(p)
+            if isinstance(p, tuple):
+                return tuple([clean_path(sp) for sp in p])
             if hashable_path(p) != hashable_path(p.meta.dealiased):
                 raise ValueError(("It doesn't make sense to index on an alias "
                                   "'{}'").format(p))
@@ -271,32 +962,71 @@ class FactMap(object):
             return hashable_path(p)
 
         self._ptype = ptype
-        self._factset = FactSet()
+        self._columnar = columnar
+        self._factset = ColumnarFactSet(ptype) if columnar else FactSet()
+        self._version = next(_fm_versions)
         self._path2factindex = {}
         self._factindexes = []
 
-        # Validate the paths to be indexed
-        allindexes = set([clean_path(p) for p in indexes])
-
-        for pth in allindexes:
-            tmppath=path(pth)
-            if hashable_path(tmppath.meta.dealiased) != hashable_path(tmppath):
-                raise ValueError(("Cannot create an index for an alias path "
-                                  "'{}'").format(tmppath))
-            if tmppath.meta.predicate != ptype:
-                raise ValueError(("Index path '{}' isn't a sub-path of Predicate "
-                                  "'{}'").format(tmppath, path(ptype)))
-            tmpfi = FactIndex(tmppath)
-            self._path2factindex[hashable_path(tmppath)] = tmpfi
+        # Validate the paths to be indexed (the first specification of a path
+        # determines the index type)
+        allindexes = {}
+        for idx in indexes:
+            (p, kind) = index_spec(idx)
+            allindexes.setdefault(clean_path(p), kind)
+
+        for pth, kind in allindexes.items():
+            tmppaths=index_paths(pth)
+            for tmppath in tmppaths:
+                if hashable_path(tmppath.meta.dealiased) != hashable_path(tmppath):
+                    raise ValueError(("Cannot create an index for an alias path "
+                                      "'{}'").format(tmppath))
+                if tmppath.meta.predicate != ptype:
+                    raise ValueError(("Index path '{}' isn't a sub-path of "
+                                      "Predicate '{}'").format(tmppath, path(ptype)))
+            if len(tmppaths) == 1: tmppaths = tmppaths[0]
+            tmpfi = make_factindex(tmppaths, kind)
+            self._path2factindex[pth] = tmpfi
             self._factindexes.append(tmpfi)
         self._factindexes = tuple(self._factindexes)
+        self._indexspecs = tuple(allindexes.items())
+        self._shared = False
+
+    #--------------------------------------------------------------------------
+    # Copy-on-write. A copy of a FactMap shares the fact set and indexes with
+    # the original and both are marked as shared. The first mutation of a
+    # shared FactMap gives it its own copy of the fact set and indexes (or new
+    # empty ones if it is being cleared).
+    #--------------------------------------------------------------------------
+    def _unshare(self, empty=False):
+        self._shared = False
+        if empty:
+            self._factset = ColumnarFactSet(self._ptype) if self._columnar \
+                            else FactSet()
+            p2fi = {}
+            for p, kind in self._indexspecs:
+                tmppaths = index_paths(p)
+                if len(tmppaths) == 1: tmppaths = tmppaths[0]
+                p2fi[p] = make_factindex(tmppaths, kind)
+        else:
+            self._factset = self._factset.copy()
+            p2fi = { p : fi.copy() for p, fi in self._path2factindex.items() }
+        self._path2factindex = p2fi
+        self._factindexes = tuple(p2fi.values())
 
     def add_facts(self, facts):
-        for f in facts:
-            self._factset.add(f)
-            for fi in self._factindexes: fi.add(f)
+        if self._shared: self._unshare()
+        self._version = next(_fm_versions)
+        if not self._factindexes:
+            self._factset.update(facts)
+            return
+        facts = list(facts)
+        self._factset.update(facts)
+        for fi in self._factindexes: fi.add_facts(facts)
 
     def add_fact(self, fact):
+        if self._shared: self._unshare()
+        self._version = next(_fm_versions)
         self._factset.add(fact)
         for fi in self._factindexes: fi.add(fact)
 
@@ -304,11 +1034,30 @@ class FactMap(object):
         self.remove(fact,False)
 
     def remove(self,fact, raise_on_missing=True):
+        if self._shared: self._unshare()
+        self._version = next(_fm_versions)
         if raise_on_missing: self._factset.remove(fact)
         else: self._factset.discard(fact)
         for fi in self._factindexes:
             fi.remove(fact,raise_on_missing)
 
+    # Bulk remove facts. With raise_on_missing the facts are checked before
+    # anything is removed so that a missing fact leaves the FactMap unchanged.
+    def remove_facts(self, facts, raise_on_missing=True):
+        factset = self._factset
+        facts = set(facts)
+        if raise_on_missing:
+            for f in facts:
+                if f not in factset: raise KeyError(f)
+        else:
+            facts = [f for f in facts if f in factset]
+        if not facts: return
+        if self._shared: self._unshare()
+        factset = self._factset
+        self._version = next(_fm_versions)
+        for f in facts: factset.remove(f)
+        for fi in self._factindexes: fi.remove_facts(facts)
+
     def pop(self):
         if not self._factset: raise KeyError("Cannot pop() an empty set of facts")
         fact = next(iter(self._factset))
@@ -316,6 +1065,8 @@ class FactMap(object):
         return fact
 
     def clear(self):
+        self._version = next(_fm_versions)
+        if self._shared: return self._unshare(True)
         self._factset.clear()
         for fi in self._factindexes: fi.clear()
 
@@ -327,39 +1078,51 @@ class FactMap(object):
     def factset(self):
         return self._factset
 
+    @property
+    def columnar(self):
+        return self._columnar
+
     @property
     def path2factindex(self):
         return self._path2factindex
 
+    @property
+    def version(self):
+        return self._version
+
     def __bool__(self):
         return bool(self._factset)
 
     #--------------------------------------------------------------------------
     # Set functions
     #--------------------------------------------------------------------------
+    # Note: when there are no (non-empty) others the union and difference are
+    # (copy-on-write) copies
     def union(self,*others):
-        nfm = FactMap(self.predicate, self._path2factindex.keys())
-        tmpothers = [_fm_iterable(o) for o in others]
+        tmpothers = [_fm_iterable(o) for o in others if o]
+        if not tmpothers: return self.copy()
+        nfm = FactMap(self.predicate, self._indexspecs, self._columnar)
         tmp = self.factset.union(*tmpothers)
         nfm.add_facts(tmp)
         return nfm
 
     def intersection(self,*others):
-        nfm = FactMap(self.predicate, self._path2factindex.keys())
+        nfm = FactMap(self.predicate, self._indexspecs, self._columnar)
         tmpothers = [_fm_iterable(o) for o in others]
         tmp = self.factset.intersection(*tmpothers)
         nfm.add_facts(tmp)
         return nfm
 
     def difference(self,*others):
-        nfm = FactMap(self.predicate, self._path2factindex.keys())
-        tmpothers = [_fm_iterable(o) for o in others]
+        tmpothers = [_fm_iterable(o) for o in others if o]
+        if not tmpothers: return self.copy()
+        nfm = FactMap(self.predicate, self._indexspecs, self._columnar)
         tmp = self.factset.difference(*tmpothers)
         nfm.add_facts(tmp)
         return nfm
 
     def symmetric_difference(self,other):
-        nfm = FactMap(self.predicate, self._path2factindex.keys())
+        nfm = FactMap(self.predicate, self._indexspecs, self._columnar)
         tmp = self.factset.symmetric_difference(_fm_iterable(other))
         nfm.add_facts(tmp)
         return nfm
@@ -368,13 +1131,12 @@ class FactMap(object):
         self.add_facts(itertools.chain(*[_fm_iterable(o) for o in others]))
 
     def intersection_update(self,*others):
-        for f in set(self.factset):
-            for o in others:
-                if f not in _fm_iterable(o): self.discard(f)
+        tmpothers = [_fm_iterable(o) for o in others]
+        self.remove_facts([f for f in self.factset
+                           if any(f not in o for o in tmpothers)])
 
     def difference_update(self,*others):
-        for f in itertools.chain(*[o.factset for o in others]):
-            self.discard(f)
+        self.remove_facts(itertools.chain(*[o.factset for o in others]), False)
 
     def symmetric_difference_update(self, other):
         to_remove=set()
@@ -383,15 +1145,58 @@ class FactMap(object):
             if f in _fm_iterable(other): to_remove.add(f)
         for f in _fm_iterable(other):
             if f not in self._factset: to_add.add(f)
-        for f in to_remove: self.discard(f)
+        self.remove_facts(to_remove)
         self.add_facts(to_add)
 
     def copy(self):
-        nfm = FactMap(self.predicate, self._path2factindex.keys())
-        nfm.add_facts(self.factset)
+        nfm = copy.copy(self)
+        self._shared = nfm._shared = True
         return nfm
 
 
+#------------------------------------------------------------------------------
+# FactSetDifference is a read-only view of the facts in one fact set that are
+# not in another. Nothing is copied; the difference is evaluated when the view
+# is iterated over. If both fact sets are the same object (eg. a copy-on-write
+# FactMap copy that hasn't been modified) then the difference is empty without
+# looking at the facts.
+#
+# The inputs can be FactMaps, in which case the fact set is looked up each time
+# the view is evaluated so the view follows a copy-on-write FactMap that
+# replaces its fact set.
+#------------------------------------------------------------------------------
+
+def _fm_factset(obj):
+    return obj.factset if isinstance(obj, FactMap) else obj
+
+class FactSetDifference(object):
+    def __init__(self, factset, other):
+        self._factset = factset
+        self._other = other
+
+    def __iter__(self):
+        factset = _fm_factset(self._factset)
+        other = _fm_factset(self._other)
+        if factset is other: return iter(())
+        return (f for f in factset if f not in other)
+
+    def __contains__(self, fact):
+        return fact in _fm_factset(self._factset) and \
+            fact not in _fm_factset(self._other)
+
+    def __bool__(self):
+        for _ in self: return True
+        return False
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __str__(self):
+        return "{" + ", ".join([repr(f) for f in self]) + "}"
+
+    def __repr__(self):
+        return self.__str__()
+
 #------------------------------------------------------------------------------
 # main
 #------------------------------------------------------------------------------
@@ -6,19 +6,23 @@ import io
 import sys
 import operator
 import collections
+import collections.abc as cabc
 import bisect
 import abc
 import functools
 import itertools
+import heapq
 import inspect
 import enum
+import keyword
 
 from ..util import OrderedSet as FactSet
 from ..util.tools import all_equal
 from .core import *
 from .core import get_field_definition, QCondition, PredicatePath, \
     validate_root_paths, kwargs_check_keys, trueall, falseall
-from .factcontainers import FactSet, FactIndex, FactMap
+from .factcontainers import FactSet, FactIndex, FactMap, ColumnarFactSet, \
+    index_paths, index_hashable
 
 __all__ = [
     'Placeholder',
@@ -33,6 +37,7 @@ __all__ = [
     'fixed_join_order',
     'basic_join_order',
     'oppref_join_order',
+    'cost_join_order',
     ]
 
 #------------------------------------------------------------------------------
@@ -176,6 +181,23 @@ ph2_ = PositionalPlaceholder(posn=1)
 ph3_ = PositionalPlaceholder(posn=2)
 ph4_ = PositionalPlaceholder(posn=3)
 
+#------------------------------------------------------------------------------
+# The value for a placeholder given the positional and keyword arguments that
+# are bound to a query (or the placeholder's default value). 'context' is only
+# used in the error message.
+#------------------------------------------------------------------------------
+def placeholder_value(ph, args, kwargs, context=None):
+    if isinstance(ph,PositionalPlaceholder):
+        if ph.posn < len(args): return args[ph.posn]
+        raise ValueError(("Missing positional placeholder argument '{}' "
+                          "when grounding '{}' with positional arguments: "
+                          "{}").format(ph,context,args))
+    if ph.name in kwargs: return kwargs[ph.name]
+    if ph.has_default: return ph.default
+    raise ValueError(("Missing named placeholder argument '{}' "
+                      "when grounding '{}' with arguments: "
+                      "{}").format(ph,context,kwargs))
+
 
 # ------------------------------------------------------------------------------
 # API function to build a functor wrapper object as part of a specifying a where
@@ -409,18 +431,7 @@ class StandardComparator(Comparator):
     def ground(self,*args,**kwargs):
         def get(arg):
             if not isinstance(arg,Placeholder): return arg
-            if isinstance(arg,PositionalPlaceholder):
-                if arg.posn < len(args): return args[arg.posn]
-                raise ValueError(("Missing positional placeholder argument '{}' "
-                                  "when grounding '{}' with positional arguments: "
-                                  "{}").format(arg,self,args))
-            elif isinstance(arg,NamedPlaceholder):
-                v = kwargs.get(arg.name,None)
-                if v: return v
-                if arg.has_default: return arg.default
-                raise ValueError(("Missing named placeholder argument '{}' "
-                                  "when grounding '{}' with arguments: "
-                                  "{}").format(arg,self,kwargs))
+            return placeholder_value(arg,args,kwargs,self)
 
         newargs = tuple([get(a) for a in self._args])
         if _hashables(newargs) == _hashables(self._args): return self
@@ -1092,12 +1103,12 @@ class Clause(object):
         return True
 
     def dealias(self):
-        newcomps = [ c.dealias() for c in self._comparators]
+        newcomps = tuple([ c.dealias() for c in self._comparators])
         if newcomps == self._comparators: return self
         return Clause(newcomps)
 
     def ground(self,*args, **kwargs):
-        newcomps = [ comp.ground(*args,**kwargs) for comp in self._comparators]
+        newcomps = tuple([ comp.ground(*args,**kwargs) for comp in self._comparators])
         if newcomps == self._comparators: return self
         return Clause(newcomps)
 
@@ -1129,6 +1140,223 @@ class Clause(object):
        return self.__str__()
 
 
+# ------------------------------------------------------------------------------
+# make_clauseblock_callable() generates (and compiles) the python source for a
+# single function that evaluates a conjunction of clauses. Rather than a chain
+# of closures for each comparator the field values are accessed directly as
+# attributes of the input facts and the standard comparison operators are
+# inlined. For example, the clause block '( [ F.anum == 1 | F.astr < G.astr ] &
+# [ G.anum != 2 ] )' with input signature (F,G) generates:
+#
+#     def clauseblock(facts):
+#         _f0 = facts[0]
+#         _f1 = facts[1]
+#         return True if (((_f0.anum == _c0) or (_f0.astr < _f1.astr)) and
+#                         ((_f1.anum != _c1))) else False
+#
+# Comparators that can't be inlined (eg. a FunctionComparator) fall back to
+# calling the comparator's own callable.
+#
+# The generated source only depends on the structure of the clauses and the
+# input signature. The constants (the static values, attribute getters, and
+# comparator callables) are parameters of an enclosing factory function:
+#
+#     def make_clauseblock(_c0, _c1):
+#         def clauseblock(facts):
+#             ...
+#         return clauseblock
+#
+# So the compiled factory is cached by its source and is shared by all clause
+# blocks with the same structure. Building a callable is then a single call.
+#
+# make_clauseblock_binder() also accepts clauses with placeholders. It returns
+# a function that takes the positional and keyword arguments that are bound to
+# the placeholders and returns the clause block callable. The placeholder values
+# (and the callables of any non-inlined comparators with placeholders) are just
+# further factory parameters. This allows a prepared query to be built once and
+# run with different values.
+# ------------------------------------------------------------------------------
+
+_inline_operators = {
+    operator.eq : "==", operator.ne : "!=", operator.lt : "<",
+    operator.le : "<=", operator.gt : ">", operator.ge : ">=" }
+
+GENERATED_FUNCTION_CACHE_SIZE = 256
+_generated_function_cache = collections.OrderedDict()
+
+# Returns a factory function (with the given parameters) that returns the
+# function 'fname' that is defined by the lines of source. The compiled factory
+# is cached by its source.
+def _compile_factory(fname, params, lines):
+    source = "\n".join(["def make_{}({}):".format(fname, ", ".join(params))] +
+                       ["    " + l for l in lines] +
+                       ["    return {}".format(fname)])
+    factory = _generated_function_cache.pop(source, None)
+    if factory is None:
+        namespace = {}
+        exec(compile(source, "<{}>".format(fname), "exec"), namespace)
+        factory = namespace["make_{}".format(fname)]
+    _generated_function_cache[source] = factory
+    while len(_generated_function_cache) > GENERATED_FUNCTION_CACHE_SIZE:
+        _generated_function_cache.popitem(last=False)
+    return factory
+
+def make_clauseblock_binder(clauses, root_signature):
+    pp2idx = { hashable_path(path(p)) : idx for idx,p in enumerate(root_signature) }
+    constants = []
+    bound = []          # (constant index, function of the bound arguments)
+    used = set()
+
+    def constant(value):
+        constants.append(value)
+        return "_c{}".format(len(constants)-1)
+
+    def parameter(func):
+        bound.append((len(constants), func))
+        return constant(None)
+
+    def access(pth):
+        idx = pp2idx.get(hashable_path(pth.meta.root),None)
+        if idx is None:
+            raise TypeError(("Invalid signature match between {} and {}: "
+                             "missing input predicate path for "
+                             "{}").format(root_signature,clauses,pth))
+        used.add(idx)
+        attrnames = pth.meta.attrnames
+        if all(n.isidentifier() and not keyword.iskeyword(n) for n in attrnames):
+            return ".".join(["_f{}".format(idx)] + list(attrnames))
+        return "{}(_f{})".format(constant(pth.meta.attrgetter), idx)
+
+    def operand(comp, arg):
+        p = path(arg,exception=False)
+        if p is not None: return access(p)
+        if not isinstance(arg, Placeholder): return constant(arg)
+        return parameter(lambda args, kwargs: placeholder_value(arg,args,kwargs,comp))
+
+    def comparison(comp):
+        if isinstance(comp, StandardComparator):
+            if comp.operator == trueall: return "True"
+            if comp.operator == falseall: return "False"
+            opstr = _inline_operators.get(comp.operator,None)
+            if opstr and len(comp.args) == 2:
+                (a,b) = comp.args
+                return "({} {} {})".format(operand(comp,a),opstr,operand(comp,b))
+        if comp.placeholders:
+            # Only pass the comparator's own named arguments
+            names = set([ph.name for ph in comp.placeholders
+                         if isinstance(ph, NamedPlaceholder)])
+            def make_cc(args, kwargs):
+                kwargs = { k : v for k,v in kwargs.items() if k in names }
+                return comp.ground(*args,**kwargs).make_callable(root_signature)
+            cc = parameter(make_cc)
+        else:
+            cc = constant(comp.ground().make_callable(root_signature))
+        return "{}(facts)".format(cc)
+
+    conjuncts = []
+    for clause in clauses:
+        conjuncts.append("({})".format(" or ".join(comparison(c) for c in clause)))
+    lines = ["def clauseblock(facts):"]
+    lines.extend("    _f{0} = facts[{0}]".format(idx) for idx in sorted(used))
+    lines.append("    return True if {} else False".format(" and ".join(conjuncts)))
+    params = ["_c{}".format(idx) for idx in range(len(constants))]
+    factory = _compile_factory("clauseblock", params, lines)
+
+    if not bound:
+        cb = factory(*constants)
+        return lambda *args, **kwargs: cb
+
+    def bind(*args, **kwargs):
+        values = list(constants)
+        for idx, func in bound: values[idx] = func(args, kwargs)
+        return factory(*values)
+    return bind
+
+def make_clauseblock_callable(clauses, root_signature):
+    for clause in clauses:
+        if clause.placeholders:
+            raise TypeError(("Internal bug: cannot make a non-ground clause "
+                             "callable: {}").format(clause))
+    return make_clauseblock_binder(clauses, root_signature)()
+
+# ------------------------------------------------------------------------------
+# make_factset_scan() returns a generator function for the facts of a factset
+# that satisfy a single root clause block. For a ColumnarFactSet the clauses
+# that only compare fields of the fact (with each other or with static values)
+# are evaluated directly on the columns by a generated function, so only the
+# facts that satisfy these clauses are materialised. Any remaining clauses are
+# tested against the materialised facts. The generator function takes the
+# values for any placeholders (see make_clauseblock_binder()).
+# ------------------------------------------------------------------------------
+
+def make_factset_scan(factset, clauseblock, root):
+
+    def is_column_clause(clause):
+        for comp in clause:
+            if not isinstance(comp, StandardComparator): return False
+            if comp.operator not in _inline_operators: return False
+            if comp.placeholders or len(comp.args) != 2: return False
+            for a in comp.args:
+                p = path(a,exception=False)
+                if p is not None and len(p.meta.attrnames) != 1: return False
+        return True
+
+    colclauses = []
+    otherclauses = []
+    if isinstance(factset, ColumnarFactSet):
+        for clause in clauseblock:
+            if is_column_clause(clause): colclauses.append(clause)
+            else: otherclauses.append(clause)
+    else:
+        otherclauses = list(clauseblock)
+
+    ccbind = None
+    if otherclauses: ccbind = ClauseBlock(otherclauses).make_binder([root])
+
+    if not colclauses:
+        def scan(*args, **kwargs):
+            cc = ccbind(*args, **kwargs)
+            for f in factset:
+                if cc((f,)): yield f
+        return scan
+
+    constants = [ itertools.count ]
+    columns = {}
+
+    def operand(arg):
+        p = path(arg,exception=False)
+        if p is None:
+            constants.append(arg)
+            return "_c{}".format(len(constants)-1)
+        cname = p.meta.attrnames[0]
+        if cname not in columns: columns[cname] = "_v{}".format(len(columns))
+        return columns[cname]
+
+    def comparison(comp):
+        (a,b) = comp.args
+        return "({} {} {})".format(operand(a), _inline_operators[comp.operator],
+                                   operand(b))
+
+    conjuncts = [ "({})".format(" or ".join(comparison(c) for c in clause)) \
+                  for clause in colclauses ]
+    cvars = list(columns.values())
+    lines = ["def rows(_alive, {}):".format(", ".join(cvars)),
+             "    return [_r for _r, _a, {0} in zip(_c0(), _alive, {0}) "
+             "if _a and {1}]".format(", ".join(cvars), " and ".join(conjuncts))]
+    params = ["_c{}".format(idx) for idx in range(len(constants))]
+    rows = _compile_factory("rows", params, lines)(*constants)
+    cnames = list(columns.keys())
+
+    def scan(*args, **kwargs):
+        matched = rows(factset.alive, *[factset.column(n) for n in cnames])
+        if ccbind is None:
+            yield from factset.facts(matched)
+        else:
+            cc = ccbind(*args, **kwargs)
+            for f in factset.facts(matched):
+                if cc((f,)): yield f
+    return scan
+
 # ------------------------------------------------------------------------------
 # A group of clauses. This should be interpreted as a conjunction of clauses.
 # We want to maintain multiple blocks where each block is identified by a single
@@ -1181,23 +1409,20 @@ class ClauseBlock(object):
         return True
 
     def ground(self,*args, **kwargs):
-        newclauses = [ clause.ground(*args,**kwargs) for clause in self._clauses]
+        newclauses = tuple([ clause.ground(*args,**kwargs) for clause in self._clauses])
         if newclauses == self._clauses: return self
         return ClauseBlock(newclauses)
 
     def dealias(self):
-        newclauses = [ c.dealias() for c in self._clauses]
+        newclauses = tuple([ c.dealias() for c in self._clauses])
         if newclauses == self._clauses: return self
         return ClauseBlock(newclauses)
 
     def make_callable(self, root_signature):
-        callables = [ c.make_callable(root_signature) for c in self._clauses]
-        callables = tuple(callables)
-        def comparison_callable(facts):
-            for c in callables:
-                if not c(facts): return False
-            return True
-        return comparison_callable
+        return make_clauseblock_callable(self._clauses, root_signature)
+
+    def make_binder(self, root_signature):
+        return make_clauseblock_binder(self._clauses, root_signature)
 
     def __add__(self, other):
         if not isinstance(other, self.__class__): return NotImplemented
@@ -1556,14 +1781,76 @@ def process_orderby(orderby_expressions, roots=[]):
     return validate_orderby_expression(orderby_expressions,roots)
 
 
+# ------------------------------------------------------------------------------
+# The indexed paths passed to the query planner can be a collection of paths or
+# a mapping from (hashable) paths to the corresponding FactIndex objects. With a
+# mapping the planner can take into account the type of each index. Returns the
+# set of hashable paths for indexes that only support equality lookups. Note: a
+# composite index is identified by a tuple of (hashable) paths.
+# ------------------------------------------------------------------------------
+
+def _equality_only_indexes(indexed_paths):
+    if not isinstance(indexed_paths, cabc.Mapping): return set()
+    return set([index_hashable(p) for p, fi in indexed_paths.items()
+                if not fi.ordered])
+
+_range_operators = (operator.lt, operator.le, operator.gt, operator.ge)
+
+# ------------------------------------------------------------------------------
+# make_composite_prejoin_key(composites, eqonly, clauseblock)
+# - composites - a list of composite indexes (tuples of hashable paths)
+# - eqonly - the set of indexes that only support equality lookups
+# - clauses - a clause block that can only refer to a single root
+#
+# A composite index can be used for a conjunction of single comparator clauses
+# that test for equality on a prefix of the index paths, optionally followed by
+# a range comparison on the next path (for an ordered index). Returns the
+# matching clauses (in index order) for the composite index that covers the most
+# clauses, or an empty list if there is no match.
+# ------------------------------------------------------------------------------
+def make_composite_prejoin_key(composites, eqonly, clauseblock):
+    singles = {}
+    for cl in clauseblock:
+        if len(cl) != 1 or not isinstance(cl[0], StandardComparator): continue
+        sc = cl[0]
+        if len(sc.paths) != 1: continue
+        sc = _align_sc_path(sc.paths[0].meta.root, sc)
+        if isinstance(sc.args[1], PredicatePath): continue
+        hpath = hashable_path(sc.args[0].meta.dealiased)
+        singles.setdefault((hpath, sc.operator), cl)
+
+    best = []
+    for cpaths in composites:
+        match = []
+        for hpath in cpaths:
+            cl = singles.get((hpath, operator.eq))
+            if cl is None: break
+            match.append(cl)
+        if cpaths in eqonly:
+            if len(match) != len(cpaths): continue
+        elif len(match) < len(cpaths):
+            for op in _range_operators:
+                cl = singles.get((cpaths[len(match)], op))
+                if cl is not None:
+                    match.append(cl)
+                    break
+        if len(match) > len(best): best = match
+    return best
+
 # ------------------------------------------------------------------------------
 # make_prejoin_pair(indexed_paths, clauses)
-# - indexed_paths - a list of paths for which there is a factindex
+# - indexed_paths - a list of paths for which there is a factindex (or a mapping
+#                   from paths to factindexes)
 # - clauses - a clause block that can only refer to a single root
 #
 # Tries to extract a clause that references a single path that can be used for
 # indexing and returns a pair consisting of the (comparator, remainder) Note: we
-# can't deal with disjunctive clauses (future work)
+# can't deal with disjunctive clauses (future work). A hash index can only be
+# used for a clause consisting of equality comparisons.
+#
+# If a composite index covers more than one clause (or there is no single path
+# candidate) then the first element of the returned pair is a ClauseBlock of
+# the clauses covered by the composite index (see make_composite_prejoin_key).
 # ------------------------------------------------------------------------------
 def make_prejoin_pair(indexed_paths, clauseblock):
     def preference(cl):
@@ -1575,13 +1862,18 @@ def make_prejoin_pair(indexed_paths, clauseblock):
             if not isinstance(c, StandardComparator): return False
         hpaths = set([hashable_path(p.meta.dealiased) for p in cl.paths])
         if len(hpaths) != 1: return False
-        return next(iter(hpaths)) in indexes
+        hpath = next(iter(hpaths))
+        if hpath not in indexes: return False
+        if hpath not in eqonly: return True
+        return all(c.operator == operator.eq for c in cl)
 
     if not clauseblock: return (None,None)
 
     tmp = set([hashable_path(p.meta.dealiased) for p in clauseblock.paths])
-    indexes = set(filter(lambda x: x in tmp,
-                         [hashable_path(p) for p in indexed_paths]))
+    hindexes = [index_hashable(p) for p in indexed_paths]
+    indexes = set(filter(lambda x: x in tmp, hindexes))
+    composites = [hp for hp in hindexes if isinstance(hp, tuple) and hp[0] in tmp]
+    eqonly = _equality_only_indexes(indexed_paths)
 
     # Search for a candidate to use with a fact index
     keyclause = None
@@ -1590,6 +1882,14 @@ def make_prejoin_pair(indexed_paths, clauseblock):
     for cl in clauseblock:
         if is_candidate(indexes, cl): candidates.append(cl)
         else: rest.append(cl)
+
+    # Prefer a composite index if it covers more than a single clause
+    if composites:
+        ckey = make_composite_prejoin_key(composites, eqonly, clauseblock)
+        if len(ckey) > 1 or (ckey and not candidates):
+            rest = [cl for cl in clauseblock if cl not in ckey]
+            return (ClauseBlock(ckey), ClauseBlock(rest) if rest else None)
+
     if not candidates: return (None, clauseblock)
 
     # order the candidates by their comparator preference and take the first
@@ -1647,8 +1947,11 @@ def _align_sc_path(root, sc):
     return sc
 
 # For a clause consisting of standard comparators align each standard comparator
+# (a composite index prejoin key is a clause block)
 def _align_clause_path(root,clause):
     if not clause: return None
+    if isinstance(clause, ClauseBlock):
+        return ClauseBlock([_align_clause_path(root,cl) for cl in clause])
     return Clause([_align_sc_path(root,sc) for sc in clause])
 
 # Extract the placeholders
@@ -1683,7 +1986,7 @@ class JoinQueryPlan(object):
         self._root = path(root)
         self._predicate = self._root.meta.predicate
         self._indexes = tuple([p for p in indexes \
-                               if path(p).meta.predicate == self._predicate])
+                               if index_paths(p)[0].meta.predicate == self._predicate])
         self._joinsc = _align_sc_path(self._root, joinsc)
         self._postjoincb = postjoincb
         self._postjoinobb = postjoinobb
@@ -2048,7 +2351,7 @@ def partition_orderbys(root_join_order, orderbys=[]):
 class QuerySpec(object):
     allowed = [ "roots", "join", "where", "order_by",
                 "group_by", "tuple", "unique", "bind", "select", "delete",
-                "heuristic", "joh" ]
+                "heuristic", "joh", "limit", "offset" ]
 
     def __init__(self,**kwargs):
         for k,v in kwargs.items():
@@ -2084,6 +2387,12 @@ class QuerySpec(object):
 
 
     def bindp(self, *args, **kwargs):
+        self.validate_bindings(*args, **kwargs)
+        nwhere = self.where.ground(*args, **kwargs)
+        return self.modp(where=nwhere,bind=True)
+
+    # Check that there are placeholders for the values to be bound
+    def validate_bindings(self, *args, **kwargs):
         where = self.where
         if where is None:
             raise ValueError("'where' must be specified before binding placeholders")
@@ -2104,8 +2413,6 @@ class QuerySpec(object):
                                   "argument '{}' but there is no corresponding "
                                   "named placeholder in where clause "
                                   "'{}'").format(v,k,where))
-        nwhere = where.ground(*args, **kwargs)
-        return self.modp(where=nwhere,bind=True)
 
     def fill_defaults(self):
         toadd = dict(self._params)
@@ -2117,10 +2424,10 @@ class QuerySpec(object):
         toadd["tuple"] = self._params.get("tuple",False)
         toadd["unique"] = self._params.get("unique",False)
         toadd["heuristic"] = self._params.get("heuristic",False)
-        toadd["joh"] = self._params.get("joh",oppref_join_order)
+        toadd["joh"] = self._params.get("joh",cost_join_order)
 
-        # Note: No default values for "select" and "delete" so calling their
-        # attributes will return None
+        # Note: No default values for "select", "delete", "limit", and "offset"
+        # so calling their attributes will return None
 
 
         if toadd: return QuerySpec(**toadd)
@@ -2209,13 +2516,16 @@ def make_query_plan_preordered_roots(indexed_paths, root_join_order,
 # and the user specifies the exact ordering, 2) basic_join_order simply retains
 # the ordering given as part of the query specification.
 #
-# The default heuristic, oppref_join_order, is a operator preference heuristic.
+# The oppref_join_order heuristic is a operator preference heuristic.
 # The idea is to assign a preference value to each join expression based on the
 # number of join expressions connected with a root path and the operator
 # preference. The higher the value the further it is to the outer loop. The
 # intuition is that the joins reduce the number of tuples, so by assigning the
 # joins early you generate the fewest tuples. Note: not sure about my intuitions
 # here. Need to look more closely at the mysql discussion on query execution.
+#
+# The default heuristic, cost_join_order, estimates the cost of each ordering
+# from the size of the data (see below).
 # ------------------------------------------------------------------------------
 
 def fixed_join_order(*roots):
@@ -2258,18 +2568,190 @@ def oppref_join_order(indexed_paths, qspec):
     return [path(hrp) for hrp in \
             sorted(root2val.keys(), key = lambda k : root2val[k], reverse=True)]
 
+# ------------------------------------------------------------------------------
+# A cost based join order heuristic. The cost of a (left-deep) join order is
+# estimated from the number of facts for each root, the selectivity of the
+# where clauses for each root and the selectivity of the joins. The estimated
+# cost of each step is the number of input tuples plus the number of facts for
+# the root (to build the join source, unless an existing FactIndex can be used
+# for the join) plus the number of output tuples, or the size of the cross
+# product if there is no join. The selectivity estimates are
+# the textbook ones: 1/(number of distinct keys) for an equality (where the
+# number of distinct keys is taken from a FactIndex if there is one), 1/3 for
+# the other comparisons and 1/2 for a function comparator.
+#
+# The orderings are searched exhaustively for a small number of roots and
+# greedily otherwise. Candidate orders are generated starting from the
+# oppref_join_order so that it is the one chosen if the costs are equal.
+#
+# Since the number of facts is not part of the query specification the fact
+# sets are passed as an optional extra argument (make_query_plan() does this).
+# Without the fact sets the size of a FactIndex for a predicate is used (and a
+# default size if there is none).
+# ------------------------------------------------------------------------------
+
+_DEFAULT_FACTSET_SIZE = 1000
+_EXHAUSTIVE_JOIN_ORDER_LIMIT = 6
+
+def cost_join_order(indexed_paths, qspec, factsets=None):
+    roots = oppref_join_order(indexed_paths, qspec)
+    if len(roots) <= 1: return roots
+
+    factindexes = {}
+    if isinstance(indexed_paths, cabc.Mapping):
+        factindexes = { hp : fi for hp, fi in indexed_paths.items() \
+                        if not isinstance(hp, tuple) }
+
+    def size(root):
+        ptype = root.meta.predicate
+        if factsets is not None: return len(factsets.get(ptype, ()))
+        for hp, fi in factindexes.items():
+            if path(hp).meta.predicate == ptype: return len(fi)
+        return _DEFAULT_FACTSET_SIZE
+
+    hroots = [hashable_path(r) for r in roots]
+    sizes = { hr : size(r) for hr, r in zip(hroots, roots) }
+
+    # The number of distinct values for a path
+    def distinct(pth):
+        fi = factindexes.get(hashable_path(pth.meta.dealiased))
+        if fi is not None: return max(fi.num_keys, 1)
+        return max(sizes[hashable_path(pth.meta.root)], 1)
+
+    def sc_selectivity(sc):
+        if not isinstance(sc, StandardComparator): return 0.5
+        if sc.operator not in (operator.eq, operator.ne): return 1.0/3.0
+        dists = [distinct(a) for a in sc.args if isinstance(a, PredicatePath)]
+        sel = 1.0/max(dists) if dists else 1.0
+        return sel if sc.operator == operator.eq else 1.0 - sel
+
+    def clause_selectivity(cl):
+        return min(1.0, sum([sc_selectivity(sc) for sc in cl]))
+
+    # Estimated number of facts for each root after the where clauses
+    rootcbs, catchall = partition_clauses(qspec.where)
+    filtered = dict(sizes)
+    for cb in rootcbs:
+        hr = hashable_path(cb.roots[0])
+        for cl in cb: filtered[hr] *= clause_selectivity(cl)
+
+    # The joins and multi-root clauses with the roots they refer to, and the
+    # roots that don't need a join source to be built for a join because they
+    # are unfiltered and have an existing FactIndex for the join key.
+    unfiltered = set(hroots) - set([hashable_path(cb.roots[0]) for cb in rootcbs])
+    def indexed_roots(j):
+        out = set()
+        for a in j.args:
+            fi = factindexes.get(hashable_path(a.meta.dealiased))
+            if fi is None or (j.operator != operator.eq and not fi.ordered): continue
+            out.add(hashable_path(a.meta.root))
+        return out & unfiltered
+
+    conditions = [(set([hashable_path(r) for r in j.roots]), sc_selectivity(j),
+                   True, indexed_roots(j)) for j in qspec.join]
+    if catchall:
+        conditions.extend([(set([hashable_path(r) for r in cl.roots]),
+                            clause_selectivity(cl), False, set())
+                           for cl in catchall])
+
+    # Cost of adding a root to a partial join order with the given cardinality
+    def step(visited, card, hr):
+        newvisited = visited | set([hr])
+        sel = 1.0
+        joined = False
+        build = sizes[hr]
+        for croots, csel, isjoin, iroots in conditions:
+            if hr in croots and croots.issubset(newvisited):
+                sel *= csel
+                joined = joined or isjoin
+                if hr in iroots: build = 0
+        ncard = card * filtered[hr] * sel
+        if joined: cost = card + build + ncard
+        else: cost = sizes[hr] + card * filtered[hr]
+        return (newvisited, ncard, cost)
+
+    def order_cost(order):
+        visited = set([order[0]])
+        card = filtered[order[0]]
+        cost = sizes[order[0]]
+        for hr in order[1:]:
+            visited, card, scost = step(visited, card, hr)
+            cost += scost
+        return cost
+
+    if len(hroots) <= _EXHAUSTIVE_JOIN_ORDER_LIMIT:
+        best = min(itertools.permutations(hroots), key=order_cost)
+    else:
+        remaining = list(hroots)
+        best = [min(remaining, key=lambda hr: filtered[hr])]
+        remaining.remove(best[0])
+        (visited, card) = (set(best), filtered[best[0]])
+        while remaining:
+            steps = [(step(visited, card, hr), hr) for hr in remaining]
+            ((visited, card, _), hr) = min(steps, key=lambda x: x[0][2])
+            best.append(hr)
+            remaining.remove(hr)
+    return [path(hr) for hr in best]
+
 
 # ------------------------------------------------------------------------------
 # Take a join order heuristic, a list of joins, and a list of clause blocks and
 # and generates a query.
 # ------------------------------------------------------------------------------
 
-def make_query_plan(indexed_paths, qspec):
+def make_query_plan(indexed_paths, qspec, factsets=None):
     qspec = qspec.fill_defaults()
-    root_order = qspec.joh(indexed_paths, qspec)
+    if qspec.joh is cost_join_order:
+        root_order = cost_join_order(indexed_paths, qspec, factsets)
+    else:
+        root_order = qspec.joh(indexed_paths, qspec)
     return make_query_plan_preordered_roots(indexed_paths, root_order, qspec)
 
 
+# ------------------------------------------------------------------------------
+# An LRU cache of query plans. A query plan only depends on the query
+# specification and the indexes (ie. the paths and the type of the FactIndex
+# objects) so the plan can be shared between queries on different FactBases
+# with the same index layout. The exception is the cost based join order
+# heuristic which also depends on the number of facts, so the order of
+# magnitude (in base 2) of the fact set sizes is also part of the key (see
+# factset_size_signature()). Note: the where clause is part of the key so
+# this only helps queries that are re-run with the same values. For
+# parameterised queries see the prepared queries (FactBase.query().prepare()).
+# ------------------------------------------------------------------------------
+
+QUERY_PLAN_CACHE_SIZE = 128
+_query_plan_cache = collections.OrderedDict()
+
+def factset_size_signature(qspec, factsets):
+    if factsets is None or qspec.joh is not cost_join_order: return None
+    if len(qspec.roots) <= 1: return None
+    return frozenset([(pt, len(fs).bit_length()) for pt, fs in factsets.items()])
+
+def query_plan_key(factindexes, qspec, factsets=None):
+    layout = frozenset([(p, fi.ordered) for p, fi in factindexes.items()])
+    return (tuple([hashable_path(r) for r in qspec.roots]), tuple(qspec.join),
+            tuple(qspec.where) if qspec.where else (),
+            tuple(qspec.order_by) if qspec.order_by else (),
+            qspec.joh, layout, factset_size_signature(qspec, factsets))
+
+def make_cached_query_plan(factindexes, qspec, factsets=None):
+    qspec = qspec.fill_defaults()
+    try:
+        key = query_plan_key(factindexes, qspec, factsets)
+        qplan = _query_plan_cache.pop(key, None)
+    except TypeError:       # the where clause contains unhashable values
+        return make_query_plan(factindexes, qspec, factsets)
+    if qplan is None:
+        qplan = make_query_plan(factindexes, qspec, factsets)
+    _query_plan_cache[key] = qplan
+    while len(_query_plan_cache) > QUERY_PLAN_CACHE_SIZE:
+        _query_plan_cache.popitem(last=False)
+    return qplan
+
+def clear_query_plan_cache():
+    _query_plan_cache.clear()
+
 #------------------------------------------------------------------------------
 # Implementing Queries - taking a QuerySpec, QueryPlan, and a FactMap and
 # generating an actual query.
@@ -2319,6 +2801,92 @@ class InQuerySorter(object):
                 outlist.sort(key=kf,reverse=reverse)
         return outlist
 
+    # Return the first k elements of the sorted input. Uses a heap of size k.
+    # Note: heapq.nsmallest(k,...) is equivalent to sorted(...)[:k] (and
+    # nlargest() to a reverse sort) so the ordering of equal elements is the
+    # same as for sorted().
+    def topk(self, k, input):
+        sorter = tuple(reversed(self._sorter))
+        kfs = tuple([kf for kf,_ in sorter])
+        reverses = tuple([reverse for _,reverse in sorter])
+        if len(kfs) == 1: key = kfs[0]
+        else: key = lambda x: tuple([kf(x) for kf in kfs])
+        if all(reverses): return heapq.nlargest(k, input, key=key)
+        if not any(reverses): return heapq.nsmallest(k, input, key=key)
+        return heapq.nsmallest(k, input,
+                               key=lambda x: _MixedOrderKey(key(x), reverses))
+
+# A sort key for a mix of ascending and descending sort criteria
+class _MixedOrderKey(object):
+    __slots__ = ("values", "reverses")
+    def __init__(self, values, reverses):
+        self.values = values
+        self.reverses = reverses
+
+    def __lt__(self, other):
+        for a, b, reverse in zip(self.values, other.values, self.reverses):
+            if a == b: continue
+            return b < a if reverse else a < b
+        return False
+
+# ------------------------------------------------------------------------------
+# Returns a generator function for the facts matching a (ground) prejoin key. The
+# prejoin key is either a clause for a single path factindex or a clause block
+# for a composite factindex. For a composite factindex find the first index
+# where the leading paths match the equality clauses followed by the range
+# clause (if there is one). A prejoin key value can be a placeholder, in which
+# case the value is taken from the arguments of the generator function.
+# - factindexes - a dictionary mapping a hashable_path to a factindex
+# ------------------------------------------------------------------------------
+
+# Returns a function of the bound arguments that returns the key value
+def _key_value(sc):
+    value = sc.args[1]
+    if not isinstance(value, Placeholder): return lambda args, kwargs: value
+    return lambda args, kwargs: placeholder_value(value, args, kwargs, sc)
+
+def make_prejoin_key_query(jqp, pjk, factindexes):
+    predicate = jqp.root.meta.predicate
+
+    def single_query():
+        tmp = pjk.dealias().paths
+        factindex = factindexes.get(hashable_path(tmp[0]),None)
+        if len(tmp) != 1 or not factindex or tmp[0].meta.predicate != predicate:
+            raise ValueError(("Internal error: prejoin key clause '{}' is invalid "
+                              "for JoinQueryPlan {}").format(pjk,jqp))
+        keys = [(sc.operator, _key_value(sc)) for sc in pjk]
+        def query_pjk(*args, **kwargs):
+            for op, value in keys:
+                for f in factindex.find(op, value(args, kwargs)):
+                    yield f
+        return query_pjk
+
+    if not isinstance(pjk, ClauseBlock): return single_query()
+
+    scs = [cl[0] for cl in pjk]
+    rng = scs.pop() if scs[-1].operator != operator.eq else None
+    hpaths = tuple([hashable_path(sc.args[0].meta.dealiased) for sc in scs])
+    if rng: hpaths += (hashable_path(rng.args[0].meta.dealiased),)
+    factindex = None
+    for hpth, fi in factindexes.items():
+        if not isinstance(hpth, tuple) or hpth[:len(hpaths)] != hpaths: continue
+        if not fi.ordered and (rng or len(hpth) != len(hpaths)): continue
+        factindex = fi
+        break
+    if not factindex or index_paths(hpaths)[0].meta.predicate != predicate:
+        raise ValueError(("Internal error: missing composite FactIndex for "
+                          "prejoin key '{}' in JoinQueryPlan {}").format(pjk,jqp))
+
+    values = [_key_value(sc) for sc in scs]
+    rngvalue = _key_value(rng) if rng else None
+    def composite_query(*args, **kwargs):
+        prefix = tuple([value(args, kwargs) for value in values])
+        if rng:
+            return factindex.find_prefix(prefix, rng.operator,
+                                         rngvalue(args, kwargs))
+        return factindex.find_prefix(prefix)
+    return composite_query
+
 # ------------------------------------------------------------------------------
 # prejoin query is the querying of the underlying factset or factindex
 # - factsets - a dictionary mapping a predicate to a factset
@@ -2330,24 +2898,24 @@ def make_first_prejoin_query(jqp, factsets, factindexes):
 
     prejcl = jqp.prejoin_key
     prejcb = jqp.prejoin_clauses
-    factindex = None
-    if prejcl:
-        factindex=factindexes.get(hashable_path(prejcl.paths[0]),None)
-        if not factindex:
-            raise ValueError(("Internal error: missing FactIndex for "
-                              "path '{}'").format(prejcl.args[0]))
-
-    def unsorted_query():
-        if prejcb: cc = prejcb.make_callable([jqp.root.meta.dealiased])
-        else: cc = lambda _ : True
-
-        if factindex:
-            for sc in prejcl:
-                for f in factindex.find(sc.operator,sc.args[1]):
-                    if cc((f,)): yield (f,)
+    query_pjk = None
+    if prejcl: query_pjk = make_prejoin_key_query(jqp, prejcl, factindexes)
+
+    ccbind = lambda *args, **kwargs: (lambda _ : True)
+    if query_pjk and prejcb: ccbind = prejcb.make_binder([jqp.root.meta.dealiased])
+    scan = None
+    if not query_pjk and prejcb:
+        scan = make_factset_scan(factset, prejcb, jqp.root.meta.dealiased)
+
+    def unsorted_query(*args, **kwargs):
+        if query_pjk:
+            cc = ccbind(*args, **kwargs)
+            for f in query_pjk(*args, **kwargs):
+                if cc((f,)): yield (f,)
+        elif scan:
+            for f in scan(*args, **kwargs): yield (f,)
         else:
-            for f in factset:
-                    if cc((f,)): yield (f,)
+            for f in factset: yield (f,)
 
     return unsorted_query
 
@@ -2357,7 +2925,7 @@ def make_first_prejoin_query(jqp, factsets, factindexes):
 # - factindexes - a dictionary mapping a hashable_path to a factindex
 # ------------------------------------------------------------------------------
 
-def make_first_join_query(jqp, factsets, factindexes):
+def make_first_join_query(jqp, factsets, factindexes, topk=None):
 
     if jqp.input_signature:
         raise ValueError(("A first JoinQueryPlan must have an empty input "
@@ -2373,16 +2941,105 @@ def make_first_join_query(jqp, factsets, factindexes):
     elif jqp.postjoin_orderbys:
         iqs = InQuerySorter(jqp.postjoin_orderbys,(jqp.root,))
 
-    def sorted_query():
-        return iqs.sorted(base_query())
-    if iqs: return sorted_query
-    else: return base_query
+    def sorted_query(*args, **kwargs):
+        return iqs.sorted(base_query(*args, **kwargs))
+
+    # Only the first topk elements of the sorted query are needed. If there is
+    # a single sort order on a path with an ordered FactIndex then lazily walk
+    # the index (so the query can be terminated early) otherwise use a heap.
+    # Note: the index walk doesn't order facts with equal keys in the same way
+    # as sorted_query() (the tie order is unspecified for a limited query).
+    def topk_query(*args, **kwargs):
+        return iter(iqs.topk(topk, base_query(*args, **kwargs)))
+
+    def index_query(fi, asc):
+        ccbind = None
+        if jqp.prejoin_clauses:
+            ccbind = jqp.prejoin_clauses.make_binder([jqp.root.meta.dealiased])
+        def query(*args, **kwargs):
+            cc = ccbind(*args, **kwargs) if ccbind else None
+            for f in (fi if asc else reversed(fi)):
+                if cc is None or cc((f,)): yield (f,)
+        return query
+
+    if not iqs: return base_query
+    if topk is None: return sorted_query
+    obb = jqp.prejoin_orderbys if jqp.prejoin_orderbys else jqp.postjoin_orderbys
+    if len(obb) == 1 and not jqp.prejoin_key:
+        ob = obb[0]
+        fi = factindexes.get(hashable_path(path(ob.path).meta.dealiased),None)
+        if fi and fi.ordered: return index_query(fi, ob.asc)
+    return topk_query
+
+# ------------------------------------------------------------------------------
+# Transient join tables. When the facts for the inner side of a join are not
+# already indexed by the join key (or they are first filtered by a prejoin key
+# or clauses) then a join table is built in a single pass over the facts. For an
+# equality join a HashJoinTable maps each key to the list of matching facts (a
+# hash join). For the other operators a SortedJoinTable sorts the facts by the
+# key once so that each lookup is a bisection of the keys and a slice of the
+# sorted facts (a sort based range join). Both provide the find() lookup of a
+# FactIndex but return a list. For a hash table each list maintains the order of
+# the input facts.
+# ------------------------------------------------------------------------------
+
+class HashJoinTable(object):
+    def __init__(self, keypath, facts):
+        self._path = path(keypath)
+        kf = self._path.meta.attrgetter
+        table = {}
+        for f in facts:
+            k = kf(f)
+            bucket = table.get(k)
+            if bucket is None: table[k] = [f]
+            else: bucket.append(f)
+        self._table = table
+
+    def find(self, op, key):
+        if op != operator.eq:
+            raise ValueError(("unsupported operator {} for a hash "
+                              "join").format(op))
+        return self._table.get(key, [])
+
+    @property
+    def path(self): return self._path
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._table.values())
+
+class SortedJoinTable(object):
+    def __init__(self, keypath, facts, presorted=False):
+        self._path = path(keypath)
+        kf = self._path.meta.attrgetter
+        if presorted: self._facts = list(facts)
+        else: self._facts = sorted(facts, key=kf)
+        self._keys = [kf(f) for f in self._facts]
+
+    def find(self, op, key):
+        keys = self._keys
+        facts = self._facts
+        if op == operator.lt: return facts[:bisect.bisect_left(keys, key)]
+        if op == operator.le: return facts[:bisect.bisect_right(keys, key)]
+        if op == operator.gt: return facts[bisect.bisect_right(keys, key):]
+        if op == operator.ge: return facts[bisect.bisect_left(keys, key):]
+        lo = bisect.bisect_left(keys, key)
+        hi = bisect.bisect_right(keys, key, lo)
+        if op == operator.eq: return facts[lo:hi]
+        if op == operator.ne: return facts[:lo] + facts[hi:]
+        raise ValueError("unsupported operator {}".format(op))
+
+    @property
+    def path(self): return self._path
+
+    def __iter__(self):
+        return iter(self._facts)
 
 # ------------------------------------------------------------------------------
-# Returns a function that takes no arguments and returns a populated data
-# source.  The data source can be either a FactIndex, a FactSet, or a list.  In
-# the simplest case this function simply passes through a reference to the
-# underlying factset or factindex object. If it is a list then either the order
+# Returns a function that takes the values for any placeholders (see
+# make_query()) and returns a populated data source.  The data source can be
+# either a FactIndex, a join table, a FactSet, or a list.  In the simplest case
+# this function simply passes through a reference to the underlying factset or
+# factindex object. If it is a list then either the order
 # doesn't matter or it is sorted by the prejoin_orderbys sort order.
 #
 # NOTE: We don't use this for the first JoinQueryPlan as that is handled as a
@@ -2397,21 +3054,12 @@ def make_prejoin_query_source(jqp, factsets, factindexes):
     predicate = jqp.root.meta.predicate
     factset = factsets.get(jqp.root.meta.predicate, FactSet())
 
-    # If there is a prejoin key clause
+    # A prejoin_key query uses the factindex
     if pjk:
-        tmp = pjk.dealias().paths
-        pjk_path = hashable_path(tmp[0])
-        if len(tmp) != 1 or pjk_path not in factindexes \
-           or tmp[0].meta.predicate != predicate:
-            raise ValueError(("Internal error: prejoin key clause '{}' is invalid "
-                              "for JoinQueryPlan {}").format(pjk,jqp))
-        factindex = factindexes[pjk_path]
+        query_pjk_facts = make_prejoin_key_query(jqp, pjk, factindexes)
 
-    # A prejoin_key query uses the factindex
-    def query_pjk():
-        for sc in pjk:
-            for f in factindex.find(sc.operator,sc.args[1]):
-                yield (f,)
+    def query_pjk(*args, **kwargs):
+        for f in query_pjk_facts(*args, **kwargs): yield (f,)
 
     # If there is a set of prejoin clauses
     if pjc:
@@ -2420,16 +3068,17 @@ def make_prejoin_query_source(jqp, factsets, factindexes):
         if len(pjc.roots) != 1 and pjc_root.meta.predicate != predicate:
             raise ValueError(("Internal error: prejoin clauses '{}' is invalid "
                               "for JoinQueryPlan {}").format(pjc,jqp))
-        pjc_check = pjc.make_callable([pjc_root])
+        pjc_bind = pjc.make_binder([pjc_root])
+        if not pjk: pjc_scan = make_factset_scan(factset, pjc, pjc_root)
 
     # prejoin_clauses query uses the prejoin_key query or the underlying factset
-    def query_pjc():
+    def query_pjc(*args, **kwargs):
         if pjk:
-            for (f,) in query_pjk():
+            pjc_check = pjc_bind(*args, **kwargs)
+            for (f,) in query_pjk(*args, **kwargs):
                 if pjc_check((f,)): yield (f,)
         else:
-            for f in factset:
-                if pjc_check((f,)): yield (f,)
+            for f in pjc_scan(*args, **kwargs): yield (f,)
 
     # If there is a join key
     if jk:
@@ -2442,36 +3091,40 @@ def make_prejoin_query_source(jqp, factsets, factindexes):
     else: pjiqs = None
 
     # If there is either a pjk or pjc then we need to create a temporary source
-    # (using a FactIndex if there is a join key or a list otherwise). If there
-    # is no pjk or pjc but there is a key then use an existing FactIndex if
-    # there is one or create it.
-    def query_source():
+    # (using a join table if there is a join key or a list otherwise). If there
+    # is no pjk or pjc but there is a key then use an existing FactIndex for an
+    # equality join, or build a join table (from the existing FactIndex if
+    # possible since it is already sorted). The facts of a hash join table are
+    # added in prejoin order_by order so each lookup is already sorted.
+    def make_join_table(facts):
+        if jk.operator != operator.eq: return SortedJoinTable(jk_key_path, facts)
+        if pjiqs: facts = pjiqs.sorted(facts)
+        return HashJoinTable(jk_key_path, facts)
+
+    def query_source(*args, **kwargs):
         if jk:
             if pjc:
-                fi = FactIndex(path(jk_key_path))
-                for (f,) in query_pjc(): fi.add(f)
-                return fi
+                return make_join_table(f for (f,) in query_pjc(*args, **kwargs))
             elif pjk:
-                fi = FactIndex(path(jk_key_path))
-                for (f,) in query_pjk(): fi.add(f)
-                return fi
+                return make_join_table(f for (f,) in query_pjk(*args, **kwargs))
             else:
-                fi = factindexes.get(hashable_path(jk_key_path),None)
-                if fi: return fi
-                fi = FactIndex(path(jk_key_path))
-                for f in factset: fi.add(f)
-                return fi
+                fi = factindexes.get(jk_key_path,None)
+                if fi and jk.operator == operator.eq: return fi
+                if fi and fi.ordered:
+                    return SortedJoinTable(jk_key_path, fi, presorted=True)
+                return make_join_table(factset)
         else:
             source = None
             if not pjc and not pjk and not pjob: return factset
-            elif pjc: source = [f for (f,) in query_pjc() ]
-            elif pjk: source = [f for (f,) in query_pjk() ]
+            elif pjc: source = [f for (f,) in query_pjc(*args, **kwargs) ]
+            elif pjk: source = [f for (f,) in query_pjk(*args, **kwargs) ]
             if source and not pjob: return source
 
             if not source and pjob:
                 if len(pjob) == 1:
                     pjo = pjob[0]
                     fi = factindexes.get(hashable_path(pjo.path),None)
+                    if fi and not fi.ordered: fi = None
                     if fi and pjo.asc: return fi
                     elif fi: return list(reversed(fi))
 
@@ -2488,7 +3141,7 @@ def make_prejoin_query_source(jqp, factsets, factindexes):
 # - factindexes - a dictionary mapping a hashable_path to a factindex
 # ------------------------------------------------------------------------------
 
-def make_chained_join_query(jqp, inquery, factsets, factindexes):
+def make_chained_join_query(jqp, inquery, factsets, factindexes, topk=None):
 
     if not jqp.input_signature:
         raise ValueError(("A non-first JoinQueryPlan must have a non-empty input "
@@ -2508,27 +3161,32 @@ def make_chained_join_query(jqp, inquery, factsets, factindexes):
 
     # Setup any join clauses
     if jc:
-        jc_check = jc.make_callable(list(jqp.input_signature) + [jqp.root])
+        jc_bind = jc.make_binder(list(jqp.input_signature) + [jqp.root])
     else:
-        jc_check = lambda _: True
+        jc_bind = lambda *args, **kwargs: (lambda _: True)
 
-    def query_jk():
+    def query_jk(*args, **kwargs):
         operator = jk.operator
         align_query_input = make_input_alignment_functor(
             jqp.input_signature,(jk.args[1],))
-        fi = query_source()
-        for intuple in inquery():
+        jc_check = jc_bind(*args, **kwargs)
+        fi = query_source(*args, **kwargs)
+        is_table = isinstance(fi, (HashJoinTable, SortedJoinTable))
+        sort_result = pjob and not isinstance(fi, HashJoinTable)
+        for intuple in inquery(*args, **kwargs):
             v, = align_query_input(intuple)
-            result = list(fi.find(operator,v))
-            if pjob: pjiqs.listsort(result)
+            result = fi.find(operator,v)
+            if sort_result: result = pjiqs.sorted(result)
+            elif not is_table: result = list(result)
 
             for f in result:
                 out = tuple(intuple + (f,))
                 if jc_check(out): yield out
 
-    def query_no_jk():
-        source = query_source()
-        for intuple in inquery():
+    def query_no_jk(*args, **kwargs):
+        jc_check = jc_bind(*args, **kwargs)
+        source = query_source(*args, **kwargs)
+        for intuple in inquery(*args, **kwargs):
             for f in source:
                 out = tuple(intuple + (f,))
                 if jc_check(out): yield out
@@ -2539,29 +3197,41 @@ def make_chained_join_query(jqp, inquery, factsets, factindexes):
     if not job: return unsorted_query
 
     jiqs = InQuerySorter(job,list(jqp.input_signature) + [jqp.root])
-    def sorted_query():
-        return iter(jiqs.sorted(unsorted_query()))
+    def sorted_query(*args, **kwargs):
+        return iter(jiqs.sorted(unsorted_query(*args, **kwargs)))
 
-    return sorted_query
+    def topk_query(*args, **kwargs):
+        return iter(jiqs.topk(topk, unsorted_query(*args, **kwargs)))
+
+    return sorted_query if topk is None else topk_query
 
 #------------------------------------------------------------------------------
 # Makes a query given a ground QueryPlan and the underlying data. The returned
-# query object is a Python generator function that takes no arguments.
+# query object is a Python generator function that takes no arguments. If only
+# the first topk results of an ordered query are required then the last join
+# only keeps the topk results (although the query may still return more).
+#
+# If 'parameterised' is True then the QueryPlan can contain placeholders and the
+# generator function takes the positional and keyword arguments for the
+# placeholders (see PreparedQuery). So the query is only built once and can be
+# run with different values.
 # ------------------------------------------------------------------------------
 
-def make_query(qp, factsets, factindexes):
-    if qp.placeholders:
+def make_query(qp, factsets, factindexes, topk=None, parameterised=False):
+    if qp.placeholders and not parameterised:
         raise ValueError(("Cannot execute an ungrounded query. Missing values "
                           "for placeholders: "
                           "{}").format(", ".join([str(p) for p in qp.placeholders])))
     query = None
+    last = len(qp) - 1
     for idx,jqp in enumerate(qp):
+        jtopk = topk if idx == last else None
         if not query:
             query = make_first_join_query(
-                jqp,factsets,factindexes)
+                jqp,factsets,factindexes,jtopk)
         else:
             query = make_chained_join_query(
-                jqp,query,factsets,factindexes)
+                jqp,query,factsets,factindexes,jtopk)
     return query
 
 
@@ -2614,6 +3284,99 @@ def make_outputter(insig,outsig):
     if needcomplex: return make_complex_outputter()
     else: return make_simple_outputter()
 
+#------------------------------------------------------------------------------
+# QueryResultCache is an (opt-in) LRU cache of query results. An entry maps
+# the query specification (and the values bound to a prepared query) to the
+# list of results and the versions of the FactMaps of the query roots at the
+# time the query was run. If any of the FactMaps has been modified since then
+# the entry is stale and the query is re-run. Entries are evicted when either the number of entries or the total
+# number of cached results (the size) exceeds the bounds. A query that returns
+# more results than the size bound is not cached.
+# ------------------------------------------------------------------------------
+
+def query_result_key(qspec):
+    def hp(x): return hashable_path(x) if isinstance(x,PredicatePath) else x
+    return (tuple([hashable_path(r) for r in qspec.roots]), tuple(qspec.join),
+            tuple(qspec.where) if qspec.where else (),
+            tuple(qspec.order_by) if qspec.order_by else (),
+            tuple([hp(x) for x in qspec.select]) if qspec.select else (),
+            tuple([hp(x) for x in qspec.group_by]) if qspec.group_by else (),
+            bool(qspec.tuple), bool(qspec.unique), qspec.joh,
+            qspec.limit, qspec.offset)
+
+class QueryResultCache(object):
+    def __init__(self, maxentries=128, maxsize=100000):
+        if maxentries <= 0 or maxsize <= 0:
+            raise ValueError(("Invalid cache bounds: maxentries={}, maxsize={} "
+                              "must be positive").format(maxentries,maxsize))
+        self._maxentries = maxentries
+        self._maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._size = 0
+
+    def get(self, key, versions):
+        entry = self._entries.pop(key,None)
+        if entry is None: return None
+        if entry[0] != versions:
+            self._size -= len(entry[1])
+            return None
+        self._entries[key] = entry
+        return entry[1]
+
+    def put(self, key, versions, results):
+        old = self._entries.pop(key,None)
+        if old is not None: self._size -= len(old[1])
+        if len(results) > self._maxsize: return
+        self._entries[key] = (versions, results)
+        self._size += len(results)
+        while len(self._entries) > self._maxentries or self._size > self._maxsize:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    @property
+    def maxentries(self):
+        return self._maxentries
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+#------------------------------------------------------------------------------
+# Aggregate functions over a sequence of values. The min, max, and avg of an
+# empty sequence is None.
+# ------------------------------------------------------------------------------
+
+def _agg_count(values):
+    count = 0
+    for _ in values: count += 1
+    return count
+
+def _agg_avg(values):
+    total = 0
+    count = 0
+    for v in values:
+        total += v
+        count += 1
+    return total / count if count else None
+
+aggregate_functions = {
+    "count" : _agg_count,
+    "sum" : sum,
+    "min" : lambda values: min(values, default=None),
+    "max" : lambda values: max(values, default=None),
+    "avg" : _agg_avg }
+
 #------------------------------------------------------------------------------
 # QueryExecutor - actually executes the query and does the appropriate action
 # (eg., displaying to the user or deleting from the factbase)
@@ -2625,10 +3388,18 @@ class QueryExecutor(object):
     # factmaps - dictionary mapping predicates to FactMap.
     # roots - the roots
     # qspec - dictionary containing the specification of the query and output
+    # prepared - an optional query plan and query pair (for prepared queries)
+    #            that is used instead of planning the query
+    # cache - an optional QueryResultCache
+    # bindings - an optional pair of the positional and keyword arguments that
+    #            are passed to a prepared (parameterised) query
     #--------------------------------------------------------------------------
-    def __init__(self, factmaps, qspec):
+    def __init__(self, factmaps, qspec, prepared=None, cache=None, bindings=None):
         self._factmaps = factmaps
         self._qspec = qspec.fill_defaults()
+        self._prepared = prepared
+        self._cache = cache
+        (self._args, self._kwargs) = bindings if bindings else ((), {})
 
 
     #--------------------------------------------------------------------------
@@ -2650,6 +3421,7 @@ class QueryExecutor(object):
     # Internal support function
     # --------------------------------------------------------------------------
     def _make_plan_and_query(self):
+        if self._prepared: return self._prepared
         where = self._qspec.where
         if where and not where.executable:
             placeholders = where.placeholders
@@ -2662,18 +3434,47 @@ class QueryExecutor(object):
 
         (factsets,factindexes) = \
             QueryExecutor.get_factmap_data(self._factmaps, qspec)
-        qplan = make_query_plan(factindexes.keys(), qspec)
+        qplan = make_cached_query_plan(factindexes, qspec, factsets)
         qplan = qplan.ground()
-        query = make_query(qplan,factsets,factindexes)
+        query = make_query(qplan,factsets,factindexes,self.topk(qspec))
         return (qplan,query)
 
+    # Run the query with any bound values
+    def _run_query(self):
+        return self._query(*self._args, **self._kwargs)
+
+    # The value of a prejoin key (which can be a placeholder)
+    def _key_value(self, sc):
+        value = sc.args[1]
+        if not isinstance(value, Placeholder): return value
+        return placeholder_value(value, self._args, self._kwargs, sc)
+
+    # --------------------------------------------------------------------------
+    # The number of results that an ordered query needs to generate to satisfy
+    # a limit/offset (or None if all results are needed). With 'unique' or
+    # 'group_by' the number of join tuples needed is unknown.
+    # --------------------------------------------------------------------------
+    @classmethod
+    def topk(cls, qspec):
+        if qspec.limit is None or not qspec.order_by: return None
+        if qspec.unique or qspec.group_by: return None
+        return (qspec.offset or 0) + qspec.limit
+
+    # Restrict an iterator to the limit/offset
+    def _slice(self, iterable):
+        limit = self._qspec.limit
+        offset = self._qspec.offset or 0
+        if limit is None and not offset: return iterable
+        if limit is None: return itertools.islice(iterable, offset, None)
+        return itertools.islice(iterable, offset, offset + limit)
+
 
     # --------------------------------------------------------------------------
     # Internal function generator for the query results
     # --------------------------------------------------------------------------
     def _all(self):
         cache = set()
-        for input in self._query():
+        for input in self._run_query():
             output = self._outputter(input)
             if self._unwrap: output = output[0]
             if self._unique:
@@ -2700,7 +3501,7 @@ class QueryExecutor(object):
 
         group_by_keyfunc = make_input_alignment_functor(
             self._qplan.output_signature, self._qspec.group_by)
-        for k,g in itertools.groupby(self._query(), group_by_keyfunc):
+        for k,g in itertools.groupby(self._run_query(), group_by_keyfunc):
             if unwrapkey: yield k[0], groupiter(g)
             else: yield k, groupiter(g)
 
@@ -2710,6 +3511,26 @@ class QueryExecutor(object):
     # --------------------------------------------------------------------------
 
     def all(self):
+        if self._cache is not None and not self._qspec.group_by:
+            return self._cached_all()
+        return self._uncached_all()
+
+    def _cached_all(self):
+        try:
+            key = (query_result_key(self._qspec), tuple(self._args),
+                   tuple(sorted(self._kwargs.items())))
+            hash(key)
+        except TypeError:       # the where clause contains unhashable values
+            return self._uncached_all()
+        ptypes = [path(r).meta.predicate for r in self._qspec.roots]
+        versions = tuple([self._factmaps[pt].version for pt in ptypes])
+        results = self._cache.get(key, versions)
+        if results is None:
+            results = list(self._uncached_all())
+            self._cache.put(key, versions, results)
+        return iter(results)
+
+    def _uncached_all(self):
         (self._qplan,self._query) = self._make_plan_and_query()
 
         outsig = self._qspec.select
@@ -2719,8 +3540,96 @@ class QueryExecutor(object):
         self._unwrap = not self._qspec.tuple and len(outsig) == 1
         self._unique = self._qspec.unique
 
-        if len(self._qspec.group_by) > 0: return self._group_by_all()
-        else: return self._all()
+        if len(self._qspec.group_by) > 0: return self._slice(self._group_by_all())
+        else: return self._slice(self._all())
+
+    # --------------------------------------------------------------------------
+    # Aggregates over the query. The aggregate is evaluated directly on the
+    # join tuples of the query (so no output tuples are built) and is
+    # independent of any 'select' signature. With a 'group_by' it returns a
+    # generator of (group key, aggregate value) pairs. A count of a 'unique'
+    # query counts the unique output elements.
+    #
+    # For a single root query where the only condition is an index lookup (or
+    # there is no condition) the count, min, and max are answered from the
+    # FactIndex (or FactSet) without iterating over the facts. Otherwise a
+    # count uses the query result cache (if there is one). A limit/offset
+    # restricts the join tuples (or groups) that are aggregated.
+    # --------------------------------------------------------------------------
+    def aggregate(self, name, pth=None):
+        func = aggregate_functions.get(name,None)
+        if func is None:
+            raise ValueError("Unknown aggregate function '{}'".format(name))
+        if pth is None and name != "count":
+            raise ValueError("Aggregate '{}' requires a field path".format(name))
+        group_by = self._qspec.group_by
+        if self._qspec.unique:
+            if name != "count":
+                raise ValueError("'unique' is incompatible with '{}'".format(name))
+            if group_by: return ((k, func(g)) for k,g in self.all())
+            return func(self.all())
+
+        (self._qplan,self._query) = self._make_plan_and_query()
+        if pth is not None: pth = path(pth)
+        sliced = self._qspec.limit is not None or self._qspec.offset
+        if not group_by and not sliced:
+            result = self._index_aggregate(name, pth)
+            if result is not None: return result[0]
+
+        # A count can re-use (and populate) the query result cache
+        if name == "count" and self._cache is not None and not group_by:
+            return func(self.all())
+
+        if pth is None:
+            values = lambda intuples: intuples
+        else:
+            outsig = [hashable_path(p) for p in self._qplan.output_signature]
+            hroot = hashable_path(pth.meta.root)
+            if hroot not in outsig:
+                raise ValueError(("Aggregate path '{}' does not refer to a query "
+                                  "root {}").format(pth, self._qspec.roots))
+            idx = outsig.index(hroot)
+            ag = pth.meta.attrgetter
+            values = lambda intuples: (ag(t[idx]) for t in intuples)
+
+        if not group_by: return func(values(self._slice(self._run_query())))
+
+        unwrapkey = len(group_by) == 1 and not self._qspec.tuple
+        group_by_keyfunc = make_input_alignment_functor(
+            self._qplan.output_signature, group_by)
+        def grouped():
+            for k,g in itertools.groupby(self._run_query(), group_by_keyfunc):
+                yield (k[0] if unwrapkey else k, func(values(g)))
+        return self._slice(grouped())
+
+    # Returns a singleton tuple with the aggregate value or None if the
+    # aggregate can't be answered from the index
+    def _index_aggregate(self, name, pth):
+        if name not in ("count","min","max") or len(self._qplan) != 1: return None
+        jqp = self._qplan[0]
+        if jqp.prejoin_clauses or jqp.postjoin_clauses: return None
+        pjk = jqp.prejoin_key
+        if isinstance(pjk, ClauseBlock): return None
+        (factsets, factindexes) = \
+            QueryExecutor.get_factmap_data(self._factmaps, self._qspec)
+        pjkpath = hashable_path(pjk.dealias().paths[0]) if pjk else None
+
+        if name == "count":
+            if not pjk: return (len(factsets[jqp.root.meta.predicate]),)
+            fi = factindexes[pjkpath]
+            return (sum([fi.count(sc.operator, self._key_value(sc)) for sc in pjk]),)
+
+        if hashable_path(pth.meta.root) != hashable_path(jqp.root): return None
+        hpth = hashable_path(pth.meta.dealiased)
+        fi = factindexes.get(hpth,None)
+        if fi is None or not fi.ordered: return None
+        reverse = name == "max"
+        if not pjk: return (fi.first_key(reverse=reverse),)
+        if pjkpath != hpth: return None
+        keys = [fi.first_key(sc.operator, self._key_value(sc), reverse) for sc in pjk]
+        keys = [k for k in keys if k is not None]
+        if not keys: return (None,)
+        return (max(keys) if reverse else min(keys),)
 
     # --------------------------------------------------------------------------
     # Delete a selection of facts. Maintains a set for each predicate type
@@ -2766,7 +3675,7 @@ class QueryExecutor(object):
                 actions.append(lambda x : None)
 
         # Running the query adds the facts to the appropriate delete set
-        for input in self._query():
+        for input in self._slice(self._run_query()):
             for fact, action in zip(input,actions):
                 action(fact)
 
@@ -2774,8 +3683,7 @@ class QueryExecutor(object):
         count = 0
         for pt,ds in deletesets.items():
             count += len(ds)
-            fm = self._factmaps[pt]
-            for f in ds: fm.remove(f)
+            self._factmaps[pt].remove_facts(ds)
         return count
 
 #------------------------------------------------------------------------------
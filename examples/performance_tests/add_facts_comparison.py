@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+#------------------------------------------------------------------------------
+# Compare the different methods of adding facts to a clingo Control object (see
+# clorm.clingo.Control.add_facts()). For each method the time to add the facts
+# and the time to ground the program is reported. Generating an AST for each
+# fact is expensive in Python so for large numbers of facts generating the ASP
+# text (which is then parsed by clingo) or using the backend is much faster.
+# -----------------------------------------------------------------------------
+
+import sys
+import time
+
+from clorm import Predicate, IntegerField, StringField, FactBase
+from clorm.clingo import Control
+
+#--------------------------------------------------------------------------
+# Define a context timer (https://preshing.com/20110924/timing-your-code-using-pythons-with-statement/)
+#--------------------------------------------------------------------------
+
+class Timer:
+    def __init__(self):
+        self.interval = 0.0
+
+    def __enter__(self):
+        self.start = time.process_time()
+        return self
+
+    def __exit__(self, *args):
+        self.end = time.process_time()
+        self.interval = self.end - self.start
+
+    def __str__(self):
+        return "{:3f} sec".format(self.interval)
+
+#--------------------------------------------------------------------------
+# A simple instance and a rule that uses it
+#--------------------------------------------------------------------------
+
+class Edge(Predicate):
+    src=IntegerField
+    dst=IntegerField
+    label=StringField
+
+PROGRAM = "out(X) :- edge(X,Y,\"b\"), X < Y."
+
+def generate_facts(size):
+    return [ Edge(i, (i*7) % size, "abc"[i % 3]) for i in range(size) ]
+
+#--------------------------------------------------------------------------
+# Add the facts using each method and ground
+#--------------------------------------------------------------------------
+
+def compare_methods(size):
+    print("=========================================================")
+    print("Adding {} facts to a Control object\n".format(size))
+
+    facts = generate_facts(size)
+    inputs = [ ("list", lambda: facts), ("FactBase", lambda: FactBase(facts)) ]
+    for method in [ "ast", "text", "backend", None ]:
+        for iname, make_input in inputs:
+            ctrl = Control(unifier=[Edge])
+            ctrl.add("base", [], PROGRAM)
+            data = make_input()
+            with Timer() as add_t: ctrl.add_facts(data, method=method)
+            with Timer() as ground_t: ctrl.ground([("base",[])])
+            mname = method if method else "auto"
+            print("{:8} {:9}: add_facts {}, ground {}".format(
+                mname, iname, add_t, ground_t))
+    print("--------------------------------------------------------\n")
+
+#--------------------------------------------------------------------------
+# main
+#--------------------------------------------------------------------------
+def main():
+    sizes = [ int(a) for a in sys.argv[1:] ] if len(sys.argv) > 1 else \
+        [ 1000, 10000, 100000 ]
+    for size in sizes: compare_methods(size)
+
+#------------------------------------------------------------------------------
+# main
+#------------------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
@@ -12,5 +12,6 @@ from .test_monkey import *
 
 from .test_noclingo import *
 from .test_json import *
+from .test_batch import *
 from .test_libdate import LibDateTestCase
 from .test_libtimeslot import *
@@ -0,0 +1,84 @@
+#------------------------------------------------------------------------------
+# Unit tests for the clorm batch solver
+#------------------------------------------------------------------------------
+
+import unittest
+from clorm import Predicate, IntegerField, FactBase
+from clorm.batch import BatchSolver
+
+# The workers use clorm.clingo, which requires a supported version of clingo
+try:
+    import clorm.clingo
+    _has_clorm_clingo = True
+except Exception:
+    _has_clorm_clingo = False
+
+#------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+
+__all__ = [
+    'BatchSolverTestCase'
+    ]
+
+#------------------------------------------------------------------------------
+# The predicates must be defined at the module level so that they can be
+# imported by the worker processes.
+#------------------------------------------------------------------------------
+
+class Num(Predicate):
+    n=IntegerField
+
+class Sq(Predicate):
+    n=IntegerField
+    sq=IntegerField
+
+ENCODING = "sq(N,N*N) :- num(N). :- num(13)."
+
+#------------------------------------------------------------------------------
+#
+#------------------------------------------------------------------------------
+
+@unittest.skipUnless(_has_clorm_clingo, "clorm.clingo cannot be imported")
+class BatchSolverTestCase(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    #--------------------------------------------------------------------------
+    # Solve some instances (one unsatisfiable) with worker recycling
+    #--------------------------------------------------------------------------
+    def test_batch_solve(self):
+        instances = [ FactBase([Num(i), Num(i+1)]) for i in range(0,20,2) ]
+        instances.append(FactBase([Num(13)]))
+        instances[0] = FactBase(instances[0], indexes=[(Num.n, "hash")])
+
+        with BatchSolver(ENCODING, [Num,Sq], workers=2, max_solves=3) as bs:
+            results = list(bs.solve(instances))
+            again = list(bs.solve(instances[:1]))
+
+        self.assertEqual(len(results), len(instances))
+        for inst, result in zip(instances[:-1], results):
+            expected = FactBase(list(inst) + [Sq(n.n, n.n*n.n) for n in inst])
+            self.assertEqual(result, expected)
+        self.assertEqual(results[-1], None)
+        self.assertEqual(again, results[:1])
+
+        with self.assertRaises(ValueError) as ctx:
+            BatchSolver(ENCODING, [Num,Sq], max_solves=0)
+
+    #--------------------------------------------------------------------------
+    # A worker initialisation error (eg. a bad encoding) is raised by solve()
+    #--------------------------------------------------------------------------
+    def test_batch_bad_encoding(self):
+        with BatchSolver("sq(N :- num(N).", [Num,Sq], workers=1) as bs:
+            with self.assertRaises(RuntimeError) as ctx:
+                list(bs.solve([FactBase([Num(1)])]))
+        self.assertTrue("Failed to initialise" in str(ctx.exception))
+
+#------------------------------------------------------------------------------
+# main
+#------------------------------------------------------------------------------
+if __name__ == "__main__":
+    raise RuntimeError('Cannot run modules')
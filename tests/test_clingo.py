@@ -450,6 +450,200 @@ class ClingoTestCase(unittest.TestCase):
         ctrl.ground([("base",[])])
         ctrl.solve(on_model=on_model2)
 
+    #--------------------------------------------------------------------------
+    # Test streaming the facts of a model
+    #--------------------------------------------------------------------------
+    def test_model_facts_iter(self):
+        class Afact(Predicate):
+            num1=IntegerField()
+        class Bfact(Predicate):
+            str1=StringField()
+
+        afs = [Afact(1),Afact(2),Afact(3)]
+        bfs = [Bfact("a")]
+
+        ctrl = cclingo.Control(unifier=[Afact,Bfact])
+        ctrl.add_facts(afs + bfs)
+        ctrl.ground([("base",[])])
+        with ctrl.solve(yield_=True) as sh:
+            m=next(sh)
+            self.assertEqual(set(m.facts_iter(atoms=True)), set(afs + bfs))
+            self.assertEqual(set(m.facts_iter([Afact],atoms=True,lazy=True)),
+                             set(afs))
+            batches = list(m.facts_iter(atoms=True, batch_size=2))
+            self.assertEqual(sorted(len(b) for _,b in batches), [1,1,2])
+            self.assertEqual(set(f for _,b in batches for f in b), set(afs + bfs))
+
+    #--------------------------------------------------------------------------
+    # Test that the facts of a model are memoised
+    #--------------------------------------------------------------------------
+    def test_model_facts_memoised(self):
+        class Afact(Predicate):
+            num1=IntegerField()
+
+        afs = [Afact(1),Afact(2)]
+        ctrl = cclingo.Control(unifier=[Afact])
+        ctrl.add_facts(afs)
+        ctrl.add("base",[],"#show afact/1. #show afact(3).")
+        ctrl.ground([("base",[])])
+        with ctrl.solve(yield_=True) as sh:
+            m=next(sh)
+            fb1 = m.facts(atoms=True)
+            fb2 = m.facts(atoms=True)
+            self.assertEqual(fb1, FactBase(afs))
+            self.assertEqual(fb1, fb2)
+
+            # Each call returns a new fact base that can be modified
+            self.assertFalse(fb1 is fb2)
+            fb1.add(Afact(4))
+            self.assertEqual(m.facts(None,True), FactBase(afs))
+
+            # Different selections share the unified facts
+            fb3 = m.facts(shown=True)
+            self.assertEqual(fb3, FactBase(afs + [Afact(3)]))
+            a1 = next(iter(fb2.query(Afact).where(Afact.num1 == 1).all()))
+            a3 = next(iter(fb3.query(Afact).where(Afact.num1 == 1).all()))
+            self.assertTrue(a1 is a3)
+            self.assertEqual(m.facts(terms=True), FactBase([Afact(3)]))
+            self.assertEqual(m.facts([], atoms=True), FactBase())
+
+            # The returned fact base is lazy so an empty result only raises
+            # when the fact base is used (and for each call)
+            fb4 = m.facts([], atoms=True, raise_on_empty=True)
+            self.assertTrue(fb4._delayed_init)
+            with self.assertRaises(ValueError) as ctx:
+                len(fb4)
+            check_errmsg("FactBase creation: failed to unify", ctx)
+            fb5 = m.facts([], atoms=True, raise_on_empty=True)
+            with self.assertRaises(ValueError) as ctx:
+                list(fb5)
+            check_errmsg("FactBase creation: failed to unify", ctx)
+            self.assertEqual(len(m.facts(atoms=True, raise_on_empty=True)), 2)
+
+    #--------------------------------------------------------------------------
+    # Test the different methods of adding facts
+    #--------------------------------------------------------------------------
+    def test_control_add_facts_methods(self):
+        class Afact(Predicate):
+            num1=IntegerField()
+            str1=StringField()
+
+        small = [Afact(1,"a \"quoted\" string"), Afact(2,"b").raw]
+        large = [Afact(n,str(n)) for n in range(cclingo.ADD_FACTS_TEXT_THRESHOLD+1)]
+        inputs = [(small, lambda: small), (large, lambda: large),
+                  (large, lambda: FactBase(large)),
+                  (large, lambda: (f for f in large))]
+        for method in [None, "ast", "text", "backend"]:
+            for facts, make_input in inputs:
+                expected = set([f if isinstance(f,Predicate) else Afact._unify(f)
+                                for f in facts])
+                ctrl = cclingo.Control(unifier=[Afact])
+                ctrl.add_facts(make_input(), method=method)
+                ctrl.ground([("base",[])])
+                with ctrl.solve(yield_=True) as sh:
+                    self.assertEqual(set(next(sh).facts(atoms=True)), expected)
+
+        with self.assertRaises(ValueError) as ctx:
+            cclingo.Control().add_facts(small, method="bad")
+        check_errmsg("Unknown add_facts() method 'bad'", ctx)
+
+    #--------------------------------------------------------------------------
+    # Test the changes between successive models
+    #--------------------------------------------------------------------------
+    def test_model_facts_delta(self):
+        class Afact(Predicate):
+            num1=IntegerField()
+        class Bfact(Predicate):
+            num1=IntegerField()
+
+        ctrl = cclingo.Control(['-n 0'], unifier=[Afact,Bfact])
+        ctrl.add_facts([Afact(1),Afact(2)])
+        with ctrl.builder() as b:
+            oclingo.parse_program("1 { bfact(N) : afact(N) } 1.",
+                                  lambda stm: b.add(stm))
+        ctrl.ground([("base",[])])
+        deltas = []
+        with ctrl.solve(yield_=True) as sh:
+            prev = None
+            for m in sh:
+                prev = m.facts_delta(prev, atoms=True)
+                deltas.append(prev)
+        self.assertEqual(len(deltas), 2)
+        b1 = [f for f in deltas[0].added if isinstance(f, Bfact)]
+        self.assertEqual(len(b1), 1)
+        self.assertEqual(set(deltas[0].added), set([Afact(1),Afact(2)] + b1))
+        self.assertEqual(len(deltas[0].removed), 0)
+        self.assertEqual(len(deltas[1].added), 1)
+        self.assertEqual(list(deltas[1].removed), b1)
+        self.assertEqual(len(deltas[1].symbols), 3)
+
+    #--------------------------------------------------------------------------
+    # Test the asyncio solve interface
+    #--------------------------------------------------------------------------
+    def test_solve_async(self):
+        import asyncio
+        class Fact(Predicate):
+            num1=IntegerField()
+            class Meta: name="f"
+
+        ctrl = cclingo.Control(['-n 0'], unifier=[Fact])
+        with ctrl.builder() as b:
+            oclingo.parse_program("{ g(N) : f(N) } = 1.", lambda stm: b.add(stm))
+        ctrl.add_facts([Fact(1),Fact(2),Fact(3)])
+        ctrl.ground([("base",[])])
+
+        async def run():
+            models = []
+            async for m in ctrl.solve_async():
+                self.assertTrue(isinstance(m, cclingo.Model))
+                models.append(m.facts(atoms=True))
+            async with ctrl.solve_async() as h:
+                async for m in h: break
+            self.assertTrue(h.solvehandle_)
+            result = await ctrl.solve_async().get()
+            return (models, result)
+
+        (models, result) = asyncio.run(run())
+        self.assertEqual(len(models), 3)
+        self.assertEqual(set(models[0].query(Fact).all()),
+                         set([Fact(1),Fact(2),Fact(3)]))
+        self.assertTrue(result.satisfiable)
+
+    #--------------------------------------------------------------------------
+    # Cancelling a task that is waiting for a model cancels the solve call
+    # without blocking the event loop
+    #--------------------------------------------------------------------------
+    def test_solve_async_cancel(self):
+        import asyncio
+        # A (slow) unsatisfiable pigeon hole problem
+        ctrl = cclingo.Control(['-n 0'])
+        ctrl.add("base",[],"p(1..12). h(1..11). { a(P,H) : h(H) } = 1 :- p(P). "
+                 ":- a(P1,H), a(P2,H), P1 < P2.")
+        ctrl.ground([("base",[])])
+
+        async def run():
+            handle = ctrl.solve_async()
+            async def consume():
+                async for m in handle: pass
+            ticks = []
+            async def tick():
+                while True:
+                    ticks.append(1)
+                    await asyncio.sleep(0.01)
+            ticker = asyncio.create_task(tick())
+            task = asyncio.create_task(consume())
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            ticker.cancel()
+            return (handle, ticks)
+
+        (handle, ticks) = asyncio.run(run())
+        self.assertTrue(ticks)
+        self.assertTrue(handle._closed)
+        self.assertTrue(handle._result.unknown)
+
     #--------------------------------------------------------------------------
     # Test the solvehandle
     #--------------------------------------------------------------------------
@@ -845,6 +1039,43 @@ g(N) :- f(N)."""
             fb = m.facts(atoms=True)
             self.assertEqual(fb,FactBase())
 
+    #--------------------------------------------------------------------------
+    # Test assigning many externals (using the cached program literals)
+    #--------------------------------------------------------------------------
+    def test_assign_externals(self):
+        class F(Predicate):
+            num1=IntegerField()
+        class G(Predicate):
+            num1=IntegerField()
+
+        prgstr = """
+#external f(1..3).
+g(N) :- f(N)."""
+
+        f1 = F(1) ; f2 = F(2) ; f3 = F(3)
+        g1 = G(1) ; g2 = G(2) ; g3 = G(3)
+        ctrl = cclingo.Control(unifier=[F,G])
+        with ctrl.builder() as b:
+            oclingo.parse_program(prgstr, lambda stm: b.add(stm))
+        ctrl.ground([("base",[])])
+
+        def facts():
+            with ctrl.solve(yield_=True) as sh:
+                return list(sh)[0].facts(atoms=True)
+
+        ctrl.assign_externals({f1: True, f2: True, f3.raw: True})
+        self.assertEqual(facts(), FactBase([f1,f2,f3,g1,g2,g3]))
+        ctrl.assign_externals([(f1, False), (f3, False), (F(4), True)])
+        self.assertEqual(facts(), FactBase([f2,g2]))
+
+        # Mixing with the program literal and releasing an external
+        lit = ctrl.symbolic_atoms[f1.raw].literal
+        ctrl.assign_externals([(lit, True)])
+        self.assertEqual(facts(), FactBase([f1,f2,g1,g2]))
+        ctrl.release_external(f2)
+        ctrl.assign_externals({f2: True, f3: True})
+        self.assertEqual(facts(), FactBase([f1,f3,g1,g3]))
+
 #------------------------------------------------------------------------------
 # main
 #------------------------------------------------------------------------------
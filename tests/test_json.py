@@ -238,6 +238,24 @@ class JSONPredicateTestCase(unittest.TestCase):
         self.assertEqual(set(fb_in), set(fb_out))
         self.assertEqual(fb_in, fb_out)
 
+    #--------------------------------------------------------------------------
+    # Test that the indexes of a FactBase survive the round-trip
+    #--------------------------------------------------------------------------
+    def test_factbase_index_coder(self):
+        pc = cjson.FactBaseCoder()
+        Afact = pc.register(self.Afact)
+        Bfact = pc.register(self.Bfact)
+
+        indexes = [(Afact.aint, Afact.afun.astr), Bfact.atup.aint,
+                   (Bfact.astr, "hash"), ((Afact.aint, Afact.afun.aint), "hash")]
+        fb_in = FactBase(indexes=indexes)
+        fb_out = pc.loads(pc.dumps(fb_in))
+        self.assertEqual(str(fb_out._indexspecs), str(fb_in._indexspecs))
+
+        # The older encoding of an index as a path string
+        fb_out = pc.loads('{"clorm.FactBase": ["Afact.aint"], "facts": []}')
+        self.assertEqual(str(fb_out._indexspecs), str(((Afact.aint, "sorted"),)))
+
 #------------------------------------------------------------------------------
 # main
 #------------------------------------------------------------------------------
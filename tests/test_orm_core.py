@@ -1662,6 +1662,57 @@ class PredicateInternalUnifyTestCase(unittest.TestCase):
         with self.assertRaises(AttributeError) as ctx:
             good_fact_pred1.afun.aint = 3
 
+    #--------------------------------------------------------------------------
+    # Test that the generated constructor and _from_raw() functions produce the
+    # same results as the generic constructor for the different field types.
+    # --------------------------------------------------------------------------
+    def test_nonapi_generated_constructor_and_from_raw(self):
+        from clorm.orm.core import _predicate_constructor
+
+        class Fun(ComplexTerm):
+            aint=IntegerField
+            astr=StringField
+
+        class Fact(Predicate):
+            aint=IntegerField
+            astr=StringField
+            acon=ConstantField
+            afun=Fun.Field
+            atup=(IntegerField,ConstantField)
+            class Meta:
+                sign=True
+
+        raw = Function("fact",[Number(1),String("a"),Function("b",[]),
+                               Function("fun",[Number(2),String("c")]),
+                               Function("",[Number(3),Function("d",[])])])
+
+        f1 = Fact(1,"a","b",Fun(2,"c"),(3,"d"))
+        f2 = Fact.__new__(Fact)
+        _predicate_constructor(f2,1,"a","b",Fun(2,"c"),(3,"d"))
+        f3 = Fact._from_raw(raw)
+        f4 = Fact(raw=raw)
+        for f in [f1,f2,f3,f4]:
+            self.assertEqual(f.raw, raw)
+            self.assertEqual(hash(f), hash(f1))
+            self.assertEqual(f.afun, Fun(2,"c"))
+            self.assertEqual(f.atup, (3,"d"))
+        self.assertEqual(hash(f1.atup), hash((3,"d")))
+
+        # Bad input is still caught
+        with self.assertRaises(ValueError) as ctx:
+            Fact(1,"a","b",Fun(2,"c"),(3,"d"),sign=False)
+        check_errmsg("Predicate Fact is defined to only allow True", ctx)
+        with self.assertRaises(ValueError) as ctx:
+            Fact._from_raw(Function("fact",[String("1")]))
+        check_errmsg("Failed to unify clingo.Symbol object", ctx)
+        with self.assertRaises(ValueError) as ctx:
+            Fact._from_raw(Function("fact",[String("1"),String("a"),
+                                            Function("b",[]),Number(1),Number(2)]))
+        with self.assertRaises(ValueError) as ctx:
+            Fact._from_raw(Function("fact",raw.arguments,False))
+        with self.assertRaises(TypeError) as ctx:
+            Fact("1","a","b",Fun(2,"c"),(3,"d"))
+
 
 
 
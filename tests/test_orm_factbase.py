@@ -25,6 +25,7 @@ from clorm.orm import FactBase, desc, asc, not_, and_, or_, \
 # Implementation imports
 
 from clorm.orm.factcontainers import FactSet, FactIndex, FactMap
+from clorm.orm.factbase import Select
 
 from clorm.orm.query import PositionalPlaceholder, NamedPlaceholder, QuerySpec
 from clorm.orm.query import process_where, process_join, process_orderby
@@ -399,6 +400,77 @@ class FactBaseTestCase(unittest.TestCase):
         self.assertEqual(list(fb2.indexes), [])
         self.assertEqual(list(fb3.indexes), list(fb1.indexes))
 
+        # A copy keeps the indexes and is independent of the original (even
+        # though the facts are shared until they are modified)
+        fb4=fb1.copy()
+        self.assertEqual(list(fb4.indexes), list(fb1.indexes))
+        fb4.query(Afact).where(Afact.num == 6).delete()
+        self.assertEqual(set(fb1), set([af1,af2,af3]))
+        self.assertEqual(set(fb4.query(Afact).where(Afact.num == 5).all()),
+                         set([af1,af3]))
+        fb1.add(Afact(num=7,pair=(1,2)))
+        self.assertEqual(set(fb4), set([af1,af3]))
+        self.assertEqual(fb1.query(Afact).where(Afact.num > 5).count(), 2)
+        self.assertEqual(fb1.union(FactBase()), fb1)
+        self.assertEqual(fb1 - fb4, FactBase([af2, Afact(num=7,pair=(1,2))]))
+
+        # A (delayed) FactBase of a FactBase shares its facts (copy-on-write)
+        fb5=FactBase(lambda: [af1,af2], indexes=[Afact.num])
+        fb6=FactBase(lambda: fb5)
+        self.assertTrue(fb5._delayed_init)
+        self.assertTrue(fb6._delayed_init)
+        self.assertEqual(fb6, fb5)
+        self.assertEqual(list(fb6.indexes), [Afact.num])
+        self.assertTrue(fb6._factmaps[Afact].factset is fb5._factmaps[Afact].factset)
+        fb6.add(af3)
+        self.assertEqual(set(fb6), set([af1,af2,af3]))
+        self.assertEqual(set(fb5), set([af1,af2]))
+
+    #--------------------------------------------------------------------------
+    # Test the changes between two factbases
+    #--------------------------------------------------------------------------
+    def test_factbase_diff(self):
+        class Afact(Predicate):
+            num=IntegerField
+        class Bfact(Predicate):
+            num=IntegerField
+        class Cfact(Predicate):
+            num=IntegerField
+
+        fb1=FactBase([Afact(1),Afact(2),Bfact(1)])
+        fb2=fb1.copy()
+        self.assertEqual(fb2.diff(fb1), {})
+        fb2.add([Afact(3),Cfact(1)])
+        fb2.query(Afact).where(Afact.num == 1).delete()
+
+        delta = fb2.diff(fb1)
+        self.assertEqual(set(delta.keys()), set([Afact,Cfact]))
+        (added, removed) = delta[Afact]
+        self.assertEqual((list(added), list(removed)), ([Afact(3)], [Afact(1)]))
+        self.assertTrue(Afact(3) in added)
+        self.assertFalse(Afact(2) in added)
+        self.assertEqual((len(added), len(removed)), (1, 1))
+        self.assertEqual([list(v) for v in delta[Cfact]], [[Cfact(1)], []])
+        self.assertEqual([list(v) for v in fb1.diff(fb2)[Cfact]], [[], [Cfact(1)]])
+
+        # Same as the symmetric difference
+        changed = set()
+        for added, removed in delta.values(): changed.update(added, removed)
+        self.assertEqual(changed, set(fb1 ^ fb2))
+        self.assertEqual(set(fb1.diff([Afact(1)])[Afact][0]), set([Afact(2)]))
+
+        # Unshared but equal facts are not reported as changed
+        self.assertEqual(FactBase([Afact(1),Bfact(1)]).diff(
+            FactBase([Afact(1),Bfact(1)])), {})
+
+        # The views follow a copy-on-write fact base after it is modified
+        fb3=fb1.copy()
+        fb3.add(Afact(4))
+        (added, removed) = fb3.diff(fb1)[Afact]
+        fb4=fb3.copy()
+        fb3.add(Afact(5))
+        self.assertEqual(set(added), set([Afact(4),Afact(5)]))
+
 
     #--------------------------------------------------------------------------
     # Test deterministic iteration. Namely, that there is determinism when
@@ -952,6 +1024,98 @@ class QueryAPI1TestCase(unittest.TestCase):
         self.assertTrue(set([f for f in s2.get(2,b=2)]), set([f2]))
         self.assertTrue(facts, set([f1,f2,f3]))
 
+    #--------------------------------------------------------------------------
+    #   Test hash indexes that are only used for equality lookups
+    #--------------------------------------------------------------------------
+    def test_api_factbase_select_hash_indexing(self):
+        class Afact(Predicate):
+            num1=IntegerField(index="hash")
+            num2=IntegerField()
+        class Bfact(Predicate):
+            num1=IntegerField()
+
+        afacts = [ Afact(n1,n2) for n1 in range(3) for n2 in range(3) ]
+        bfacts = [ Bfact(1), Bfact(2) ]
+        fb1 = FactBase(afacts + bfacts, indexes=Afact.meta.indexes)
+        fb2 = FactBase(afacts + bfacts, indexes=[(Afact.num2,"hash"),Bfact.num1])
+        self.assertEqual(list(fb1.indexes), [Afact.num1])
+        self.assertEqual(list(FactBase(fb2).indexes), [Afact.num2,Bfact.num1])
+
+        with self.assertRaises(TypeError) as ctx:
+            class Cfact(Predicate):
+                num1=IntegerField(index="blah")
+        with self.assertRaises(ValueError) as ctx:
+            FactBase(indexes=[(Afact.num2,"blah")])
+
+        for fb in [fb1, fb2, FactBase(fb2), fb2.copy()]:
+            q1 = fb.query(Afact).where(Afact.num1 == ph1_).order_by(Afact.num2)
+            q2 = fb.query(Afact).where(Afact.num2 == 1).order_by(Afact.num1)
+            q3 = fb.query(Afact).where(Afact.num1 < 2).order_by(desc(Afact.num1),Afact.num2)
+            q4 = fb.query(Afact,Bfact).join(Afact.num1 == Bfact.num1)\
+                                      .order_by(Afact.num1,Afact.num2)
+            q5 = fb.query(Afact,Bfact).join(Afact.num2 < Bfact.num1)\
+                                      .where(Afact.num1 == 0)\
+                                      .order_by(Afact.num2,Bfact.num1)
+            q6 = fb.query(Afact).order_by(desc(Afact.num2),Afact.num1)
+            self.assertEqual(list(q1.bind(1).all()),
+                             [Afact(1,0),Afact(1,1),Afact(1,2)])
+            self.assertEqual(list(q2.all()), [Afact(0,1),Afact(1,1),Afact(2,1)])
+            self.assertEqual(list(q3.all()), [Afact(1,0),Afact(1,1),Afact(1,2),
+                                              Afact(0,0),Afact(0,1),Afact(0,2)])
+            self.assertEqual(list(q4.all()),
+                             [(Afact(1,n),Bfact(1)) for n in range(3)] +
+                             [(Afact(2,n),Bfact(2)) for n in range(3)])
+            self.assertEqual(list(q5.all()),
+                             [(Afact(0,0),Bfact(1)),(Afact(0,0),Bfact(2)),
+                              (Afact(0,1),Bfact(2))])
+            self.assertEqual(list(q6.all())[:3], [Afact(0,2),Afact(1,2),Afact(2,2)])
+
+    #--------------------------------------------------------------------------
+    #   Test composite (multi-field) indexes
+    #--------------------------------------------------------------------------
+    def test_api_factbase_select_composite_indexing(self):
+        class Afact(Predicate):
+            day=IntegerField()
+            res=StringField()
+            num=IntegerField()
+        class Bfact(Predicate):
+            day=IntegerField()
+            res=StringField()
+
+        afacts = [ Afact(d,r,n) for d in range(3) for r in ["x","y"] for n in range(2) ]
+        bfacts = [ Bfact(1,"y"), Bfact(2,"x") ]
+        fb1 = FactBase(afacts + bfacts, indexes=[(Afact.day,Afact.res),
+                                                 ((Bfact.day,Bfact.res),"hash")])
+        fb2 = FactBase(afacts + bfacts)
+        self.assertEqual(list(fb1.indexes), [(Afact.day,Afact.res),
+                                             (Bfact.day,Bfact.res)])
+        self.assertEqual(list(FactBase(fb1).indexes), list(fb1.indexes))
+        with self.assertRaises(ValueError) as ctx:
+            FactBase(indexes=[(Afact.day,Bfact.res)])
+
+        q1 = fb1.query(Afact).where((Afact.day == 1) & (Afact.res == ph1_))
+        self.assertEqual(q1.query_plan()[0].prejoin_key,
+                         process_where((Afact.day == 1) & (Afact.res == ph1_),
+                                       [Afact]))
+
+        for fb in [fb1, fb2, fb1.copy()]:
+            q1 = fb.query(Afact).where((Afact.day == 1) & (Afact.res == ph1_))\
+                                .order_by(Afact.num)
+            q2 = fb.query(Afact).where((Afact.day == 1) & (Afact.res > "x"))\
+                                .order_by(Afact.num)
+            q3 = fb.query(Afact).where(Afact.day == 2).order_by(Afact.res,Afact.num)
+            q4 = fb.query(Bfact,Afact).join(Afact.day == Bfact.day)\
+                                      .where((Afact.day == 1) & (Afact.res == "y"))\
+                                      .order_by(Afact.num)
+            q5 = fb.query(Bfact).where((Bfact.day == 2) & (Bfact.res == "x"))
+            self.assertEqual(list(q1.bind("y").all()), [Afact(1,"y",0),Afact(1,"y",1)])
+            self.assertEqual(list(q2.all()), [Afact(1,"y",0),Afact(1,"y",1)])
+            self.assertEqual(list(q3.all()), [Afact(2,"x",0),Afact(2,"x",1),
+                                              Afact(2,"y",0),Afact(2,"y",1)])
+            self.assertEqual(list(q4.all()), [(Bfact(1,"y"),Afact(1,"y",0)),
+                                              (Bfact(1,"y"),Afact(1,"y",1))])
+            self.assertEqual(list(q5.all()), [Bfact(2,"x")])
+
     #--------------------------------------------------------------------------
     #   Test the delete
     #--------------------------------------------------------------------------
@@ -1190,6 +1354,282 @@ class QueryAPI2TestCase(unittest.TestCase):
         q = factbase.query(F).where(F.astr == "a").select(F.astr).unique()
         self.assertEqual(q.singleton(),"a")
 
+    #--------------------------------------------------------------------------
+    #   Test prepared queries
+    #--------------------------------------------------------------------------
+    def test_api_prepared_query(self):
+        F = self.F
+        G = self.G
+        factbase = self.factbase
+
+        # A prepared query with placeholders gives the same results as bind()
+        q = factbase.query(F).where(F.anum == ph1_)
+        pq = q.prepare()
+        for i in range(1,4):
+            self.assertEqual(set(pq.bind(i).all()), set(q.bind(i).all()))
+        self.assertEqual(pq.bind(1).singleton(), F(1,"a"))
+        self.assertEqual(pq.bind(4).count(), 0)
+
+        # A prepared join with a named placeholder
+        pq = factbase.query(F,G).join(F.anum == G.anum)\
+                                .where(F.astr == ph_("s")).order_by(F.anum).prepare()
+        self.assertEqual(list(pq.bind(s="a").all()),
+                         [(F(1,"a"),G(1,"c")), (F(2,"a"),G(2,"d"))])
+        self.assertEqual(list(pq.bind(s="c").all()), [])
+
+        # The query is built once and shared by the bindings
+        q1 = pq.bind(s="a")
+        q1.all()
+        self.assertEqual(len(pq._built), 1)
+        self.assertEqual(set(pq.bind(s="b").all()), set())
+        self.assertEqual(len(pq._built), 1)
+
+        # A placeholder for an index lookup (including a count from the index)
+        fb = FactBase(factbase, indexes=[F.anum, (F.anum, F.astr)])
+        pq = fb.query(F).where(F.anum == ph1_).prepare()
+        self.assertEqual(set(pq.bind(2).all()), set([F(2,"a")]))
+        self.assertEqual(pq.bind(2).count(), 1)
+        self.assertEqual(pq.bind(4).count(), 0)
+        pq = fb.query(F).where((F.anum == ph1_) & (F.astr == ph_("s"))).prepare()
+        self.assertEqual(set(pq.bind(1, s="a").all()), set([F(1,"a")]))
+        self.assertEqual(set(pq.bind(1, s="b").all()), set())
+
+        # A false bound value isn't replaced by the default
+        pq = factbase.query(F).where(F.astr != ph_("s", "a")).prepare()
+        self.assertEqual(set(pq.all()), set([F(3,"b")]))
+        self.assertEqual(set(pq.bind(s="").all()), set([F(1,"a"),F(2,"a"),F(3,"b")]))
+
+        # Bad bindings and unbound execution
+        pq = factbase.query(F,G).join(F.anum == G.anum)\
+                                .where(F.astr == ph_("s")).order_by(F.anum).prepare()
+        with self.assertRaises(ValueError) as ctx:
+            pq.bind(1)
+        check_errmsg("Trying to bind value",ctx)
+        with self.assertRaises(ValueError) as ctx:
+            pq.all()
+        check_errmsg("Missing named placeholder",ctx)
+
+        # The prepared query sees changes to the factbase
+        pq = factbase.query(F).where(F.anum > ph1_).prepare()
+        bq = pq.bind(2)
+        self.assertEqual(set(bq.all()), set([F(3,"b")]))
+        factbase.add(F(4,"c"))
+        self.assertEqual(set(bq.all()), set([F(3,"b"),F(4,"c")]))
+        self.assertEqual(bq.delete(), 2)
+        self.assertEqual(set(factbase.query(F).all()), set([F(1,"a"),F(2,"a")]))
+
+        # Including after a copy-on-write copy has been made
+        pq = factbase.query(F).where(F.anum >= ph1_).prepare()
+        self.assertEqual(set(pq.bind(0).all()), set([F(1,"a"),F(2,"a")]))
+        fb2 = factbase.copy()
+        factbase.add(F(3,"b"))
+        self.assertEqual(set(pq.bind(0).all()), set([F(1,"a"),F(2,"a"),F(3,"b")]))
+        self.assertEqual(set(fb2.query(F).all()), set([F(1,"a"),F(2,"a")]))
+
+    #--------------------------------------------------------------------------
+    #   Test the query result cache
+    #--------------------------------------------------------------------------
+    def test_api_query_cache(self):
+        F = self.F
+        G = self.G
+        factbase = self.factbase
+        factbase.enable_query_cache(maxentries=2, maxsize=3)
+        cache = factbase._query_cache
+
+        # Re-running a query re-uses the cached results
+        q = factbase.query(F).where(F.astr == "a").order_by(F.anum)
+        self.assertEqual(list(q.all()), [F(1,"a"),F(2,"a")])
+        self.assertEqual((len(cache), cache.size), (1, 2))
+        self.assertEqual(q.count(), 2)
+        self.assertEqual(list(factbase.query(F).where(F.astr == "a")
+                              .order_by(F.anum).all()), [F(1,"a"),F(2,"a")])
+        self.assertEqual((len(cache), cache.size), (1, 2))
+
+        # Modifying an unrelated predicate doesn't invalidate the result but
+        # modifying the root predicate does
+        factbase.add(G(10,"a"))
+        self.assertEqual(q.first(), F(1,"a"))
+        factbase.add(F(0,"a"))
+        self.assertEqual(list(q.all()), [F(0,"a"),F(1,"a"),F(2,"a")])
+        factbase.query(F).where(F.anum == 0).delete()
+        self.assertEqual(list(q.all()), [F(1,"a"),F(2,"a")])
+        qb = factbase.query(F).where(F.anum == ph1_)
+        self.assertEqual(list(qb.bind(1).all()), [F(1,"a")])
+        self.assertEqual(list(qb.bind(2).all()), [F(2,"a")])
+        factbase.query(F).where(F.anum == 2).delete()
+        self.assertEqual(list(qb.bind(2).all()), [])
+
+        # A prepared query caches the results of each binding separately
+        pq = factbase.query(F).where(F.anum == ph1_).prepare()
+        self.assertEqual(list(pq.bind(1).all()), [F(1,"a")])
+        self.assertEqual(list(pq.bind(3).all()), [F(3,"b")])
+        self.assertEqual(pq.bind(3).count(), 1)
+        self.assertEqual(list(pq.bind(1).all()), [F(1,"a")])
+
+        # The LRU evicts on the entry count and the total size and doesn't
+        # cache results larger than the size bound
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.size <= 3)
+        self.assertEqual(len(list(factbase.query(F,G).join(F.anum == G.anum)
+                                  .all())), 1)
+        self.assertEqual(len(list(factbase.query(G).all())), 4)
+        self.assertTrue(len(cache) <= 2 and cache.size <= 3)
+
+        # The count of a join uses the cache
+        cache.clear()
+        qj = factbase.query(F,G).join(F.anum == G.anum)
+        self.assertEqual(qj.count(), 1)
+        self.assertEqual((len(cache), cache.size), (1, 1))
+        self.assertEqual(len(list(qj.all())), 1)
+        self.assertEqual(len(cache), 1)
+
+        factbase.disable_query_cache()
+        self.assertEqual(factbase.query(F).count(), 2)
+
+    #--------------------------------------------------------------------------
+    #   Test queries over columnar fact storage
+    #--------------------------------------------------------------------------
+    def test_api_columnar_factbase(self):
+        F = self.F
+        G = self.G
+        FA = alias(F)
+        facts = [F(i, "abc"[i % 3]) for i in range(50)] + \
+                [G(i, "xy"[i % 2]) for i in range(0,50,5)]
+        fb1 = FactBase(facts)
+        fb2 = FactBase(facts, indexes=[G.anum], columnar=[F,G])
+        self.assertEqual(fb1, fb2)
+        self.assertEqual(FactBase(fb2)._columnar, fb2._columnar)
+
+        queries = [
+            lambda fb: fb.query(F).where((F.anum > 10) & (F.astr == "b")),
+            lambda fb: fb.query(F).where((F.anum < 5) | (F.astr == F.astr)),
+            lambda fb: fb.query(F).where(F.anum == ph1_).bind(3),
+            lambda fb: fb.query(F).where((F.anum >= 40) &
+                                         func_([F.astr], lambda s: s != "a")),
+            lambda fb: fb.query(F,G).join(F.anum == G.anum)
+                                    .where(F.astr != "a", G.astr == "x"),
+            lambda fb: fb.query(F,FA).join(F.anum < FA.anum)
+                                     .where(FA.anum < 4, F.astr == "a"),
+        ]
+        for q in queries:
+            self.assertEqual(list(q(fb1).all()), list(q(fb2).all()))
+
+        # Deleting facts from the columnar storage
+        fb2.query(F).where(F.anum >= 10).delete()
+        self.assertEqual(fb2.query(F).count(), 10)
+
+        with self.assertRaises(ValueError) as ctx:
+            class H(Predicate):
+                atuple=(IntegerField,StringField)
+            FactBase(columnar=[H])
+        check_errmsg("Columnar storage requires", ctx)
+
+    #--------------------------------------------------------------------------
+    #   Test the aggregate query terminals
+    #--------------------------------------------------------------------------
+    def test_api_aggregates(self):
+        F = self.F
+        G = self.G
+        facts = [F(i, "abc"[i % 3]) for i in range(1,31)] + \
+                [G(i, "xy"[i % 2]) for i in range(0,40,4)]
+        for fb in [FactBase(facts), FactBase(facts, indexes=[F.anum, G.anum])]:
+            fs = [f for f in facts if isinstance(f, F)]
+
+            # Single table (with and without an index lookup)
+            q = fb.query(F)
+            self.assertEqual(q.count(), 30)
+            self.assertEqual(q.sum(F.anum), sum(f.anum for f in fs))
+            self.assertEqual(q.min(F.anum), 1)
+            self.assertEqual(q.max(F.astr), "c")
+            self.assertEqual(q.avg(F.anum), 15.5)
+            q = fb.query(F).where(F.anum >= 10)
+            self.assertEqual(q.count(), 21)
+            self.assertEqual(q.min(F.anum), 10)
+            self.assertEqual(q.max(F.anum), 30)
+            q = fb.query(F).where((F.anum < 5) | (F.anum > 28))
+            self.assertEqual((q.count(), q.min(F.anum), q.max(F.anum)), (6, 1, 30))
+            q = fb.query(F).where(F.anum > 100)
+            self.assertEqual((q.count(), q.sum(F.anum)), (0, 0))
+            self.assertEqual((q.min(F.anum), q.max(F.anum), q.avg(F.anum)),
+                             (None, None, None))
+
+            # A join with a group_by and the prepared version
+            q = fb.query(F,G).join(F.anum == G.anum).where(F.anum > ph1_)\
+                             .order_by(G.astr)
+            self.assertEqual(q.bind(4).count(), 6)
+            self.assertEqual(q.bind(4).sum(F.anum), 8+12+16+20+24+28)
+            q = q.group_by()
+            self.assertEqual(list(q.bind(4).count()), [("x", 6)])
+            self.assertEqual(list(q.bind(0).sum(F.anum)), [("x", 112)])
+            self.assertEqual(list(q.prepare().bind(0).max(G.anum)), [("x", 28)])
+
+            # Unique only supports count
+            q = fb.query(F).select(F.astr).unique()
+            self.assertEqual(q.count(), 3)
+            with self.assertRaises(ValueError) as ctx:
+                q.sum(F.anum)
+            check_errmsg("'unique' is incompatible", ctx)
+            with self.assertRaises(ValueError) as ctx:
+                fb.query(F).sum(G.anum)
+            check_errmsg("Aggregate path", ctx)
+
+    #--------------------------------------------------------------------------
+    #   Test limit/offset and top-k ordered queries
+    #--------------------------------------------------------------------------
+    def test_api_limit_offset(self):
+        F = self.F
+        G = self.G
+        facts = [F(i, "abc"[i % 3]) for i in range(1,31)] + \
+                [G(i, "xy"[i % 2]) for i in range(0,40,4)]
+        for fb in [FactBase(facts), FactBase(facts, indexes=[F.anum, G.anum])]:
+            fs = [f for f in facts if isinstance(f, F)]
+            mixed = sorted(sorted(fs, key=lambda f: f.anum, reverse=True),
+                           key=lambda f: f.astr)
+
+            # Unordered, ordered (with a mix of asc/desc), and an index order
+            q = fb.query(F)
+            self.assertEqual(len(list(q.limit(5).all())), 5)
+            self.assertEqual(set(q.offset(25).all()), set(q.all()) - set(q.limit(25).all()))
+            q = fb.query(F).order_by(F.astr, desc(F.anum))
+            self.assertEqual(list(q.limit(4).all()), mixed[:4])
+            self.assertEqual(list(q.offset(8).limit(5).all()), mixed[8:13])
+            self.assertEqual(list(q.offset(28).all()), mixed[28:])
+            q = fb.query(F).where(F.astr == "a").order_by(desc(F.anum))
+            self.assertEqual(list(q.limit(2).all()), [F(30,"a"), F(27,"a")])
+            self.assertEqual(q.first(), F(30,"a"))
+            self.assertEqual(q.prepare().first(), F(30,"a"))
+            self.assertEqual(list(q.limit(0).all()), [])
+
+            # A join and aggregates over the restricted results
+            q = fb.query(F,G).join(F.anum == G.anum).order_by(desc(G.anum))
+            self.assertEqual([g.anum for _,g in q.offset(1).limit(2).all()], [24,20])
+            self.assertEqual(q.limit(3).sum(F.anum), 28+24+20)
+            self.assertEqual(q.limit(3).count(), 3)
+            self.assertEqual(list(q.limit(2).select(G.anum).prepare().all()), [28,24])
+
+            # The old select API
+            q = fb.select(F).order_by(desc(F.anum)).limit(3).offset(1)
+            self.assertEqual([f.anum for f in q.get()], [29,28,27])
+
+            with self.assertRaises(ValueError) as ctx:
+                fb.query(F).limit(-1)
+            check_errmsg("The 'limit' value", ctx)
+            with self.assertRaises(ValueError) as ctx:
+                fb.query(F).limit(1).limit(2)
+            check_errmsg("Cannot specify 'limit'", ctx)
+
+        # Delete the two largest
+        fb = FactBase(facts)
+        self.assertEqual(fb.query(F).order_by(desc(F.anum)).limit(2).delete(), 2)
+        self.assertEqual(fb.query(F).max(F.anum), 28)
+
+        # An existing Select sub-class without limit()/offset() still works
+        OldSelect = type("OldSelect", (Select,),
+                         { n : (lambda self, *args, **kwargs: None)
+                           for n in Select.__abstractmethods__ })
+        with self.assertRaises(NotImplementedError) as ctx:
+            OldSelect().limit(1)
+
     #--------------------------------------------------------------------------
     #   Test bad calls to selecting on a single table
     #--------------------------------------------------------------------------
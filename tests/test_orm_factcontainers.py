@@ -13,7 +13,8 @@ from clorm.orm import RawField, IntegerField, StringField, ConstantField, \
     Predicate, ComplexTerm, path, hashable_path
 
 # Implementation imports
-from clorm.orm.factcontainers import FactIndex, FactMap, FactSet
+from clorm.orm.factcontainers import FactIndex, HashFactIndex, FactMap, \
+    FactSet, ColumnarFactSet, SortedKeyList, BlockedSortedKeyList
 
 #------------------------------------------------------------------------------
 #------------------------------------------------------------------------------
@@ -122,6 +123,189 @@ randlist.sort(key=attrgetter('anum'))
         self.assertEqual(fi1.keys, [1,2,3])
         self.assertEqual(fi2.keys, ["b","c"])
 
+    def test_add_facts(self):
+        Afact = self.Afact
+        Bfact = self.Bfact
+        fi1 = FactIndex(Afact.num1)
+        fi2 = FactIndex(Afact.num1)
+
+        facts = [ Afact(num1=n, str1=str(n)) for n in [5,3,9,3,1,5,7] ]
+        fi1.add_facts(facts)
+        for f in facts: fi2.add(f)
+        self.assertEqual(fi1.keys, [1,3,5,7,9])
+        self.assertEqual(fi1, fi2)
+
+        # Adding to a non-empty index merges the new keys
+        more = [ Afact(num1=n, str1="x") for n in [8,0,5,10] ]
+        fi1.add_facts(more)
+        for f in more: fi2.add(f)
+        self.assertEqual(fi1.keys, [0,1,3,5,7,8,9,10])
+        self.assertEqual(fi1, fi2)
+        self.assertEqual(set(fi1.find(operator.eq,5)),
+                         set([Afact(5,"5"),Afact(5,"x")]))
+
+        fi1.add_facts([])
+        self.assertEqual(fi1.keys, [0,1,3,5,7,8,9,10])
+        with self.assertRaises(TypeError) as ctx:
+            fi1.add_facts([Bfact(1,"a")])
+
+        # A failure part way through leaves a consistent index
+        with self.assertRaises(TypeError) as ctx:
+            fi1.add_facts([Afact(20,"y"), Afact(2,"y"), Bfact(1,"a")])
+        fi2.add(Afact(20,"y"))
+        fi2.add(Afact(2,"y"))
+        self.assertEqual(fi1.keys, [0,1,2,3,5,7,8,9,10,20])
+        self.assertEqual(fi1, fi2)
+        self.assertEqual(list(fi1.find(operator.eq,20)), [Afact(20,"y")])
+
+    def test_keystores(self):
+        import random
+        random.seed(1)
+
+        def check(ks, expected):
+            self.assertEqual(list(ks), expected)
+            self.assertEqual(list(reversed(ks)), list(reversed(expected)))
+            self.assertEqual(len(ks), len(expected))
+            for k in [-1, 0, 7, 50, 51, 99, 200]:
+                incs = [(True,True),(True,False),(False,True),(False,False)]
+                for inc in incs:
+                    lo = [x for x in expected if (x >= k if inc[0] else x > k)]
+                    hi = [x for x in expected if (x <= k if inc[1] else x < k)]
+                    self.assertEqual(list(ks.irange(minimum=k,inclusive=inc)), lo)
+                    self.assertEqual(list(ks.irange(maximum=k,inclusive=inc)), hi)
+                    self.assertEqual(list(ks.irange(minimum=k,inclusive=inc,
+                                                    reverse=True)), lo[::-1])
+                    self.assertEqual(list(ks.irange(maximum=k,inclusive=inc,
+                                                    reverse=True)), hi[::-1])
+                    mid = [x for x in hi if (x >= 7 if inc[0] else x > 7)]
+                    self.assertEqual(list(ks.irange(7,k,inclusive=inc)), mid)
+                    self.assertEqual(list(ks.irange(7,k,inclusive=inc,
+                                                    reverse=True)), mid[::-1])
+
+        for ks in [SortedKeyList(), BlockedSortedKeyList(load=4)]:
+            expected = []
+            check(ks, expected)
+            ks.update(sorted(random.sample(range(0,100,2), 20)))
+            expected = list(ks)
+            for k in random.sample(range(1,100,2), 30):
+                ks.add(k)
+                expected.append(k)
+            expected.sort()
+            check(ks, expected)
+            for k in random.sample(expected, 40):
+                ks.remove(k)
+                expected.remove(k)
+                self.assertEqual(list(ks), expected)
+            check(ks, expected)
+            with self.assertRaises(KeyError) as ctx:
+                ks.remove(1000)
+            ks.clear()
+            check(ks, [])
+
+        # A FactIndex with a specified key store
+        Afact = self.Afact
+        fi1 = FactIndex(Afact.num1, keystore=SortedKeyList)
+        fi2 = FactIndex(Afact.num1)
+        self.assertEqual(fi1.keystore, SortedKeyList)
+        self.assertEqual(fi2.keystore, BlockedSortedKeyList)
+        facts = [ Afact(num1=n, str1=str(n)) for n in range(0,100,3) ]
+        for fi in [fi1, fi2]:
+            fi.add_facts(facts)
+            self.assertEqual(list(fi.find(operator.ne, 3))[:2], facts[0:3:2])
+            self.assertEqual(list(fi.find(operator.ge, 95, reverse=True)),
+                             [facts[-1], facts[-2]])
+            self.assertEqual(list(fi.find(operator.lt, 5, reverse=True)),
+                             [facts[1], facts[0]])
+
+    def test_hash_factindex(self):
+        Afact = self.Afact
+        fi = HashFactIndex(Afact.num1)
+        self.assertFalse(fi.ordered)
+        self.assertTrue(FactIndex(Afact.num1).ordered)
+        facts = [ Afact(num1=n, str1=s) for n,s in [(5,"a"),(3,"b"),(9,"c"),(3,"d")] ]
+        fi.add_facts(facts)
+        fi.add(Afact(num1=1, str1="e"))
+        self.assertEqual(set(fi.keys), set([1,3,5,9]))
+        self.assertEqual(set(fi.find(operator.eq,3)), set([facts[1],facts[3]]))
+        self.assertEqual(set(fi.find(operator.eq,4)), set())
+        self.assertEqual(set(fi), set(facts + [Afact(num1=1, str1="e")]))
+        with self.assertRaises(ValueError) as ctx:
+            list(fi.find(operator.lt,3))
+        fi.remove(facts[1])
+        fi.discard(facts[1])
+        with self.assertRaises(KeyError) as ctx:
+            fi.remove(facts[1])
+        self.assertEqual(set(fi.find(operator.eq,3)), set([facts[3]]))
+        fi.remove(facts[3])
+        self.assertEqual(set(fi.keys), set([1,5,9]))
+        self.assertEqual(len(fi), 3)
+        fi.clear()
+        self.assertFalse(fi)
+
+        # FactMap creates a hash index from a (path, "hash") specification
+        fm = FactMap(Afact, [(Afact.num1,"hash"),Afact.str1])
+        hp = hashable_path
+        self.assertEqual(type(fm.path2factindex[hp(Afact.num1)]), HashFactIndex)
+        self.assertEqual(type(fm.path2factindex[hp(Afact.str1)]), FactIndex)
+        self.assertEqual(type(fm.copy().path2factindex[hp(Afact.num1)]),
+                         HashFactIndex)
+
+    def test_composite_factindex(self):
+        Afact = self.Afact
+        Bfact = self.Bfact
+        facts = [ Afact(num1=n, str1=s) for n in [1,2,3] for s in ["a","b","c"] ]
+        fi = FactIndex((Afact.num1,Afact.str1))
+        self.assertTrue(fi.composite)
+        self.assertFalse(FactIndex(Afact.num1).composite)
+        fi.add_facts(facts)
+        fi.add(Afact(num1=2, str1="b"))
+        self.assertEqual(fi.keys[:2], [(1,"a"),(1,"b")])
+        self.assertEqual(set(fi.find(operator.eq,(2,"b"))), set([Afact(2,"b")]))
+        self.assertEqual(list(fi.find(operator.lt,(1,"c"))),
+                         [Afact(1,"a"),Afact(1,"b")])
+
+        def fp(*args): return list(fi.find_prefix(*args))
+        self.assertEqual(fp((2,)), [Afact(2,"a"),Afact(2,"b"),Afact(2,"c")])
+        self.assertEqual(fp((2,"b")), [Afact(2,"b")])
+        self.assertEqual(fp((2,), operator.eq, "c"), [Afact(2,"c")])
+        self.assertEqual(fp((2,), operator.lt, "c"), [Afact(2,"a"),Afact(2,"b")])
+        self.assertEqual(fp((2,), operator.le, "b"), [Afact(2,"a"),Afact(2,"b")])
+        self.assertEqual(fp((2,), operator.gt, "a"), [Afact(2,"b"),Afact(2,"c")])
+        self.assertEqual(fp((2,), operator.ge, "c"), [Afact(2,"c")])
+        self.assertEqual(fp((2,), operator.ne, "b"), [Afact(2,"a"),Afact(2,"c")])
+        self.assertEqual(fp((), operator.gt, 2), [Afact(3,"a"),Afact(3,"b"),Afact(3,"c")])
+        self.assertEqual(fp((4,)), [])
+        with self.assertRaises(ValueError) as ctx:
+            fp((2,"b"), operator.eq, 1)
+        with self.assertRaises(TypeError) as ctx:
+            list(FactIndex(Afact.num1).find_prefix((1,)))
+        with self.assertRaises(TypeError) as ctx:
+            FactIndex((Afact.num1,Bfact.str1))
+
+        fi.remove(Afact(2,"b"))
+        self.assertEqual(fp((2,)), [Afact(2,"a"),Afact(2,"c")])
+
+        # A composite hash index only supports lookups on the complete key
+        hfi = HashFactIndex((Afact.num1,Afact.str1))
+        hfi.add_facts(facts)
+        self.assertEqual(list(hfi.find_prefix((2,"b"))), [Afact(2,"b")])
+        self.assertEqual(list(hfi.find_prefix((2,),operator.eq,"b")), [Afact(2,"b")])
+        with self.assertRaises(ValueError) as ctx:
+            hfi.find_prefix((2,))
+
+        # FactMap creates a composite index from a tuple of paths
+        hp = hashable_path
+        fm = FactMap(Afact, [(Afact.num1,Afact.str1),
+                             ((Afact.str1,Afact.num1),"hash")])
+        self.assertEqual(type(fm.path2factindex[(hp(Afact.num1),hp(Afact.str1))]),
+                         FactIndex)
+        self.assertEqual(type(fm.path2factindex[(hp(Afact.str1),hp(Afact.num1))]),
+                         HashFactIndex)
+        fm.add_facts(facts)
+        self.assertEqual(fm.copy().path2factindex,fm.path2factindex)
+        with self.assertRaises(ValueError) as ctx:
+            FactMap(Afact, [(Afact.num1,Bfact.str1)])
+
     def test_remove(self):
         Afact = self.Afact
         Bfact = self.Bfact
@@ -155,6 +339,42 @@ randlist.sort(key=attrgetter('anum'))
         fi.remove(af3b)
         self.assertEqual(fi.keys, [])
 
+    def test_remove_facts(self):
+        Afact = self.Afact
+        facts = [ Afact(num1=n % 40, str1=str(n)) for n in range(200) ]
+        dead = facts[:100:3] + facts[100:]
+        left = [f for f in facts if f not in set(dead)]
+
+        # The key stores (with both a bulk and an incremental removal)
+        for ks in [SortedKeyList(), BlockedSortedKeyList(load=4)]:
+            ks.update(list(range(100)))
+            ks.remove_keys([5, 7])
+            ks.remove_keys(list(range(50, 100)))
+            self.assertEqual(list(ks), [k for k in range(50) if k not in (5,7)])
+            self.assertEqual(len(ks), 48)
+
+        for fi in [ FactIndex(Afact.num1), FactIndex(Afact.num1, SortedKeyList),
+                    HashFactIndex(Afact.num1) ]:
+            fi.add_facts(facts)
+            fi.remove_facts(dead)
+            self.assertEqual(set(fi), set(left))
+            self.assertEqual(sorted(fi.keys),
+                             sorted(set([f.num1 for f in left])))
+            with self.assertRaises(KeyError) as ctx:
+                fi.remove_facts([facts[0]])
+            fi.remove_facts([facts[0]], False)
+
+        # A missing fact leaves the FactMap unchanged
+        fm = FactMap(Afact, [Afact.num1])
+        fm.add_facts(facts)
+        with self.assertRaises(KeyError) as ctx:
+            fm.remove_facts(dead + [Afact(num1=1000, str1="x")])
+        self.assertEqual(len(fm.factset), 200)
+        fm.remove_facts(dead + [Afact(num1=1000, str1="x")], False)
+        self.assertEqual(set(fm.factset), set(left))
+        self.assertEqual(set(fm.path2factindex[hashable_path(Afact.num1)]),
+                         set(left))
+
     def test_find(self):
         Afact = self.Afact
 
@@ -182,7 +402,7 @@ randlist.sort(key=attrgetter('anum'))
     def test_clear(self):
         Afact = self.Afact
         fi = FactIndex(Afact.num1)
-        fi.add(Afact(num1=1, str1="a"))
+        fi.add(Afact(num1=1, str1="e"))
         fi.clear()
         self.assertEqual(fi.keys,[])
 
@@ -375,7 +595,10 @@ class FactMapTestCase(unittest.TestCase):
 
         fm2 = fm1.copy()
 
+        # The copy shares the facts and indexes until the first mutation
         self.assertTrue(not fm1 is fm2)
+        self.assertTrue(fm1.factset is fm2.factset)
+        fm2.add_fact(af1)
         self.assertTrue(not fm1.factset is fm2.factset)
         self.assertTrue(not fm1.path2factindex is fm2.path2factindex)
         self.assertTrue(not fm1.path2factindex[hp(Afact.anum)] \
@@ -383,6 +606,94 @@ class FactMapTestCase(unittest.TestCase):
 
         self.assertEqual(fm1.path2factindex, fm2.path2factindex)
 
+        # Mutating either the original or the copy leaves the other unchanged
+        fm3 = fm1.copy()
+        fm1.remove(af1)
+        self.assertEqual(set(fm3.factset), set([af1,af2,af3,af4]))
+        self.assertEqual(set(fm3.path2factindex[hp(Afact.anum)]),
+                         set([af1,af2,af3,af4]))
+        fm4 = fm3.copy()
+        fm4.clear()
+        self.assertEqual(len(fm3.factset), 4)
+        fm4.add_fact(af3)
+        self.assertEqual(list(fm4.path2factindex[hp(Afact.anum)]), [af3])
+        self.assertEqual(len(fm3.path2factindex[hp(Afact.anum)]), 4)
+
+    #--------------------------------------------------------------------------
+    # Test counting and the first key of the facts matching an index lookup
+    #--------------------------------------------------------------------------
+    def test_factindex_count_first_key(self):
+        Afact = self.Afact
+        facts = [Afact(i % 10, "c{}".format(i)) for i in range(50)]
+        fi = FactIndex(Afact.anum)
+        fi.add_facts(facts)
+        hfi = HashFactIndex(Afact.anum)
+        hfi.add_facts(facts)
+        for op in [operator.eq, operator.ne, operator.lt, operator.le,
+                   operator.gt, operator.ge]:
+            self.assertEqual(fi.count(op, 4), len(list(fi.find(op, 4))))
+        self.assertEqual(hfi.count(operator.eq, 4), 5)
+        self.assertEqual(fi.first_key(), 0)
+        self.assertEqual(fi.first_key(reverse=True), 9)
+        self.assertEqual(fi.first_key(operator.gt, 4), 5)
+        self.assertEqual(fi.first_key(operator.lt, 4, reverse=True), 3)
+        self.assertEqual(fi.first_key(operator.gt, 9), None)
+        with self.assertRaises(TypeError) as ctx:
+            hfi.first_key()
+
+    #--------------------------------------------------------------------------
+    # Test the columnar storage of facts
+    #--------------------------------------------------------------------------
+    def test_factmap_columnar(self):
+        Afact = self.Afact
+        hp = hashable_path
+
+        class Bfact(Predicate):
+            anum=IntegerField
+            atuple=(IntegerField,IntegerField)
+
+        self.assertTrue(ColumnarFactSet.supported(Afact))
+        self.assertFalse(ColumnarFactSet.supported(Bfact))
+        with self.assertRaises(ValueError) as ctx:
+            FactMap(Bfact, columnar=True)
+        check_errmsg("Columnar storage requires", ctx)
+
+        facts = [Afact(i, "c{}".format(i % 3)) for i in range(3000)]
+        nfacts = [Afact(i, "c", sign=False) for i in range(3)]
+        fm = FactMap(Afact, [Afact.anum], columnar=True)
+        self.assertTrue(fm.columnar)
+        self.assertTrue(isinstance(fm.factset, ColumnarFactSet))
+        fm.add_facts(facts + nfacts + facts[:10])
+        self.assertEqual(len(fm.factset), 3003)
+        self.assertEqual(list(fm.factset), facts + nfacts)
+        self.assertEqual(set(fm.path2factindex[hp(Afact.anum)]), set(facts + nfacts))
+        self.assertTrue(Afact(5,"c2") in fm.factset)
+        self.assertFalse(Afact(5,"c1") in fm.factset)
+        self.assertFalse(Afact(0,"c") in fm.factset)
+        self.assertTrue(Afact(0,"c",sign=False) in fm.factset)
+        self.assertEqual(list(fm.factset.column("anum")[:3]), [0,1,2])
+
+        # Removing facts (and compacting the columns) maintains the ordering
+        for f in facts[:2000]: fm.remove(f)
+        with self.assertRaises(KeyError) as ctx:
+            fm.remove(facts[0])
+        fm.discard(facts[0])
+        self.assertEqual(len(fm.factset), 1003)
+        self.assertEqual(list(fm.factset), facts[2000:] + nfacts)
+        fm.add_fact(facts[0])
+        self.assertEqual(list(fm.factset), facts[2000:] + nfacts + facts[:1])
+        for f in facts[2000:]: self.assertTrue(f in fm.factset)
+
+        # Set operations preserve the columnar storage
+        fm2 = fm.union(FactMap(Afact))
+        self.assertTrue(fm2.columnar)
+        self.assertEqual(set(fm2.factset), set(fm.factset))
+        fm3 = fm.copy()
+        self.assertTrue(isinstance(fm3.factset, ColumnarFactSet))
+        fm.clear()
+        self.assertFalse(fm)
+        self.assertEqual(len(fm3.factset), 1004)
+
 #------------------------------------------------------------------------------
 # main
 #------------------------------------------------------------------------------
@@ -20,6 +20,7 @@ from clorm.orm import RawField, IntegerField, StringField, ConstantField, \
 
 # Implementation imports
 from clorm.orm.core import QCondition, trueall
+from clorm.orm.factcontainers import FactIndex, HashFactIndex, index_hashable
 
 # Official Clorm API imports for the fact base components
 from clorm.orm import desc, asc, ph_, ph1_, ph2_, func_, not_, and_, or_, \
@@ -31,18 +32,20 @@ from clorm.orm.query import PositionalPlaceholder, NamedPlaceholder, \
     make_input_alignment_functor, \
     validate_where_expression, negate_where_expression, \
     where_expression_to_nnf, where_expression_to_cnf, \
-    Clause, ClauseBlock, normalise_where_expression, \
+    Clause, ClauseBlock, make_clauseblock_callable, make_clauseblock_binder, \
+    normalise_where_expression, \
     process_where, partition_clauses, \
     validate_join_expression, process_join, \
-    basic_join_order, fixed_join_order, oppref_join_order, \
+    basic_join_order, fixed_join_order, oppref_join_order, cost_join_order, \
     make_query_plan_preordered_roots, \
     validate_orderby_expression, OrderBy, OrderByBlock, process_orderby, \
     partition_orderbys, make_prejoin_pair, make_join_pair, make_query_plan, \
+    make_cached_query_plan, clear_query_plan_cache, \
     JoinQueryPlan, QueryPlan, QuerySpec, \
     make_first_prejoin_query, make_prejoin_query_source, \
     make_first_join_query, \
     make_chained_join_query, make_query, \
-    InQuerySorter, QueryExecutor
+    InQuerySorter, HashJoinTable, SortedJoinTable, QueryExecutor
 
 ###### NOTE: The QueryOutput tests need to be turned into QueryExecutor
 ###### tests. We can then delete QueryOutput which is not being used for
@@ -976,6 +979,81 @@ class WhereExpressionTestCase(unittest.TestCase):
 #        self.assertTrue(trivialtrue((f2,g2)))
 #        self.assertTrue(trivialtrue((f1,g1)))
 
+    # ------------------------------------------------------------------------------
+    # The generated clause block function gives the same results as evaluating
+    # each comparator and falls back to the comparator callable when needed
+    # ------------------------------------------------------------------------------
+    def test_nonapi_make_clauseblock_callable(self):
+        F = self.F
+        G = self.G
+        wsc = StandardComparator.from_where_qcondition
+        fc = FunctionComparator.from_specification([F.anum,G.anum],
+                                                   lambda x,y : x + y == 4)
+
+        cb = ClauseBlock([Clause([wsc(F.anum == 1), wsc(F.atuple[1] < G.astr)]),
+                          Clause([wsc(G.anum != 2), fc.ground()]),
+                          Clause([wsc(F.atuple[0] >= 2)])])
+        testfunc = make_clauseblock_callable(cb.clauses, [G,F])
+        self.assertEqual(cb.make_callable([G,F]).__name__, "clauseblock")
+
+        def expected(g,f):
+            for clause in cb:
+                if not any(c.make_callable([G,F])((g,f)) for c in clause):
+                    return False
+            return True
+
+        facts = [(G(n,s),F(m,t,(m,s))) for n in range(4) for m in range(4)
+                 for s in ["a","b"] for t in ["a","c"]]
+        for fs in facts:
+            self.assertEqual(testfunc(fs), expected(*fs))
+        self.assertTrue(testfunc((G(1,"b"),F(1,"a",(2,"a")))))
+        self.assertFalse(testfunc((G(2,"b"),F(3,"a",(2,"b")))))
+
+        # Trivial comparators and an invalid signature
+        tt = StandardComparator(trueall,[F,G])
+        self.assertTrue(make_clauseblock_callable([Clause([tt])],[F,G])((1,2)))
+        with self.assertRaises(TypeError) as ctx:
+            make_clauseblock_callable(cb.clauses, [F])
+        check_errmsg("Invalid signature match", ctx)
+
+        # Clause blocks with the same structure share the compiled function
+        cb1 = ClauseBlock([Clause([wsc(F.anum == 1)]), Clause([wsc(F.astr != "a")])])
+        cb2 = ClauseBlock([Clause([wsc(F.anum == 2)]), Clause([wsc(F.astr != "b")])])
+        f1 = cb1.make_callable([F])
+        f2 = cb2.make_callable([F])
+        self.assertTrue(f1.__code__ is f2.__code__)
+        self.assertTrue(f1((F(1,"b",(1,"b")),)))
+        self.assertFalse(f2((F(1,"b",(1,"b")),)))
+        self.assertTrue(f2((F(2,"a",(1,"b")),)))
+
+        # Cannot make callable an ungrounded clause block
+        with self.assertRaises(TypeError) as ctx:
+            make_clauseblock_callable([Clause([wsc(F.anum == ph1_)])], [F])
+        check_errmsg("Internal bug", ctx)
+
+        # But a binder takes the values of the placeholders
+        f = F(1,"a",(1,"a"))
+        cb = ClauseBlock([Clause([wsc(F.anum == ph1_), wsc(F.astr == ph2_)])])
+        binder = make_clauseblock_binder(cb.clauses, [F])
+        self.assertTrue(binder(1, "b")((f,)))
+        self.assertTrue(binder(2, "a")((f,)))
+        self.assertFalse(binder(2, "b")((f,)))
+        self.assertTrue(binder(1, "b").__code__ is binder(2, "a").__code__)
+        with self.assertRaises(ValueError) as ctx:
+            binder(1)
+        check_errmsg("Missing positional placeholder", ctx)
+
+        # Including a function comparator with a placeholder
+        pfc = FunctionComparator.from_specification([F.anum], lambda x,y : x == y)
+        cb = ClauseBlock([Clause([wsc(F.astr == ph_("s"))]), Clause([pfc])])
+        binder = make_clauseblock_binder(cb.clauses, [F])
+        self.assertTrue(binder(s="a", y=1)((f,)))
+        self.assertFalse(binder(s="b", y=1)((f,)))
+        self.assertFalse(binder(s="a", y=2)((f,)))
+        with self.assertRaises(ValueError) as ctx:
+            binder(y=1)
+        check_errmsg("Missing named placeholder", ctx)
+
     # ------------------------------------------------------------------------------
     # ------------------------------------------------------------------------------
     def test_nonapi_normalise_where_expression(self):
@@ -1287,6 +1365,84 @@ class QueryPlanTestCase(unittest.TestCase):
         self.assertEqual(prejoinsc, None)
         self.assertEqual(prejoincb,where)
 
+    # ------------------------------------------------------------------------------
+    # A composite index is used for equalities on a prefix of its paths followed
+    # by an optional range comparison
+    # ------------------------------------------------------------------------------
+
+    def test_nonapi_make_prejoin_pair_composite_index(self):
+        F = path(self.F)
+        pw = process_where
+        wsc = StandardComparator.from_where_qcondition
+        cmp = (F.anum,F.astr)
+
+        def indexes(*fis): return { index_hashable(fi.path) : fi for fi in fis }
+
+        clauses = pw((F.astr == "foo") & (F.anum == 4) & (F.anum > 2),[F])
+        (prejoinsc, prejoincb) = make_prejoin_pair([F.anum,cmp], clauses)
+        self.assertEqual(prejoinsc, ClauseBlock([Clause([wsc(F.anum == 4)]),
+                                                 Clause([wsc(F.astr == "foo")])]))
+        self.assertEqual(prejoincb, pw(F.anum > 2,[F]))
+
+        clauses = pw((F.anum == 4) & (F.astr < "foo"),[F])
+        (prejoinsc, prejoincb) = make_prejoin_pair([cmp], clauses)
+        self.assertEqual(prejoinsc, clauses)
+        self.assertEqual(prejoincb, None)
+
+        # A composite hash index requires equality on all the paths
+        (prejoinsc, prejoincb) = make_prejoin_pair(
+            indexes(HashFactIndex(cmp)), clauses)
+        self.assertEqual(prejoinsc, None)
+        self.assertEqual(prejoincb, clauses)
+
+        # A single clause prefix is only used if there is no other index
+        clauses = pw((F.anum == 4) & ((F.astr == 1) | (F.astr == 2)),[F])
+        (prejoinsc, prejoincb) = make_prejoin_pair([cmp], clauses)
+        self.assertEqual(prejoinsc, ClauseBlock([Clause([wsc(F.anum == 4)])]))
+        self.assertEqual(prejoincb, pw((F.astr == 1) | (F.astr == 2),[F]))
+        (prejoinsc, prejoincb) = make_prejoin_pair([cmp,F.astr], clauses)
+        self.assertEqual(prejoinsc, Clause([wsc(F.astr == 1), wsc(F.astr == 2)]))
+
+        # Disjunctions can't be used with a composite index
+        clauses = pw(((F.anum == 4) | (F.anum == 5)) & (F.astr == "foo"),[F])
+        (prejoinsc, prejoincb) = make_prejoin_pair([cmp], clauses)
+        self.assertEqual(prejoinsc, None)
+        self.assertEqual(prejoincb, clauses)
+
+    # ------------------------------------------------------------------------------
+    # A hash index is only used for equality comparisons
+    # ------------------------------------------------------------------------------
+
+    def test_nonapi_make_prejoin_pair_hash_index(self):
+        F = path(self.F)
+        pw = process_where
+        wsc = StandardComparator.from_where_qcondition
+        hp = hashable_path
+
+        def indexes(*fis): return { hp(fi.path) : fi for fi in fis }
+
+        clauses = pw((F.anum < 4) & (F.astr == "foo" ),[F])
+        (prejoinsc, _) = make_prejoin_pair(
+            indexes(FactIndex(F.anum), HashFactIndex(F.astr)), clauses)
+        self.assertEqual(prejoinsc, Clause([wsc(F.astr == "foo")]))
+
+        (prejoinsc, prejoincb) = make_prejoin_pair(
+            indexes(HashFactIndex(F.anum)), clauses)
+        self.assertEqual(prejoinsc, None)
+        self.assertEqual(prejoincb, clauses)
+
+        clauses = pw((F.anum == 4) & (F.astr < "foo" ),[F])
+        (prejoinsc, prejoincb) = make_prejoin_pair(
+            indexes(HashFactIndex(F.anum), HashFactIndex(F.astr)), clauses)
+        self.assertEqual(prejoinsc, Clause([wsc(F.anum == 4)]))
+        self.assertEqual(prejoincb, pw(F.astr < "foo",[F]))
+
+        clauses = pw((F.anum == 4) | (F.anum == 5),[F])
+        (prejoinsc, prejoincb) = make_prejoin_pair(
+            indexes(HashFactIndex(F.anum)), clauses)
+        self.assertEqual(prejoinsc, clauses[0])
+        self.assertEqual(prejoincb, None)
+
 
     # ------------------------------------------------------------------------------
     # Test generating the join components of a JoinQueryPlan
@@ -1654,6 +1810,85 @@ class QueryPlanTestCase(unittest.TestCase):
         qorder = oppref_join_order([], qspec)
         self.assertEqual(qorder,[FA,GA,G,F])
 
+    # ------------------------------------------------------------------------------
+    # Test the cost based heuristic for generating the join order
+    # ------------------------------------------------------------------------------
+    def test_nonapi_cost_join_order(self):
+        F = path(self.F)
+        G = path(self.G)
+        FA = alias(F)
+        pj = process_join
+        pw = process_where
+        hp = hashable_path
+        def hps(paths): return [hp(p) for p in paths]
+
+        factsets = { self.F : FactSet([self.F(i,i) for i in range(100)]),
+                     self.G : FactSet([self.G(i,i) for i in range(5)]) }
+        findex = FactIndex(F.anum)
+        findex.add_facts(factsets[self.F])
+
+        # The smaller fact set is the outer loop
+        joins = pj([F.anum == G.anum],[F,G])
+        qspec = QuerySpec(roots=[F,G],join=joins,where=[],order_by=[])
+        self.assertEqual(hps(cost_join_order([], qspec, factsets)), hps([G,F]))
+        self.assertEqual(hps(cost_join_order({hp(F.anum) : findex}, qspec, factsets)),
+                         hps([G,F]))
+
+        # Unless there is a where clause that makes it more selective
+        where = pw(F.anum == 1,[F,G])
+        qspec = QuerySpec(roots=[F,G],join=joins,where=where,order_by=[])
+        self.assertEqual(hps(cost_join_order([], qspec, factsets)), hps([F,G]))
+
+        # Without a join the cheapest is the smallest outer loop but it is a tie
+        # so falls back to the oppref ordering
+        qspec = QuerySpec(roots=[F,G],join=[],where=[],order_by=[])
+        self.assertEqual(hps(cost_join_order([], qspec, factsets)),
+                         hps(oppref_join_order([], qspec)))
+
+        # Without the fact sets it uses the FactIndex or a default size
+        joins = pj([F.anum == FA.anum, FA.anum == G.anum],[F,G,FA])
+        qspec = QuerySpec(roots=[F,G,FA],join=joins,where=[],order_by=[])
+        self.assertEqual(hps(cost_join_order({hp(F.anum) : findex}, qspec))[2],
+                         hp(G))
+        self.assertEqual(hps(cost_join_order({hp(F.anum) : findex}, qspec,
+                                             factsets))[0], hp(G))
+
+        # The default heuristic is the cost based one
+        qspec = QuerySpec(roots=[F,G],join=pj([F.anum == G.anum],[F,G]),
+                          where=[],order_by=[])
+        qp = make_query_plan({hp(F.anum) : findex}, qspec, factsets)
+        self.assertEqual(hps([jqp.root for jqp in qp]), hps([G,F]))
+
+    # ------------------------------------------------------------------------------
+    # Test the query plan cache
+    # ------------------------------------------------------------------------------
+    def test_nonapi_make_cached_query_plan(self):
+        F = path(self.F)
+        G = path(self.G)
+        pj = process_join
+        pw = process_where
+        hp = hashable_path
+
+        findex = FactIndex(F.anum)
+        qspec = QuerySpec(roots=[F,G],join=pj([F.anum == G.anum],[F,G]),
+                          where=pw(F.astr == ph1_,[F,G]),order_by=[])
+        qspec = qspec.fill_defaults()
+
+        clear_query_plan_cache()
+        qp1 = make_cached_query_plan({hp(F.anum) : findex}, qspec)
+        qp2 = make_cached_query_plan({hp(F.anum) : findex}, qspec)
+        self.assertIs(qp1, qp2)
+        self.assertEqual(qp1, make_query_plan({hp(F.anum) : findex}, qspec))
+
+        # A different index layout generates a new plan
+        qp3 = make_cached_query_plan({}, qspec)
+        self.assertIsNot(qp1, qp3)
+        self.assertEqual(qp3, make_query_plan({}, qspec))
+
+        # Clearing the cache
+        clear_query_plan_cache()
+        self.assertIsNot(qp1, make_cached_query_plan({hp(F.anum) : findex}, qspec))
+
     # ------------------------------------------------------------------------------
     # Test the basic heuristic for generating the join order
     # ------------------------------------------------------------------------------
@@ -2010,7 +2245,7 @@ class QueryTestCase(unittest.TestCase):
         qspec = QuerySpec(roots=roots,join=join,where=[],order_by=[],joh=fjoh)
         qp = make_query_plan(indexes.keys(), qspec)
         out = make_prejoin_query_source(qp[1], factsets, indexes)()
-        self.assertTrue(isinstance(out,FactIndex))
+        self.assertTrue(isinstance(out,HashJoinTable))
         self.assertEqual(hashable_path(out.path), hashable_path(G.anum))
         self.assertEqual(set(out), set(factsets[G]))
 
@@ -2020,7 +2255,7 @@ class QueryTestCase(unittest.TestCase):
         qspec = QuerySpec(roots=roots,join=join,where=where,order_by=[],joh=fjoh)
         qp = make_query_plan(indexes.keys(), qspec)
         out = make_prejoin_query_source(qp[1], factsets, indexes)()
-        self.assertTrue(isinstance(out,FactIndex))
+        self.assertTrue(isinstance(out,HashJoinTable))
         self.assertEqual(hashable_path(out.path), hashable_path(G.astr))
         self.assertEqual(set(out), set([G(1,"foo"),G(5,"foo")]))
 
@@ -2030,10 +2265,54 @@ class QueryTestCase(unittest.TestCase):
         qspec = QuerySpec(roots=roots,join=join,where=where,order_by=[],joh=fjoh)
         qp = make_query_plan(indexes.keys(), qspec)
         out = make_prejoin_query_source(qp[1], factsets, indexes)()
-        self.assertTrue(isinstance(out,FactIndex))
+        self.assertTrue(isinstance(out,HashJoinTable))
         self.assertEqual(hashable_path(out.path), hashable_path(G.astr))
         self.assertEqual(set(out), set([G(1,"a"),G(1,"foo")]))
 
+    # ------------------------------------------------------------------------------
+    # Test the transient join tables
+    # ------------------------------------------------------------------------------
+
+    def test_nonapi_join_tables(self):
+        G = self.G
+        facts = [G(3,"a"),G(1,"b"),G(2,"c"),G(1,"d"),G(3,"e")]
+
+        hjt = HashJoinTable(G.anum, facts)
+        self.assertEqual(hashable_path(hjt.path), hashable_path(G.anum))
+        self.assertEqual(hjt.find(operator.eq,1), [G(1,"b"),G(1,"d")])
+        self.assertEqual(hjt.find(operator.eq,4), [])
+        self.assertEqual(set(hjt), set(facts))
+        with self.assertRaises(ValueError) as ctx:
+            hjt.find(operator.lt,1)
+
+        sjt = SortedJoinTable(G.anum, facts)
+        self.assertEqual(list(sjt), [G(1,"b"),G(1,"d"),G(2,"c"),G(3,"a"),G(3,"e")])
+        self.assertEqual(sjt.find(operator.eq,1), [G(1,"b"),G(1,"d")])
+        self.assertEqual(sjt.find(operator.ne,2), [G(1,"b"),G(1,"d"),G(3,"a"),G(3,"e")])
+        self.assertEqual(sjt.find(operator.lt,2), [G(1,"b"),G(1,"d")])
+        self.assertEqual(sjt.find(operator.le,2), [G(1,"b"),G(1,"d"),G(2,"c")])
+        self.assertEqual(sjt.find(operator.gt,2), [G(3,"a"),G(3,"e")])
+        self.assertEqual(sjt.find(operator.ge,2), [G(2,"c"),G(3,"a"),G(3,"e")])
+        self.assertEqual(sjt.find(operator.gt,3), [])
+
+        sjt = SortedJoinTable(G.astr, sorted(facts, key=lambda f: f.astr),
+                              presorted=True)
+        self.assertEqual(sjt.find(operator.lt,"c"), [G(3,"a"),G(1,"b")])
+
+        # A range join builds a sorted join table
+        F = self.F
+        indexes = self.indexes
+        factsets = self.factsets
+        roots = [F,G]
+        join = process_join([F.anum < G.anum],roots)
+        where = process_where(G.astr == "foo",roots)
+        qspec = QuerySpec(roots=roots,join=join,where=where,order_by=[],
+                          joh=basic_join_order)
+        qp = make_query_plan(indexes.keys(), qspec)
+        out = make_prejoin_query_source(qp[1], factsets, indexes)()
+        self.assertTrue(isinstance(out,SortedJoinTable))
+        self.assertEqual(list(out), [G(1,"foo"),G(5,"foo")])
+
     # ------------------------------------------------------------------------------
     # Test generating the prejoin query source function
     # ------------------------------------------------------------------------------
@@ -2239,6 +2518,15 @@ class QueryTestCase(unittest.TestCase):
             q1 = make_query(qp2, factsets, indexes)
         check_errmsg("Cannot execute an ungrounded query",ctx)
 
+        # A parameterised query takes the values for the placeholders
+        q2 = make_query(qp2, factsets, indexes, parameterised=True)
+        self.assertEqual(expected, list(q2("foo")))
+        self.assertEqual(list(make_query(qp2.ground("a"), factsets, indexes)()),
+                         list(q2("a")))
+        with self.assertRaises(ValueError) as ctx:
+            list(q2())
+        check_errmsg("Missing positional placeholder",ctx)
+
 #------------------------------------------------------------------------------
 # Helper function for QueryExecutor testing
 #------------------------------------------------------------------------------
@@ -8,6 +8,8 @@
 # ------------------------------------------------------------------------------
 
 import unittest
+import copy
+import pickle
 from .support import check_errmsg
 
 from clingo import Control, Number, String, Function, SymbolType
@@ -18,7 +20,9 @@ from clorm.orm import \
     Predicate, ComplexTerm, path, hashable_path, FactBase
 
 # Official Clorm API imports
-from clorm.orm import SymbolPredicateUnifier, unify
+from clorm.orm import SymbolPredicateUnifier, unify, unify_iter
+
+import clorm.orm.unifier
 
 #------------------------------------------------------------------------------
 #------------------------------------------------------------------------------
@@ -27,6 +31,38 @@ __all__ = [
     'UnifyTestCase'
     ]
 
+#------------------------------------------------------------------------------
+# Predicates for the parallel unification and pickling tests. These are defined
+# at the module level so that they are importable by the worker processes on
+# platforms that cannot fork processes (and by pickle).
+#------------------------------------------------------------------------------
+
+class ParallelCT(ComplexTerm):
+    a=IntegerField
+    b=ConstantField
+    class Meta: name="ct"
+
+class ParallelTT(ComplexTerm):
+    a=IntegerField
+    b=StringField
+    class Meta: is_tuple=True
+
+class ParallelAfact(Predicate):
+    num1=IntegerField(index=True)
+    str1=StringField
+    ct=ParallelCT.Field
+    class Meta: name="afact"
+
+class ParallelBfact(Predicate):
+    num1=IntegerField
+    str1=SimpleField
+    tt=ParallelTT.Field
+    class Meta: name="bfact"
+
+class ParallelCfact(Predicate):
+    r=RawField
+    class Meta: name="cfact"
+
 #------------------------------------------------------------------------------
 #
 #------------------------------------------------------------------------------
@@ -293,6 +329,225 @@ class UnifyTestCase(unittest.TestCase):
             unify([F],[raw])
         check_errmsg("name 'blah' is not defined",ctx)
 
+    #--------------------------------------------------------------------------
+    # Test the precompiled signature dispatch table used for unification
+    #--------------------------------------------------------------------------
+    def test_nonapi_unify_dispatch_table(self):
+        class DoubleField(IntegerField):
+            cltopy = lambda x: x*2
+            pytocl = lambda x: x//2
+        class F1(Predicate):
+            a=IntegerField
+            class Meta: name = "f"; sign = True
+        class F2(Predicate):
+            a=ConstantField
+            class Meta: name = "f"
+        class F3(Predicate):
+            a=DoubleField
+            class Meta: name = "f"
+
+        spu = SymbolPredicateUnifier(predicates=[F1,F2,F3])
+        table = spu._table
+        self.assertEqual(set(table.keys()),
+                         set([("f",1,True),("f",1,False)]))
+        self.assertEqual([c for c,_ in table[("f",1,True)]], [F1,F2,F3])
+        self.assertEqual([c for c,_ in table[("f",1,False)]], [F2,F3])
+        self.assertEqual(table[("f",1,True)][2][1], None)
+
+        raws = [ Function("f",[Number(1)]), Function("f",[Number(2)],False),
+                 Function("f",[Function("a",[])],False), Function("f",[String("a")]),
+                 Number(1), String("f"), Function("g",[Number(1)]) ]
+        self.assertEqual(unify(spu, raws, ordered=True),
+                         [F1(1), F3(4,sign=False), F2("a",sign=False)])
+        self.assertEqual(unify(spu, raws, ordered=True, lazy=True),
+                         unify([F1,F2,F3], raws, ordered=True))
+
+        # Registering a new predicate rebuilds the table
+        class G(Predicate):
+            a=IntegerField
+        spu.register(G)
+        self.assertEqual(unify(spu, raws, ordered=True)[-1], G(1))
+
+    #--------------------------------------------------------------------------
+    # Test parallel unification using a process pool
+    #--------------------------------------------------------------------------
+    def test_unify_workers(self):
+        CT = ParallelCT
+        TT = ParallelTT
+        Afact = ParallelAfact
+        Bfact = ParallelBfact
+        Cfact = ParallelCfact
+
+        raws = []
+        for i in range(100):
+            raws.append(Afact(i,str(i),CT(i,"c")).raw)
+            raws.append(Bfact(i,"b",TT(i,"x")).raw)
+            raws.append(Function("afact",[Number(i)]))
+            raws.append(Cfact(Function("g",[Number(i)])).raw)
+
+        expected = unify([Afact,Bfact,Cfact], raws, ordered=True)
+        result = unify([Afact,Bfact,Cfact], raws, ordered=True, workers=2)
+        self.assertEqual(result, expected)
+        self.assertEqual([f.ct for f in result[::3]], [f.ct for f in expected[::3]])
+        self.assertEqual(result[1].tt, TT(0,"x"))
+        self.assertEqual(result[2].r, Function("g",[Number(0)]))
+
+        # The facts have the same (tuple) field values as the serial facts
+        for f, e in zip(result, expected):
+            self.assertEqual(type(f._field_values), type(e._field_values))
+
+        # Non-transferable fields are only decoded on access with lazy
+        # unification and the pool is re-used
+        pool = clorm.orm.unifier._g_parallel_pool
+        self.assertEqual(result[0]._field_values[2], CT(0,"c"))
+        result = unify([Afact,Bfact,Cfact], raws, ordered=True, lazy=True,
+                       workers=2)
+        self.assertTrue(clorm.orm.unifier._g_parallel_pool is pool)
+        self.assertEqual(result, expected)
+        self.assertTrue(result[0]._field_values[2] is clorm.orm.core._undecoded)
+        self.assertEqual(result[0].ct, CT(0,"c"))
+
+        spu = SymbolPredicateUnifier(predicates=[Afact,Bfact,Cfact])
+        fb = spu.unify(raws, workers=2)
+        self.assertEqual(fb, spu.unify(raws))
+        self.assertEqual([hashable_path(p) for p in fb.indexes],
+                         [hashable_path(Afact.num1)])
+        self.assertEqual(unify(spu, [], workers=2), FactBase())
+
+    #--------------------------------------------------------------------------
+    # Test the streaming unification generator
+    #--------------------------------------------------------------------------
+    def test_unify_iter(self):
+        class Afact(Predicate):
+            num1=IntegerField
+        class Bfact(Predicate):
+            str1=StringField
+
+        def gen_symbols(n):
+            for i in range(n):
+                yield Function("afact",[Number(i)])
+                yield Function("bfact",[String(str(i))])
+                yield Function("cfact",[Number(i)])
+
+        # Facts are generated in the order of the symbols
+        it = unify_iter([Afact,Bfact], gen_symbols(1000))
+        self.assertEqual(next(it), Afact(0))
+        self.assertEqual(next(it), Bfact("0"))
+        self.assertEqual(next(it), Afact(1))
+        self.assertEqual(len(list(it)), 1997)
+
+        spu = SymbolPredicateUnifier(predicates=[Afact,Bfact])
+        self.assertEqual(list(spu.unify_iter(gen_symbols(3), lazy=True)),
+                         [Afact(0),Bfact("0"),Afact(1),Bfact("1"),Afact(2),Bfact("2")])
+
+        # Per-predicate batches
+        batches = list(unify_iter(spu, gen_symbols(5), batch_size=2))
+        self.assertEqual(batches, [
+            (Afact, [Afact(0),Afact(1)]), (Bfact, [Bfact("0"),Bfact("1")]),
+            (Afact, [Afact(2),Afact(3)]), (Bfact, [Bfact("2"),Bfact("3")]),
+            (Afact, [Afact(4)]), (Bfact, [Bfact("4")])])
+
+        with self.assertRaises(ValueError) as ctx:
+            list(unify_iter(spu, gen_symbols(1), batch_size=0))
+        check_errmsg("Invalid batch size 0",ctx)
+
+    #--------------------------------------------------------------------------
+    # Test lazy unification where field values are decoded on first access
+    #--------------------------------------------------------------------------
+    def test_unify_lazy(self):
+        class CT(ComplexTerm):
+            a=IntegerField
+            b=ConstantField
+        class Afact(Predicate):
+            num1=IntegerField
+            str1=StringField
+            ct=CT.Field
+        class Bfact(Predicate):
+            num1=IntegerField
+            str1=SimpleField
+            ct=CT.Field
+        class DoubleField(IntegerField):
+            cltopy = lambda x: x*2
+            pytocl = lambda x: x//2
+        class Dfact(Predicate):
+            num1=IntegerField
+            v=DoubleField
+
+        af1=Afact(1,"a",CT(2,"c"))
+        bf1=Bfact(1,"a",CT(2,"c"))
+        bf2=Bfact(2,"b",CT(3,"d"))
+        df1=Dfact(1,4)
+        raws = [ af1.raw, bf2.raw, df1.raw,
+                 Function("afact",[Number(2),Number(2),CT(3,"d").raw]),
+                 Function("afact",[Number(2),String("b"),Function("ct",[])]) ]
+
+        # Unifying with the same predicate name picks the correct class
+        facts = unify([Afact,Bfact,Dfact], raws, ordered=True, lazy=True)
+        self.assertEqual(facts, [af1,bf2,df1])
+        self.assertEqual(facts, unify([Afact,Bfact,Dfact], raws, ordered=True))
+
+        # Fields are only decoded when accessed
+        f = Afact._from_raw_lazy(af1.raw)
+        self.assertEqual(hash(f), hash(af1))
+        self.assertEqual(f._field_values[1], f._field_values[0])
+        self.assertEqual(f.str1, "a")
+        self.assertEqual(f._field_values[1], "a")
+        self.assertEqual(f.ct, CT(2,"c"))
+        self.assertEqual(f.ct.b, "c")
+        self.assertEqual(list(f), [1,"a",CT(2,"c")])
+        self.assertEqual(f.clone(num1=3), Afact(3,"a",CT(2,"c")))
+        self.assertTrue(Bfact._from_raw_lazy(bf1.raw) < bf2)
+
+        # Fields without a structural check are decoded eagerly
+        f = Dfact._from_raw_lazy(df1.raw)
+        self.assertEqual(f._field_values[1], 4)
+        self.assertEqual(f.v, 4)
+
+        # Failures are raised at unification time
+        with self.assertRaises(ValueError) as ctx:
+            Afact._from_raw_lazy(raws[3])
+        check_errmsg("Failed to unify",ctx)
+
+        # Lazy unification through a SymbolPredicateUnifier
+        spu = SymbolPredicateUnifier(predicates=[Afact,Bfact,Dfact],
+                                     indexes=[Afact.num1])
+        fb = spu.unify(symbols=raws, lazy=True)
+        self.assertEqual(set(fb), set([af1,bf2,df1]))
+        self.assertEqual(list(fb.query(Afact).where(Afact.num1 == 1).all()), [af1])
+
+        # Lazy facts can be pickled and deep-copied before they are decoded
+        # (pickling requires module level classes)
+        pf = ParallelAfact(1,"a",ParallelCT(2,"c"))
+        for copier in [lambda f: pickle.loads(pickle.dumps(f)), copy.deepcopy]:
+            f = copier(ParallelAfact._from_raw_lazy(pf.raw))
+            self.assertEqual(f.ct, ParallelCT(2,"c"))
+            self.assertEqual(list(f), [1,"a",ParallelCT(2,"c")])
+            self.assertEqual(f, pf)
+
+    #--------------------------------------------------------------------------
+    # Test unifying with a memo of previously unified symbols
+    #--------------------------------------------------------------------------
+    def test_unify_memo(self):
+        class Afact(Predicate):
+            num1=IntegerField
+        af1=Afact(1)
+        af2=Afact(2)
+        raws = [af1.raw, Function("bfact",[Number(1)]), af2.raw]
+
+        spu = SymbolPredicateUnifier(predicates=[Afact])
+        memo = {}
+        fb = spu.unify(symbols=raws[:2], memo=memo)
+        self.assertEqual(fb, FactBase([af1]))
+        self.assertEqual(memo, {raws[0]: af1, raws[1]: None})
+        memo1 = memo[raws[0]]
+
+        # Previously unified facts are re-used
+        fb = spu.unify(symbols=raws, memo=memo)
+        self.assertEqual(fb, FactBase([af1,af2]))
+        self.assertEqual(len(memo), 3)
+        self.assertTrue(memo[raws[0]] is memo1)
+        self.assertTrue(next(iter(fb.query(Afact).where(Afact.num1 == 1).all()))
+                        is memo1)
 
 
     #--------------------------------------------------------------------------